@@ -1,88 +1,356 @@
-from classifier import Classifier
+import hashlib
+import math
+import numpy as np
+import pandas as pd
+from candidate_index import CandidateIndex
+from classifier import Classifier, SCORE_LABELS, normalize_tweets
+from stats import GroupedStats, describe_counts, exact_sums
+from summaries import (PAIRS_TITLE, FollowSummary, GroupStats, MentionSummary,
+                       SentimentSummary)
+from term_counts import TermCounts
+from trends import ALL, TIME_COLUMN, SentimentTrends, timestamps
 from itertools import permutations
 
+SUPER_TUESDAY_CANDIDATES = {"@BernieSanders":["Bernie", "Sanders"],
+                            "@ewarren":["Warren"],
+                            "@MikeBloomberg": ["Bloomberg"],
+                            "@JoeBiden":["Biden"]}
+SUPER_TUESDAY_COLUMNS = {"FollowsSanders":"Follows @BernieSanders",
+                         "FollowsWarren": "Follows @ewarren",
+                         "FollowsBloomberg": "Follows @MikeBloomberg",
+                         "FollowsBiden": "Follows @JoeBiden",
+                         "Tweet Text": "TweetText"}
+# Unique per tweet, so never worth storing as categoricals
+TEXT_COLUMNS = ["TweetText", "ProcessedTweet"]
+
+
+def historical_columns(update_flags):
+    '''
+    Column renames needed to bring a historical csv file in line with the
+    data pulled in real time.
+
+    Inputs:
+        update_flags: (list of str) identifier of historical data topic
+    Outputs:
+        (dict) of old column name to new column name
+    '''
+    columns = {}
+    if "Super Tuesday" in update_flags:
+        columns.update(SUPER_TUESDAY_COLUMNS)
+    if "8Ver" in update_flags:
+        columns["Tweet Text"] = "TweetText"
+    return columns
+
+
+def historical_params(search_params, update_flags):
+    '''
+    Search parameters of a historical csv file, with the candidates and
+    query TweetData.update_handler would set.
+
+    Inputs:
+        search_params: (dict) search parameters of historical data
+        update_flags: (list of str) identifier of historical data topic
+    Outputs:
+        (dict) search parameters
+    '''
+    params = dict(search_params)
+    if "Super Tuesday" in update_flags:
+        params["candidates"] = SUPER_TUESDAY_CANDIDATES.copy()
+    if "8Ver" in update_flags:
+        params["search_word"] = search_params["q"]
+    return params
+
+
+def compact_schema(data, keep_processed=True):
+    '''
+    Stores the columns of scored tweets in less memory without changing any
+    value: follow columns of True, False and None become categoricals (one
+    byte per row), and repetitive text such as user locations becomes
+    categorical too. The processed tweets are only needed for scoring and
+    can be dropped.
+
+    Inputs:
+        data: (pandas.DataFrame) scored tweets, changed in place
+        keep_processed: (bool) keep the ProcessedTweet column
+    Outputs:
+        (pandas.DataFrame) data
+    '''
+    if not keep_processed and "ProcessedTweet" in data.columns:
+        del data["ProcessedTweet"]
+    for col in data.columns:
+        if col in TEXT_COLUMNS or data[col].dtype.name == 'category' or \
+                not pd.api.types.is_string_dtype(data[col].dtype):
+            continue
+        kind = pd.api.types.infer_dtype(data[col], skipna=True)
+        if kind == "boolean":
+            data[col] = pd.Categorical(data[col], categories=[False, True])
+        elif kind == "string" and data[col].nunique() <= len(data) // 2:
+            data[col] = data[col].astype("category")
+    return data
+
+
+def exact_mean(scores):
+    '''
+    Correctly rounded mean of a column of scores, so that it does not depend
+    on the order the scores are summed in.
+
+    Inputs:
+        scores: (pandas.Series of float)
+    Outputs:
+        (float)
+    '''
+    return math.fsum(scores) / len(scores)
+
 
 class TweetData():
     '''
     Class representing dataset of tweets and search parameters.
     '''
 
-    def __init__(self, df, search_params, update_flags=None):
+    def __init__(self, df, search_params, update_flags=None, workers=None, cache=None,
+                 scored=False, keep_processed=True, terms=None, classifier=None):
         '''
         Inputs: 
             df: (pandas.DataFrame) of tweets
             search params: (dict) parameters of search from ui
             update flag: (list of str) identifier of historical data topic
+            workers: (int) processes to score with, see Classifier
+            cache: (cache.ScoreCache) previously scored tweets, see Classifier
+            scored: (bool) df is already scored and sorted by score, as
+                    loaded by dataset.load_tweets
+            keep_processed: (bool) keep the ProcessedTweet column, see
+                            compact_schema
+            terms: (term_counts.TermCounts) word counts of the processed
+                   tweets in df, or None to count them
+            classifier: (Classifier) to score df with, instead of one built
+                        from workers and cache; it is not kept, so neither is
+                        its cache
         '''
         self.query = search_params["search_word"]
-        self.data = Classifier(df).scored_df.sort_values(['Score'])
+        self.workers = workers
+        self.cache = cache
+        self.keep_processed = keep_processed
+        if scored:
+            self.data = df
+        else:
+            if classifier is None:
+                classifier = Classifier(None, workers=workers, cache=cache)
+            # A stable sort keeps tied tweets in the order they were pulled.
+            self.data = classifier.score_test_data(df).sort_values(['Score'],
+                                                                   kind='mergesort')
+        if terms is None:
+            terms = TermCounts()
+            if 'ProcessedTweet' in self.data.columns:
+                terms.update(self.data['ProcessedTweet'])
+            else:
+                terms.update(normalize_tweets(self.data['TweetText']))
+        self.terms = terms
+        compact_schema(self.data, keep_processed)
         if not hasattr(self, "candidates"):
             self.candidates = search_params["candidates"]
         self.geocode = search_params["geocode"]
         self.result_type = search_params["result_type"]
         self.big_summary = self.data["Score"].describe()
-
-    def calc_stats(self, handle, col_string):
+        self.index = CandidateIndex(self.data, self.candidates)
+        self.mean_score = exact_mean(self.data['Score'])
+        self.score_edges = pd.cut(self.data['Score'], bins=5, retbins=True)[1]
+        self.score_values, self.score_counts = np.unique(self.data['Score'].values,
+                                                         return_counts=True)
+        self.group_stats = None
+        self.sentiment_trends = None
+        self.dataset_fingerprint = None
+        # Id of the newest tweet pulled, for add_tweets()
+        self.since_id = None
+
+    def add_tweets(self, df, since_id=None):
         '''
-        Calculate basic descriptive statistics for any given subset of the data. 
-        These statistics include: a five-number summary, difference in mean
-        sentiment score between subset and whole dataset, three most positive tweets,
-        three most negative tweets, and three most neutral tweets.
+        Scores only the tweets in df and merges them into the data, as if the
+        TweetData had been built from all the tweets at once. The new tweets
+        are sorted on their own and interleaved with the sorted data, and the
+        summary and candidate bitsets are extended rather than recomputed.
 
         Inputs:
-            handle: (str or tuple) str of candidate handle of tuple of 
-                                  two candidate handles
-            col_string (str): either 'Follows ' or 'Mentions '
+            df: (pandas.DataFrame) of new tweets, with the columns of the
+                tweets the TweetData was built from, left unchanged
+            since_id: (int) id of the newest tweet in df
         Outputs:
-            (list) of all the aforementioned statistics
-        '''
-        mean_score = self.data['Score'].describe()['mean']
-   
-        if isinstance(handle, tuple):
-            cand1, cand2 = handle
-            filtered = self.data[(self.data['Follows ' + cand1] == True) &
-                                 (self.data['Mentions ' + cand2] == True)]
+            (int) number of tweets added
+        '''
+        if since_id is not None:
+            self.since_id = since_id
+        if df.empty:
+            return 0
+        n = len(self.data)
+        # New tweets are labelled after the ones there, whatever df's index
+        start = n
+        if n and pd.api.types.is_integer_dtype(self.data.index):
+            start = max(n, int(self.data.index.max()) + 1)
+        df = df.copy(deep=False)
+        df.index = pd.RangeIndex(start, start + len(df))
+        classifier = Classifier(df, workers=self.workers, cache=self.cache)
+        new = classifier.scored_df.sort_values(['Score'], kind='mergesort')
+        self.terms.update(new['ProcessedTweet'])
+
+        # Tied tweets go after the ones already there, as a stable sort would
+        # put them.
+        old_scores = self.data['Score'].values
+        new_scores = new['Score'].values
+        positions = np.searchsorted(old_scores, new_scores, side='right') + \
+            np.arange(len(new))
+        order = np.empty(n + len(new), dtype=np.int64)
+        is_new = np.zeros(len(order), dtype=bool)
+        is_new[positions] = True
+        order[positions] = n + np.arange(len(new))
+        order[~is_new] = np.arange(n)
+        compact_schema(new, self.keep_processed)
+        self.data = pd.concat([self.data, new], sort=False).iloc[order]
+        # Categoricals with different categories concatenate to object columns
+        compact_schema(self.data)
+
+        # Bins only move when the score range does.
+        if new_scores[0] >= old_scores[0] and new_scores[-1] <= old_scores[-1]:
+            bins = pd.cut(self.data['Score'].values[is_new], bins=self.score_edges,
+                          labels=SCORE_LABELS)
+            self.data['Score_bins'] = self.data['Score_bins'].cat.set_categories(
+                bins.categories)
+            self.data.loc[is_new, 'Score_bins'] = bins
         else:
-            filtered = self.data[self.data[col_string + handle] == True]
-        if len(filtered) < 5:
-            return None
+            self.data['Score_bins'], self.score_edges = pd.cut(
+                self.data['Score'], bins=5, labels=SCORE_LABELS, retbins=True)
+            # Every tweet may have changed bin
+            self.sentiment_trends = None
+
+        self.index.extend(new, self.data, order)
+        if "Mention or Tag any Candidate" in self.data.columns:
+            self.data["Mention or Tag any Candidate"] = self.index.mask(self.index.mention_any)
+        for handle in self.index.candidates:
+            if "Tags " + handle in self.data.columns:
+                self.data["Tags " + handle] = self.index.mask(self.index.tags[handle])
+                self.data["Mentions " + handle] = self.index.mask(self.index.mentions[handle])
+        if self.sentiment_trends is not None:
+            self.add_trends(is_new)
+
+        values, counts = np.unique(new_scores, return_counts=True)
+        merged = np.union1d(self.score_values, values)
+        merged_counts = np.zeros(len(merged), dtype=np.int64)
+        merged_counts[np.searchsorted(merged, self.score_values)] += self.score_counts
+        merged_counts[np.searchsorted(merged, values)] += counts
+        self.score_values, self.score_counts = merged, merged_counts
+        total = exact_sums(merged, merged_counts[:, None])[0]
+        self.mean_score = float(total) / len(self.data)
+        self.big_summary = describe_counts(merged, merged_counts, self.mean_score)
+        self.group_stats = None
+        self.dataset_fingerprint = None
+        return len(new)
+
+    def fingerprint(self):
+        '''
+        Hash of the search terms, candidates and scored tweets, identifying
+        this dataset in caches.
 
-        filtered_summary = filtered['Score'].describe().to_string()
-        mean = filtered['Score'].describe()['mean']
-        mean_diff = str(mean_score - mean)
-        tweet_pos, tweet_neg, tweet_med = self.find_pos_neg_medium_tweets(filtered)
+        Outputs:
+            (str) hex digest
+        '''
+        if self.dataset_fingerprint is None:
+            digest = hashlib.sha1(repr((self.query, sorted(self.candidates.items())))
+                                  .encode('utf-8'))
+            rows = pd.util.hash_pandas_object(self.data[['TweetText', 'Score']],
+                                              index=False)
+            digest.update(rows.values.tobytes())
+            self.dataset_fingerprint = digest.hexdigest()
+        return self.dataset_fingerprint
+
+    def memory_report(self):
+        '''
+        Memory taken by each column of data, its index and the candidate
+        bitsets.
 
-        return [filtered_summary, mean_diff, tweet_pos, tweet_neg, tweet_med]
+        Outputs:
+            (pandas.Series) of bytes, largest first, followed by the total
+        '''
+        usage = self.data.memory_usage(deep=True)
+        usage["Candidate bitsets"] = self.index.nbytes()
+        usage = usage.sort_values(ascending=False)
+        usage["Total"] = usage.sum()
+        return usage
 
-    def find_pos_neg_medium_tweets(self, df):
+    def grouped_stats(self):
         '''
-        Finds the most positive, negative, and netural tweets in the data.
+        Statistics for every follower, mention and follower/mention group of
+        candidates, computed together the first time any of them is needed.
+
+        Outputs:
+            (stats.GroupedStats) keyed by ('Follows ', handle),
+            ('Mentions ', handle) and (follower_of, mentioned)
+        '''
+        if self.group_stats is None:
+            groups = {}
+            for handle in self.candidates:
+                if 'Follows ' + handle in self.index.follows:
+                    groups[('Follows ', handle)] = self.index.follows['Follows ' + handle]
+                groups[('Mentions ', handle)] = self.index.mentions[handle]
+            for cand1, cand2 in permutations(self.candidates.keys(), 2):
+                if 'Follows ' + cand1 in self.index.follows:
+                    groups[(cand1, cand2)] = self.index.follows_and_mentions(cand1, cand2)
+            self.group_stats = GroupedStats(self.data['Score'].values,
+                                            self.data['TweetText'].values, groups)
+        return self.group_stats
+
+    def trends(self):
+        '''
+        Sentiment per minute, hour and day of all tweets and of the tweets
+        mentioning each candidate, aggregated the first time it is needed
+        and then kept up to date by add_tweets().
 
-        Inputs:
-            df (pandas.DataFrame)
         Outputs:
-            (str) 3 correctly formatted strings of tweets to be displayed by ui
+            (trends.SentimentTrends) or None if the tweets have no times
+        '''
+        if TIME_COLUMN not in self.data.columns:
+            return None
+        if self.sentiment_trends is None:
+            handles = [h for h in self.candidates if h in self.index.mentions]
+            self.sentiment_trends = SentimentTrends([ALL] + handles, SCORE_LABELS)
+            self.add_trends(np.ones(len(self.data), dtype=bool))
+        return self.sentiment_trends
+
+    def add_trends(self, rows):
+        '''
+        Aggregates the tweets at the positions of rows into the trends.
+
+        Inputs:
+            rows: (numpy.ndarray of bool) over the rows of data
         '''
-        med = df['Score'].median()
-        pos_tweets = df.tail(3)['TweetText']
-        neg_tweets = df.head(3)['TweetText']
-        med_tweets = df[df['Score'] == med].head(3)['TweetText']
-        return self.format_strings(pos_tweets), self.format_strings(neg_tweets), self.format_strings(med_tweets)
+        trends = self.sentiment_trends
+        masks = {handle: self.index.mask(self.index.mentions[handle])[rows]
+                 for handle in trends.groups[1:]}
+        trends.add(timestamps(self.data[TIME_COLUMN][rows]),
+                   self.data['Score'].values[rows],
+                   self.data['Score_bins'].cat.codes.values[rows], masks)
 
-    def format_strings(self, tweet_series):
+    def calc_stats(self, handle, col_string):
         '''
-        Formats strings of 3 most positive, negative, and neutral tweets appropriately. Used as 
-        a helper function to find_pos_neg_medium_tweets().
+        Calculate basic descriptive statistics for any given subset of the data. 
+        These statistics include: a five-number summary, difference in mean
+        sentiment score between subset and whole dataset, three most positive tweets,
+        three most negative tweets, and three most neutral tweets.
 
         Inputs:
-            tweet_series: (pandas.Series) series of tweets
+            handle: (str or tuple) str of candidate handle of tuple of 
+                                  two candidate handles
+            col_string (str): either 'Follows ' or 'Mentions '
         Outputs:
-            (str) of number and tweet text
+            (summaries.GroupStats) of all the aforementioned statistics, or
+            None if fewer than 5 tweets are in the subset
         '''
-        rv = ''
-        for i, text in enumerate(tweet_series):
-            rv += 'Tweet {}: {} \n'.format(i+1, text)
-        return rv
+        key = handle if isinstance(handle, tuple) else (col_string, handle)
+        group_stats = self.grouped_stats()
+        if group_stats.sizes[key] < 5:
+            return None
+
+        summary, mean, tweet_pos, tweet_neg, tweet_med = group_stats.stats(key)
+        handles = handle if isinstance(handle, tuple) else (handle,)
+        return GroupStats(handles, summary, self.mean_score - mean, tweet_pos, tweet_neg,
+                          tweet_med)
 
     def summarize_sentiment(self, col_string):
         '''
@@ -91,129 +359,56 @@ class TweetData():
         Inputs:
             col_string: (str) either 'Follows ' or 'Mentions '
         Outputs:
-            (str) of summary to be displayed by ui
-        '''
-        handle_list = self.candidates.keys()
-        rv = ''
-        init_length = len(rv)
-        for handle in handle_list:
-            stats = self.calc_stats(handle, col_string)
-            if stats:
-                rv += """Summary of tweets from followers of {}.
-                         {}
-                         Average tweet is {} more positive than the average tweet pulled.
-
-                         3 most positive tweets:
-                         {}
-
-                         3 most negative tweets:
-                         {}
-
-                         3 neutral tweets:
-                         {}\n""".format(handle, stats[0], stats[1], stats[2], stats[3], stats[4])
-        if len(rv) == init_length:
-            rv += "Whoops! Fewer than 5 tweets meet these criteria."
-        return rv
+            (summaries.SentimentSummary) to be displayed by ui
+        '''
+        groups = [self.calc_stats(handle, col_string) for handle in self.candidates]
+        return SentimentSummary([group for group in groups if group])
 
     def summarize_sentiment_by_followers_and_mentions(self):
         '''
         Summarizes sentiment for every permutation of two candidates.
 
         Outputs:
-            (str) of summary to be displayed by ui
-        '''
-        handle_list = list(permutations(self.candidates.keys(), 2))
-        rv = 'Summary of tweet sentiment by followers and mentions:\n'
-        init_length = len(rv)
-        for (cand1, cand2) in handle_list:
-            stats = self.calc_stats((cand1, cand2), '')
-            if stats:
-                rv += """Summary of tweets from followers of {} and mentioning {}.
-                         {}
-                         Average tweet is {} more positive than the average tweet pulled.
-
-                         3 most positive tweets:
-                         {}
-
-                         3 most negative tweets:
-                         {}
-
-                         3 neutral tweets:
-                         {}\n""".format(cand1, cand2, stats[0], stats[1], stats[2], stats[3], stats[4])
-        if len(rv) == init_length:
-            rv += "Whoops! Fewer than 5 tweets meet these criteria."
-        return rv
+            (summaries.SentimentSummary) to be displayed by ui
+        '''
+        groups = [self.calc_stats(pair, '')
+                  for pair in permutations(self.candidates.keys(), 2)]
+        return SentimentSummary([group for group in groups if group], PAIRS_TITLE)
 
     def summarize_follow_data(self):
         '''
         Summarizes data on user follow behavior within dataset of tweets pulled.
 
         Outputs:
-            (str) of summary to be displayed by ui
-        '''
-        rv = ""
-        follower_column = None
-        for c in range(self.data.shape[1]):
-            if self.data.columns[c][0:7] == "Follows":
-                follower_column = c
-                break
-        tweets_wf = self.data[self.data.iloc[:, c].isna() == False]
-        rv += "Of the {} tweets {} have data on who user \
-                is following\n".format(self.data.shape[0], tweets_wf.shape[0])
-        while c < self.data.shape[1] and  self.data.columns[c][0:7] == "Follows":
-            rv += "Of those {} tweets,\
-                   {} follow {}\n".format(tweets_wf.shape[0], 
-                                          tweets_wf.iloc[:, c].sum(), 
-                                          self.data.columns[c][7:])
-            c += 1
-        return rv
+            (summaries.FollowSummary) to be displayed by ui
+        '''
+        n_known = self.index.count(self.index.follows_known)
+        follows = [(col[7:], self.index.count(self.index.follows_known &
+                                              self.index.follows[col]))
+                   for col in self.index.follow_columns]
+        return FollowSummary(self.data.shape[0], n_known, follows)
 
     def summarize_tweets_ab_candidates(self, other_candidates={}):
         '''
         Summarizes tag and mention behavior of tweets in the dataset.
 
         Outputs:
-            (str) of summary to be displayed by ui
+            (summaries.MentionSummary) to be displayed by ui
         '''
-        rv = ""
         candidate_dict = self.candidates.copy()
         candidate_dict.update(other_candidates)
 
-        candidate_names = []
-        [candidate_names.extend(name+[k]) for k, name in self.candidates.items()]
-
-        self.data["Mention or Tag any Candidate"] = None
-
-        for c_n in candidate_names:
-            self.data.loc[self.data["TweetText"].str.contains(c_n),
-                          "Mention or Tag any Candidate"] = True
-
-        count_that_mention = self.data["Mention or Tag any Candidate"].sum()
-        rv += "Of the {} tweets gathered, {} ({} %) tag one of the candidates \
-               or mention them by an \
-               alias \n".format(self.data.shape[0],
-                                count_that_mention,
-                                (count_that_mention/self.data.shape[0])*100)
-
-
-        for handle, aliases in candidate_dict.items():
-
-            self.data["Tags " + handle] = self.data["TweetText"].str.contains(handle)
+        self.index.add_candidates(other_candidates)
+        self.data["Mention or Tag any Candidate"] = self.index.mask(self.index.mention_any)
 
-            self.data["Mentions " + handle] = False
-            for a in [handle] + aliases:
-                self.data.loc[self.data["TweetText"].str.contains(a),
-                              "Mentions " + handle] = True
-            
+        mentions = []
+        for handle in candidate_dict:
+            self.data["Tags " + handle] = self.index.mask(self.index.tags[handle])
+            self.data["Mentions " + handle] = self.index.mask(self.index.mentions[handle])
+            mentions.append((handle, self.index.count(self.index.mentions[handle])))
+        return MentionSummary(self.data.shape[0], self.index.count(self.index.mention_any),
+                              mentions)
 
-            rv += "Of the {} tweets that mention any candidate, \
-                  {} ({} %) mention {} \
-                  \n".format(self.data["Mention or Tag any Candidate"].sum(),
-                             self.data["Mentions " + handle].sum(),
-                             (self.data["Mentions " + handle].sum()/count_that_mention)*100,
-                             handle)
-        return rv
-    
     def update_handler(self, df, update_flags, search_params):
         '''
         In the case of using historical data (housed in csv files), makes the necessary
@@ -226,18 +421,10 @@ class TweetData():
             search_params: (dict) search parameters of historical data
         '''
         if "Super Tuesday" in update_flags:
-            self.candidates = {"@BernieSanders":["Bernie", "Sanders"],
-                               "@ewarren":["Warren"],
-                               "@MikeBloomberg": ["Bloomberg"],
-                               "@JoeBiden":["Biden"]}
-            df.rename(columns={"FollowsSanders":"Follows @BernieSanders",
-                               "FollowsWarren": "Follows @ewarren",
-                               "FollowsBloomberg": "Follows @MikeBloomberg",
-                               "FollowsBiden": "Follows @JoeBiden",
-                               "Tweet Text": "TweetText"}, inplace=True)
+            self.candidates = SUPER_TUESDAY_CANDIDATES.copy()
         if "8Ver" in update_flags:
-            df.rename(columns={"Tweet Text": "TweetText"}, inplace=True)
             self.query = search_params["q"]
+        df.rename(columns=historical_columns(update_flags), inplace=True)
 
     def __repr__(self):
         '''
@@ -0,0 +1,285 @@
+'''
+Sentiment models the Classifier can score processed tweets with. Every
+backend scores a whole batch at once with score_batch(texts), returning
+compound style scores in [-1, 1] rounded to 4 decimal places, so the
+summaries, bins and caches work the same whichever one is used:
+
+    vader         VADER through fast_vader.FastVader (the default)
+    vader-cached  VADER, remembering the score of each processed tweet seen
+                  in this process, for replays and retweet-heavy searches
+    ngram         logistic regression over hashed word unigrams and bigrams,
+                  trained on a labeled csv file
+
+The backend is chosen with the SENTIMENT_BACKEND environment variable, and
+the ngram model file with SENTIMENT_MODEL. To train a model:
+
+    python backends.py labeled.csv --text-column text --label-column label
+'''
+import argparse
+import os
+import threading
+import zlib
+import numpy as np
+import pandas as pd
+import resources
+from cache import classifier_version, preprocessing_digest
+
+DEFAULT_BACKEND = 'vader'
+DEFAULT_MODEL_PATH = 'ngram_model.npz'
+DEFAULT_MAX_CACHED = 2 ** 20
+DEFAULT_FEATURES = 2 ** 18
+
+
+class Backend():
+    '''
+    Scores batches of processed tweets.
+    '''
+    name = None
+
+    def score_batch(self, texts):
+        '''
+        Inputs:
+            texts: (list of str) processed tweets
+        Outputs:
+            (numpy.ndarray of float) score of each tweet
+        '''
+        raise NotImplementedError
+
+    def version(self, stop_words):
+        '''
+        Outputs:
+            (str) fingerprint of the preprocessing and the model, for
+            cache.ScoreCache keys
+        '''
+        raise NotImplementedError
+
+    def options(self):
+        '''
+        Outputs:
+            (dict) keyword arguments that make() rebuilds this backend from,
+            e.g. in a worker process
+        '''
+        return {}
+
+
+class VaderBackend(Backend):
+    name = 'vader'
+
+    def __init__(self):
+        self.fast = resources.fast_vader()
+
+    def score_batch(self, texts):
+        return self.fast.polarity_compound(texts)
+
+    def version(self, stop_words):
+        return classifier_version(self.fast.analyzer, stop_words)
+
+
+class CachedVaderBackend(VaderBackend):
+    '''
+    VADER scores of processed tweets remembered in memory. Once max_entries
+    tweets are remembered the memory is cleared and starts over.
+    '''
+    name = 'vader-cached'
+
+    def __init__(self, max_entries=DEFAULT_MAX_CACHED):
+        super().__init__()
+        self.max_entries = max_entries
+        self.scores = {}
+        self.lock = threading.Lock()
+
+    def score_batch(self, texts):
+        distinct = list(dict.fromkeys(texts))
+        with self.lock:
+            found = {text: self.scores[text] for text in distinct if text in self.scores}
+        missing = [text for text in distinct if text not in found]
+        if missing:
+            scored = dict(zip(missing, super().score_batch(missing).tolist()))
+            found.update(scored)
+            with self.lock:
+                if len(self.scores) + len(scored) > self.max_entries:
+                    self.scores = {}
+                self.scores.update(scored)
+        return np.array([found[text] for text in texts], dtype=float)
+
+    def options(self):
+        return {'max_entries': self.max_entries}
+
+
+def hash_features(texts, n_features, ngrams=2):
+    '''
+    Hashed n-gram counts of a batch of processed tweets, scaled so each
+    tweet's features have unit length.
+
+    Inputs:
+        texts: (list of str) processed tweets
+        n_features: (int) hash buckets
+        ngrams: (int) longest n-gram
+    Outputs:
+        (tuple) of numpy arrays of row, feature and value of every n-gram
+    '''
+    rows, grams = [], []
+    for i, text in enumerate(texts):
+        words = text.split()
+        for n in range(1, ngrams + 1):
+            for j in range(len(words) - n + 1):
+                rows.append(i)
+                grams.append(' '.join(words[j:j + n]))
+    rows = np.array(rows, dtype=np.int64)
+    if not grams:
+        return rows, np.zeros(0, dtype=np.int64), np.zeros(0)
+    # Hashed once per distinct n-gram; crc32 is the same in every process.
+    codes, uniques = pd.factorize(pd.Series(grams, dtype=object))
+    buckets = np.array([zlib.crc32(gram.encode('utf-8')) for gram in uniques],
+                       dtype=np.int64) % n_features
+    lengths = np.bincount(rows, minlength=len(texts))
+    return rows, buckets[codes], 1 / np.sqrt(lengths[rows])
+
+
+class NgramBackend(Backend):
+    '''
+    Logistic regression over hashed n-grams. The probability p of a tweet
+    being positive is reported as the score 2p - 1.
+    '''
+    name = 'ngram'
+
+    def __init__(self, path=DEFAULT_MODEL_PATH, weights=None, bias=0.0, ngrams=2):
+        '''
+        Inputs:
+            path: (str) .npz file written by save(), read unless weights are
+                  given
+            weights: (numpy.ndarray of float) one per hash bucket
+            bias: (float)
+            ngrams: (int) longest n-gram
+        '''
+        self.path = path
+        if weights is None:
+            if not os.path.exists(path):
+                raise FileNotFoundError("No ngram model at {}; train one with "
+                                        "python backends.py".format(path))
+            model = np.load(path)
+            weights, bias, ngrams = model['weights'], float(model['bias']), int(model['ngrams'])
+        self.weights = weights
+        self.bias = bias
+        self.ngrams = ngrams
+
+    def decision(self, texts):
+        rows, features, values = hash_features(texts, len(self.weights), self.ngrams)
+        return np.bincount(rows, weights=self.weights[features] * values,
+                           minlength=len(texts)) + self.bias
+
+    def score_batch(self, texts):
+        if not texts:
+            return np.zeros(0)
+        probability = 1 / (1 + np.exp(-self.decision(texts)))
+        return np.round(2 * probability - 1, 4)
+
+    def version(self, stop_words):
+        digest = preprocessing_digest(stop_words)
+        digest.update('ngram {} {!r}'.format(self.ngrams, self.bias).encode('utf-8'))
+        digest.update(np.ascontiguousarray(self.weights).tobytes())
+        return digest.hexdigest()
+
+    def options(self):
+        # The weights themselves, since a model trained in this process has
+        # no file, or one that save() may since have overwritten
+        return {'path': self.path, 'weights': self.weights, 'bias': self.bias,
+                'ngrams': self.ngrams}
+
+    def save(self, path):
+        np.savez(path, weights=self.weights, bias=self.bias, ngrams=self.ngrams)
+
+    @classmethod
+    def train(cls, texts, positive, n_features=DEFAULT_FEATURES, ngrams=2, epochs=30,
+              learning_rate=0.5, l2=1e-6):
+        '''
+        Fits the model with full batch AdaGrad on the log loss.
+
+        Inputs:
+            texts: (list of str) processed tweets
+            positive: (numpy.ndarray of bool) whether each tweet is positive
+            n_features: (int) hash buckets
+            ngrams: (int) longest n-gram
+            epochs: (int) passes over the tweets
+            learning_rate: (float)
+            l2: (float) weight decay
+        Outputs:
+            NgramBackend
+        '''
+        rows, features, values = hash_features(texts, n_features, ngrams)
+        target = np.asarray(positive, dtype=float)
+        weights, bias = np.zeros(n_features), 0.0
+        squared, bias_squared = np.full(n_features, 1e-8), 1e-8
+        for _ in range(epochs):
+            decision = np.bincount(rows, weights=weights[features] * values,
+                                   minlength=len(texts)) + bias
+            error = 1 / (1 + np.exp(-decision)) - target
+            gradient = np.bincount(features, weights=error[rows] * values,
+                                   minlength=n_features) / len(texts) + l2 * weights
+            squared += gradient ** 2
+            weights -= learning_rate * gradient / np.sqrt(squared)
+            bias_gradient = error.mean()
+            bias_squared += bias_gradient ** 2
+            bias -= learning_rate * bias_gradient / np.sqrt(bias_squared)
+        return cls(weights=weights, bias=bias, ngrams=ngrams)
+
+
+BACKENDS = {backend.name: backend for backend in
+            [VaderBackend, CachedVaderBackend, NgramBackend]}
+
+
+def make(name, **options):
+    '''
+    Inputs:
+        name: (str) key of BACKENDS
+        options: keyword arguments of the backend
+    Outputs:
+        Backend
+    '''
+    if name not in BACKENDS:
+        raise ValueError("Unknown sentiment backend {!r}, expected one of {}".format(
+            name, ', '.join(BACKENDS)))
+    return BACKENDS[name](**options)
+
+
+def configured():
+    '''
+    Outputs:
+        Backend named by SENTIMENT_BACKEND, shared by the classifiers of this
+        process
+    '''
+    name = os.environ.get('SENTIMENT_BACKEND', DEFAULT_BACKEND)
+    options = {'path': os.environ.get('SENTIMENT_MODEL', DEFAULT_MODEL_PATH)} \
+        if name == NgramBackend.name else {}
+    return resources.load('backend ' + name, lambda: make(name, **options))
+
+
+def positive_labels(labels):
+    '''
+    Reads a label column as positive or not: numbers above the middle of
+    their range (0/1, 0/4, -1/1 and so on), or text starting with "pos".
+    '''
+    if pd.api.types.is_numeric_dtype(labels):
+        return (labels > (labels.min() + labels.max()) / 2).values
+    return labels.astype(str).str.lower().str.startswith('pos').values
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('csv_path', help='labeled tweets')
+    parser.add_argument('--text-column', default='TweetText')
+    parser.add_argument('--label-column', default='label')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH, help='file to write')
+    parser.add_argument('--features', type=int, default=DEFAULT_FEATURES)
+    parser.add_argument('--epochs', type=int, default=30)
+    args = parser.parse_args()
+    from classifier import normalize_tweets
+    labeled = pd.read_csv(args.csv_path).dropna(subset=[args.text_column, args.label_column])
+    processed = normalize_tweets(labeled[args.text_column].astype(str)).tolist()
+    positive = positive_labels(labeled[args.label_column])
+    model = NgramBackend.train(processed, positive, args.features, epochs=args.epochs)
+    model.save(args.model)
+    accuracy = ((model.score_batch(processed) > 0) == positive).mean()
+    print("Trained on {} tweets ({:.1%} positive), training accuracy {:.1%}, saved to {}"
+          .format(len(processed), positive.mean(), accuracy, args.model))
@@ -0,0 +1,312 @@
+'''
+Analysis of many searches and historical datasets at once, for reports
+comparing queries, places or candidates. The searches are pulled in
+parallel, every distinct tweet across them is scored once, and each result
+set is summarized and compared with the others in one table.
+
+Usage:
+    python batch.py specs.json --json report.json --csv comparison.csv
+
+where specs.json is a list of searches such as
+    [{"label": "NY", "search_word": "primary",
+      "loc": {"city": "New York", "state": "NY", "radius": 50},
+      "candidates": {"@JoeBiden": ["Biden"]}},
+     {"historical": "CA_Super_Tuesday"}]
+'''
+import argparse
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+import pandas as pd
+from analyze import TweetData
+from classifier import Classifier
+from search import search_frame
+from summaries import summary_sections
+
+DEFAULT_WORKERS = 4
+LOCATION_KEYS = ("city", "state", "radius")
+# Compound scores VADER counts as positive or negative
+POSITIVE_THRESHOLD = 0.05
+NEGATIVE_THRESHOLD = -0.05
+
+
+class SharedScores():
+    '''
+    In-memory stand-in for cache.ScoreCache holding the scores of one
+    batch, so every TweetData of the batch reads its scores instead of
+    scoring tweets that another search already pulled.
+    '''
+
+    def __init__(self):
+        self.scores = {}
+
+    def get_many(self, tweets, version):
+        return {tweet: self.scores[tweet] for tweet in set(tweets) if tweet in self.scores}
+
+    def put_many(self, entries, version):
+        for tweet, processed, score in entries:
+            self.scores[tweet] = (processed, score)
+
+    def __len__(self):
+        return len(self.scores)
+
+
+def load_historical(name):
+    '''
+    Outputs:
+        TweetData object of a historical dataset, read already scored if it
+        was converted with dataset.py
+    '''
+    path = name + ".parquet"
+    if os.path.exists(path):
+        # pyarrow is only imported when a converted file is read
+        import dataset
+        return dataset.load_tweets(path)
+    # Only needed for historical specs, so batches of searches run without it
+    import csv_to_tweets
+    return csv_to_tweets.go(name)
+
+
+def spec_label(spec):
+    '''
+    Name of a spec in reports: its label, else the historical dataset or
+    the search word and place.
+    '''
+    if spec.get("label"):
+        return spec["label"]
+    if "historical" in spec:
+        return spec["historical"]
+    loc = spec.get("loc") or {}
+    return ' '.join(str(part) for part in [spec["search_word"], loc.get("city"),
+                                           loc.get("state")] if part)
+
+
+def spec_error(spec):
+    '''
+    Checks a spec before anything runs.
+
+    Outputs:
+        (str) what is wrong with the spec, or None if it can run
+    '''
+    if not isinstance(spec, dict) or ("historical" in spec) == ("search_word" in spec):
+        return "a spec needs either search_word or historical"
+    if "historical" in spec:
+        return None if isinstance(spec["historical"], str) else "historical must be a name"
+    loc = spec.get("loc") or {}
+    if not isinstance(loc, dict) or (loc and not all(loc.get(k) for k in LOCATION_KEYS)):
+        return "loc needs city, state and radius, or can be left out"
+    if not isinstance(spec.get("candidates") or {}, dict):
+        return "candidates must map handles to lists of aliases"
+    return None
+
+
+def spec_key(spec):
+    '''
+    Identifies specs that pull the same tweets, whatever their label.
+    '''
+    return json.dumps({k: v for k, v in spec.items() if k != "label"}, sort_keys=True)
+
+
+def fetch(spec):
+    '''
+    Outputs:
+        TweetData object of a historical spec, (pandas.DataFrame, search
+        params, since_id) of unscored tweets for a search, or None if the
+        search location is unknown
+    '''
+    if "historical" in spec:
+        return load_historical(spec["historical"])
+    return search_frame(spec["search_word"], spec.get("loc") or {}, result_type="recent",
+                        candidates=spec.get("candidates") or None)
+
+
+def guarded(func):
+    '''
+    Wraps func so an exception is returned, and logged, instead of raised,
+    so one spec that fails does not stop the others.
+    '''
+    def call(*args):
+        try:
+            return func(*args)
+        except Exception as error:
+            logging.getLogger(__name__).exception("Batch spec failed")
+            return error
+    return call
+
+
+def error_message(error):
+    return "{}: {}".format(type(error).__name__, error)
+
+
+def comparison_row(tweets):
+    '''
+    One row of the comparison table.
+
+    Inputs:
+        tweets: TweetData object, already summarized
+    Outputs:
+        (dict) of column to value
+    '''
+    n = len(tweets.data)
+    values, counts = tweets.score_values, tweets.score_counts
+    row = {'tweets': n, 'mean_score': tweets.mean_score,
+           'median_score': float(tweets.big_summary['50%']),
+           'positive': counts[values > POSITIVE_THRESHOLD].sum() / n,
+           'neutral': counts[(values >= NEGATIVE_THRESHOLD) &
+                             (values <= POSITIVE_THRESHOLD)].sum() / n,
+           'negative': counts[values < NEGATIVE_THRESHOLD].sum() / n,
+           'mention_any': tweets.index.count(tweets.index.mention_any) / n}
+    group_stats = tweets.grouped_stats()
+    for handle in tweets.candidates:
+        key = ('Mentions ', handle)
+        if key in group_stats.sizes:
+            row['mentions ' + handle] = group_stats.sizes[key]
+            row['mean_score ' + handle] = group_stats.means[key]
+    return row
+
+
+class BatchResult():
+    '''
+    TweetData objects, summaries and comparison table of a batch, in the
+    order of its specs.
+    '''
+
+    def __init__(self, specs, labels, tweets, summaries, n_pulled, n_scored,
+                 errors=None):
+        '''
+        Inputs:
+            specs: (list of dict)
+            labels: (list of str) spec_label of each spec
+            tweets: (list) TweetData object of each spec, None if it found
+                    nothing
+            summaries: (list) dict of section name to summaries.Summary for
+                       each spec, None if it found nothing
+            n_pulled: (int) tweets pulled by the searches
+            n_scored: (int) distinct tweets among them, each scored once
+            errors: (list) message of the error each spec failed with, None
+                    for the specs that ran
+        '''
+        self.specs = specs
+        self.labels = labels
+        self.tweets = tweets
+        self.summaries = summaries
+        self.n_pulled = n_pulled
+        self.n_scored = n_scored
+        self.errors = errors or [None] * len(specs)
+        rows = {label: comparison_row(t) for label, t in zip(labels, tweets)
+                if t is not None}
+        self.comparison = pd.DataFrame.from_dict(rows, orient='index')
+
+    def to_json(self, result_ids=None):
+        '''
+        Inputs:
+            result_ids: (list of str) id each TweetData was stored under, or
+                        None
+        Outputs:
+            (dict) ready for json.dumps
+        '''
+        results = []
+        for i, (spec, label, summary, error) in enumerate(zip(
+                self.specs, self.labels, self.summaries, self.errors)):
+            entry = {'label': label, 'spec': spec,
+                     'sections': {name: str(section) for name, section in summary.items()}
+                     if summary is not None else None,
+                     'error': error}
+            if result_ids is not None:
+                entry['result_id'] = result_ids[i]
+            results.append(entry)
+        comparison = self.comparison.astype(object).where(self.comparison.notna(), None)
+        return {'results': results, 'tweets_pulled': self.n_pulled,
+                'tweets_scored': self.n_scored,
+                'comparison': comparison.to_dict(orient='index')}
+
+
+def run_batch(specs, workers=DEFAULT_WORKERS, score_workers=None, cache=None):
+    '''
+    Analyzes every spec: pulls the searches in parallel, scores the distinct
+    tweets of all of them together, then builds and summarizes a TweetData
+    for each spec in parallel. Specs pulling the same tweets run once. A
+    spec that fails gets no results and its error, the others still run.
+
+    Inputs:
+        specs: (list of dict) exec.search_spec() style specs, with
+               'search_word', 'loc' and 'candidates', or 'historical'; an
+               optional 'label' names a spec in the comparison table
+        workers: (int) specs pulled and summarized at a time
+        score_workers: (int) processes to score with, see Classifier
+        cache: (cache.ScoreCache) previously scored tweets, or None for the
+               one SCORE_CACHE names, see Classifier
+    Outputs:
+        BatchResult object
+    '''
+    labels = [spec_label(spec) for spec in specs]
+    keys = [spec_key(spec) for spec in specs]
+    unique = list(dict.fromkeys(keys))
+    spec_of = dict(zip(keys, specs))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        fetched = dict(zip(unique, pool.map(guarded(lambda key: fetch(spec_of[key])),
+                                            unique)))
+
+        frames = [found[0] for found in fetched.values() if isinstance(found, tuple)]
+        texts = pd.Series(pd.unique(pd.concat([f['TweetText'] for f in frames],
+                                              ignore_index=True)), dtype=object) \
+            if frames else pd.Series([], dtype=object)
+        shared = SharedScores()
+        classifier = Classifier(None, workers=score_workers, cache=cache)
+        if len(texts):
+            # classifier.cache is the SCORE_CACHE one when cache is None
+            if classifier.cache is not None:
+                processed, scores = classifier.score_cached(texts)
+            else:
+                processed, scores = classifier.score_tweets(texts)
+            shared.put_many(zip(texts, processed, scores), None)
+
+        def analyze(key):
+            found = fetched[key]
+            if found is None or isinstance(found, Exception):
+                return None, None
+            if isinstance(found, tuple):
+                df, search_params, since_id = found
+                # Scored through the shared scores, which the TweetData
+                # does not keep
+                tweets = TweetData(df, search_params, classifier=Classifier(
+                    None, cache=shared, backend=classifier.backend))
+                tweets.since_id = since_id
+            else:
+                tweets = found
+            return tweets, dict(summary_sections(tweets))
+
+        analyzed = dict(zip(unique, pool.map(guarded(analyze), unique)))
+
+    errors = {key: error_message(found) for key, found in
+              chain(fetched.items(), analyzed.items()) if isinstance(found, Exception)}
+    analyzed = {key: (None, None) if key in errors else found
+                for key, found in analyzed.items()}
+    return BatchResult(specs, labels, [analyzed[key][0] for key in keys],
+                       [analyzed[key][1] for key in keys],
+                       sum(len(f) for f in frames), len(texts),
+                       [errors.get(key) for key in keys])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('specs', help='json file with a list of specs')
+    parser.add_argument('--json', help='file to write summaries and comparison to')
+    parser.add_argument('--csv', help='file to write the comparison table to')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--score-workers', type=int, default=None)
+    args = parser.parse_args()
+    with open(args.specs) as f:
+        batch = run_batch(json.load(f), args.workers, args.score_workers)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(batch.to_json(), f, indent=2)
+    if args.csv:
+        batch.comparison.to_csv(args.csv)
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(batch.comparison)
+    print("Scored {} distinct tweets of {} pulled".format(batch.n_scored, batch.n_pulled))
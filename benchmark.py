@@ -0,0 +1,528 @@
+'''
+Benchmarks for the hot paths of the sentiment pipeline, run on synthetic
+tweets so no Twitter credentials are needed.
+
+Usage:
+    python benchmark.py normalize --rows 100000 1000000
+    python benchmark.py score --rows 1000000 --workers 4
+    python benchmark.py cache --rows 100000
+    python benchmark.py friends --rows 150
+    python benchmark.py fetch --rows 150 1000
+    python benchmark.py load --rows 100000
+    python benchmark.py vader --rows 100000 1000000
+    python benchmark.py startup
+    python benchmark.py backends --datasets CA_Super_Tuesday.csv --model ngram_model.npz
+    python benchmark.py suite --rows 10000 --repeat 5 --json results.json
+    python benchmark.py suite --rows 10000 --compare results.json
+'''
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import re
+import string
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import nltk
+import numpy as np
+import pandas as pd
+from nltk.sentiment.vader import SentimentIntensityAnalyzer
+from nltk.stem.porter import PorterStemmer
+import backends
+import charts
+from analyze import TweetData
+from cache import ScoreCache
+from classifier import PARALLEL_MIN_ROWS, Classifier, normalize_tweets
+from dataset import convert_csv, load_tweets, read_scored
+from fake_api import FakeAPI
+from fetch import Fetcher, Scheduler, UserIds
+from fast_vader import FastVader
+from friends import FriendshipLookup, RateLimiter
+from synthetic import (CANDIDATE_POOL, CANDIDATES, synthetic_frame, synthetic_tweets,
+                       vader_conformance_texts)
+
+def timed(func, *args):
+    '''
+    Runs func(*args) once.
+
+    Outputs:
+        (tuple) of elapsed seconds and the result of func
+    '''
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def legacy_process_tweet(tweet):
+    '''
+    process_tweet as it was before the batch normalizer: the stopword set,
+    regex, translation table and stemmer are rebuilt for every tweet. Kept
+    only as the reference point for bench_normalize.
+    '''
+    stop_words = set(nltk.corpus.stopwords.words('english'))
+    remove_words = re.compile("(%s|%s|%s)" % (r'@[A-Za-z0-9_]+', r'https?://[^ ]+',
+                                              r'www.[^ ]+')).findall(tweet)
+    for word in remove_words:
+        tweet = tweet.replace(word, '')
+    tweet = tweet.translate(str.maketrans('', '', string.punctuation))
+    cleaned = [word.lower() for word in tweet.split()
+               if word.lower() not in stop_words and word.lower().isalpha()]
+    porter = PorterStemmer()
+    return ' '.join([porter.stem(word) for word in cleaned])
+
+
+def bench_normalize(rows, legacy_rows=10000):
+    '''
+    Compares the legacy per tweet normalization, the row by row
+    process_tweet and the batch normalize_tweets. The legacy path is too
+    slow for millions of rows, so it is timed on the first legacy_rows
+    tweets and extrapolated.
+    '''
+    process_tweet = Classifier.process_tweet.__get__(object.__new__(Classifier))
+    for n_rows in rows:
+        tweets = synthetic_tweets(n_rows)
+        sample = tweets.head(legacy_rows)
+        legacy_time, legacy = timed(sample.apply, legacy_process_tweet)
+        legacy_time *= n_rows / len(sample)
+        serial_time, serial = timed(tweets.apply, process_tweet)
+        batch_time, batch = timed(normalize_tweets, tweets)
+        assert serial.tolist() == batch.tolist(), "normalize_tweets differs from process_tweet"
+        assert legacy.tolist() == batch.head(legacy_rows).tolist(), \
+            "normalize_tweets differs from legacy process_tweet"
+        print("{:>9} rows: legacy {:.2f}s (est.), process_tweet {:.2f}s, "
+              "normalize_tweets {:.2f}s ({:.1f}x vs legacy)".format(
+                  n_rows, legacy_time, serial_time, batch_time,
+                  legacy_time / batch_time))
+
+
+def bench_score(rows, workers, chunk_size):
+    '''
+    Compares serial and multi-process Classifier scoring. The Classifier
+    scores serially below PARALLEL_MIN_ROWS and uses at most a worker per
+    core, so the workers actually used are reported.
+    '''
+    for n_rows in rows:
+        tweets = synthetic_tweets(n_rows)
+        serial_time, serial = timed(
+            lambda: Classifier(pd.DataFrame({'TweetText': tweets}), workers=1).scored_df)
+        parallel_time, parallel = timed(
+            lambda: Classifier(pd.DataFrame({'TweetText': tweets}), workers=workers,
+                               chunk_size=chunk_size).scored_df)
+        assert serial.equals(parallel), "parallel scores differ from serial scores"
+        used = min(workers, os.cpu_count() or 1) if n_rows >= PARALLEL_MIN_ROWS else 1
+        print("{:>9} rows: serial {:.2f}s, {} workers {:.2f}s ({:.1f}x)".format(
+            n_rows, serial_time, used, parallel_time, serial_time / parallel_time))
+
+
+def bench_cache(rows):
+    '''
+    Times a cold and a warm pass through a Classifier backed by a throwaway
+    ScoreCache.
+    '''
+    for n_rows in rows:
+        tweets = synthetic_tweets(n_rows)
+        cache = ScoreCache(':memory:')
+        cold_time, cold = timed(
+            lambda: Classifier(pd.DataFrame({'TweetText': tweets}), cache=cache).scored_df)
+        warm_time, warm = timed(
+            lambda: Classifier(pd.DataFrame({'TweetText': tweets}), cache=cache).scored_df)
+        assert cold.equals(warm), "cached scores differ from fresh scores"
+        print("{:>9} rows: cold {:.2f}s, warm {:.2f}s ({:.1f}x), {}".format(
+            n_rows, cold_time, warm_time, cold_time / warm_time, cache.stats()))
+
+
+def bench_friends(rows, latency=0.02, authors_per_tweet=0.7):
+    '''
+    Compares one show_friendship call per tweet and candidate with the
+    batched FriendshipLookup, against a FakeAPI with simulated latency.
+    Rate limiting is left out so only the lookup strategy is measured.
+    '''
+    candidate_ids = list(range(len(CANDIDATES)))
+    for n_rows in rows:
+        rng = random.Random(0)
+        user_ids = [rng.randrange(int(n_rows * authors_per_tweet) + 1)
+                    for _ in range(n_rows)]
+        api = FakeAPI(latency=latency)
+        serial_time, serial = timed(lambda: [
+            [api.show_friendship(source_id=u, target_id=c)[1].followed_by
+             for c in candidate_ids] for u in user_ids])
+        serial_calls = api.calls['show_friendship']
+        api = FakeAPI(latency=latency)
+        lookup = FriendshipLookup(api, limiter=RateLimiter(float('inf'), 1))
+        batch_time, batch = timed(lookup.lookup_many, user_ids, candidate_ids)
+        assert serial == [batch[u] for u in user_ids], "batched lookups differ"
+        print("{:>9} tweets: serial {:.2f}s ({} calls), batched {:.2f}s ({} calls, "
+              "{:.1f}x)".format(n_rows, serial_time, serial_calls, batch_time,
+                                api.calls['show_friendship'], serial_time / batch_time))
+
+
+def bench_fetch(rows, timeout=2.0, latency=0.01):
+    '''
+    Runs search.pull_tweets against a FakeAPI whose rate limits are scaled
+    down to one second windows, once waiting the limits out and twice with
+    a deadline, and reports the tweets and follow relationships each gets.
+    The searches with the deadline find the candidate ids cached. Fails if
+    the API rejects any call for going over its limit.
+    '''
+    import search
+    limits = {'search': (5, 1.0), 'get_user': (10, 1.0), 'show_friendship': (60, 1.0)}
+    for n_rows in rows:
+        api = FakeAPI(latency=latency, limits=limits, n_tweets=2 * n_rows,
+                      n_authors=n_rows)
+        scheduler = Scheduler(limits)
+        user_ids = UserIds(':memory:')
+        for name, search_timeout in [('no deadline', None), ('deadline', timeout),
+                                     ('deadline again', timeout)]:
+            calls = dict(api.calls)
+            fetcher = Fetcher(api, scheduler, user_ids)
+            elapsed, (df, _) = timed(search.pull_tweets, 'election', None, n_rows,
+                                     'recent', CANDIDATES, None, search_timeout, fetcher)
+            unknown = df[["Follows " + c for c in CANDIDATES]].isna().any(axis=1).sum()
+            print("{:>9} tweets, {:>14}: {:.2f}s, {} tweets, {} with unknown follows, "
+                  "calls {}".format(n_rows, name, elapsed, len(df), unknown,
+                                    {k: v - calls[k] for k, v in api.calls.items()}))
+        assert not any(api.rejected.values()), \
+            "calls rejected by the rate limits: {}".format(api.rejected)
+
+
+def bench_load(rows):
+    '''
+    Compares loading a dataset from csv, which parses and scores every
+    tweet, with loading the scored dataset from Parquet and from a
+    memory-mapped Arrow file, and reading only the Score column.
+    '''
+    params = {"search_word": "election", "candidates": CANDIDATES, "geocode": None,
+              "result_type": "recent"}
+    for n_rows in rows:
+        df = synthetic_frame(n_rows)
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, 'tweets.csv')
+            df.to_csv(csv_path)
+            csv_time, from_csv = timed(lambda: TweetData(pd.read_csv(csv_path), params))
+            times = []
+            for name in ('tweets.parquet', 'tweets.arrow'):
+                path = os.path.join(directory, name)
+                convert_csv(csv_path, path, params)
+                load_time, loaded = timed(load_tweets, path)
+                assert loaded.summarize_follow_data() == from_csv.summarize_follow_data() and \
+                    loaded.summarize_sentiment("Mentions ") == \
+                    from_csv.summarize_sentiment("Mentions "), \
+                    "{} summaries differ from csv summaries".format(name)
+                score_time, _ = timed(read_scored, path, ['Score'])
+                times.append((load_time, score_time, os.path.getsize(path)))
+            print("{:>9} rows: csv {:.2f}s ({:.1f} MB), ".format(
+                n_rows, csv_time, os.path.getsize(csv_path) / 2 ** 20) +
+                  ", ".join("{} {:.2f}s ({:.1f}x, {:.1f} MB), Score only {:.3f}s".format(
+                      name, load_time, csv_time / load_time, size / 2 ** 20, score_time)
+                            for name, (load_time, score_time, size)
+                            in zip(('parquet', 'arrow'), times)))
+
+
+def bench_vader(rows):
+    '''
+    Checks that FastVader gives the same compound scores as
+    polarity_scores, on adversarial text and on processed tweets, and
+    compares their throughput.
+    '''
+    analyzer = SentimentIntensityAnalyzer()
+    fast = FastVader(analyzer)
+    texts = vader_conformance_texts(analyzer, 50000)
+    expected = [analyzer.polarity_scores(text)['compound'] for text in texts]
+    differ = [t for t, e, f in zip(texts, expected, fast.polarity_compound(texts))
+              if e != f]
+    assert not differ, "FastVader differs from polarity_scores on {}".format(differ[:5])
+    print("conformance: {} texts identical".format(len(texts)))
+    for n_rows in rows:
+        processed = normalize_tweets(synthetic_tweets(n_rows)).tolist()
+        nltk_time, slow = timed(
+            lambda: [analyzer.polarity_scores(text)['compound'] for text in processed])
+        fast_time, scores = timed(fast.polarity_compound, processed)
+        assert scores.tolist() == slow, "FastVader differs from polarity_scores"
+        print("{:>9} rows: polarity_scores {:.2f}s, FastVader {:.2f}s ({:.1f}x, "
+              "{:.0f} tweets/s)".format(n_rows, nltk_time, fast_time,
+                                        nltk_time / fast_time, n_rows / fast_time))
+
+
+def backend_texts(datasets, n_rows):
+    '''
+    Processed tweets of the historical csv files, or of n_rows synthetic
+    tweets when none are given. Preprocessing is shared by every backend,
+    so it is done once here.
+    '''
+    if datasets:
+        tweets = pd.concat([pd.read_csv(path, usecols=['TweetText'])['TweetText']
+                            for path in datasets], ignore_index=True)
+    else:
+        tweets = synthetic_frame(n_rows)['TweetText']
+    return normalize_tweets(tweets.dropna().astype(str)).tolist()
+
+
+def bench_backends(rows, datasets=None, model_path=None, repeat=3):
+    '''
+    Compares the throughput of every backend in backends.BACKENDS, and the
+    agreement of each with VADER: how often it gives the same sign
+    (positive, neutral or negative at +/-0.05) and the correlation of the
+    scores. Without a model the ngram backend is trained on the VADER
+    signs of the first half of the tweets, and agreement is measured on
+    the other half.
+    '''
+    for n_rows in rows if not datasets else rows[:1]:
+        texts = backend_texts(datasets, n_rows)
+        train, test = texts[:len(texts) // 2], texts[len(texts) // 2:]
+        vader = backends.make('vader')
+        expected = vader.score_batch(test)
+        if model_path:
+            ngram = backends.make('ngram', path=model_path)
+        else:
+            labels = vader.score_batch(train)
+            keep = np.abs(labels) > 0.05
+            ngram = backends.NgramBackend.train([t for t, k in zip(train, keep) if k],
+                                                labels[keep] > 0)
+        print("{} tweets scored, {} used for training".format(
+            len(test), 0 if model_path else len(train)))
+        for name in backends.BACKENDS:
+            backend = ngram if name == 'ngram' else backends.make(name)
+            times = []
+            for _ in range(repeat):
+                elapsed, scores = timed(backend.score_batch, test)
+                times.append(elapsed)
+            same_sign = (np.sign(np.where(np.abs(scores) > 0.05, scores, 0)) ==
+                         np.sign(np.where(np.abs(expected) > 0.05, expected, 0))).mean()
+            correlation = np.corrcoef(scores, expected)[0, 1] if len(test) > 1 else 1.0
+            print("{:>14}: first {:.2f}s ({:.0f} tweets/s), best of {} {:.2f}s "
+                  "({:.0f} tweets/s), same sign as VADER {:.1%}, correlation {:.3f}".format(
+                      name, times[0], len(test) / times[0], repeat, min(times),
+                      len(test) / min(times), same_sign, correlation))
+
+
+# Modules exec imports that are kept outside this repository; empty ones
+# stand in for them when they are not installed, so the app can be imported
+STARTUP_STUBS = ['csv_to_tweets', 'templates']
+STARTUP_STATEMENTS = {
+    'classifier import': 'import classifier',
+    'worker start': 'import classifier; classifier._init_worker()',
+    'app import': 'import exec',
+    'first search': 'import analyze, pandas, synthetic; '
+                    'analyze.TweetData(pandas.DataFrame({"TweetText": '
+                    'synthetic.synthetic_tweets(150)}), {"search_word": "vote", '
+                    '"candidates": synthetic.CANDIDATES, "geocode": None, '
+                    '"result_type": "recent"})',
+}
+
+
+def bench_startup(repeat=3):
+    '''
+    Times fresh interpreters importing the app and starting a scoring
+    worker, best of repeat runs.
+    '''
+    with tempfile.TemporaryDirectory() as stubs:
+        for module in STARTUP_STUBS:
+            if importlib.util.find_spec(module) is None:
+                open(os.path.join(stubs, module + '.py'), 'w').close()
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [
+            os.path.dirname(os.path.abspath(__file__)), stubs,
+            os.environ.get('PYTHONPATH')])))
+        for name, statement in STARTUP_STATEMENTS.items():
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                run = subprocess.run([sys.executable, '-c', statement],
+                                     capture_output=True, env=env)
+                times.append(time.perf_counter() - start)
+            if run.returncode:
+                print("{:>18}: failed: {}".format(
+                    name, run.stderr.decode('utf-8', 'replace').strip().splitlines()[-1]))
+            else:
+                print("{:>18}: {:.2f}s".format(name, min(times)))
+
+
+def measure(name, func, rows, repeat, setup=None):
+    '''
+    Times func(*setup()) repeat times after one warm up run (which pays for
+    lazy imports and caches), then once more under tracemalloc for its peak
+    memory.
+
+    Inputs:
+        name: (str) what is measured
+        func: (callable)
+        rows: (int) rows func processes, for the throughput
+        repeat: (int) timed runs
+        setup: (callable) returning the arguments of func, run untimed
+    Outputs:
+        (dict) of the timings
+    '''
+    setup = setup or tuple
+    func(*setup())
+    times = []
+    for _ in range(repeat):
+        args = setup()
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    args = setup()
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    p50, p90, p99 = np.percentile(times, [50, 90, 99])
+    return {'name': name, 'rows': rows, 'repeat': repeat,
+            'mean_s': float(np.mean(times)), 'min_s': min(times), 'p50_s': float(p50),
+            'p90_s': float(p90), 'p99_s': float(p99), 'max_s': max(times),
+            'rows_per_s': rows / p50 if p50 else None, 'peak_mb': peak / 2 ** 20}
+
+
+def suite(n_rows, repeat, n_candidates=3, process_rows=10000, **options):
+    '''
+    Times every stage of an analysis on one synthetic corpus: tweet
+    normalization and scoring, TweetData construction, each summary
+    (starting from cold grouped statistics, as the first summary of a
+    request does) and both charts.
+
+    Inputs:
+        n_rows: (int) tweets in the corpus
+        repeat: (int) timed runs of each stage
+        n_candidates: (int) candidates taken from CANDIDATE_POOL
+        process_rows: (int) tweets given to the row by row process_tweet
+        options: keyword arguments of synthetic_frame
+    Outputs:
+        (list of dict) from measure
+    '''
+    candidates = dict(list(CANDIDATE_POOL.items())[:n_candidates])
+    df = synthetic_frame(n_rows, candidates=candidates, **options)
+    params = {"search_word": "vote", "candidates": candidates, "geocode": None,
+              "result_type": "recent"}
+    classifier = Classifier(None)
+    sample = df['TweetText'].head(process_rows)
+    tweets = TweetData(df.copy(), params)
+
+    def cold(*args):
+        def setup():
+            tweets.group_stats = None
+            return args
+        return setup
+
+    stages = [
+        ('Classifier.process_tweet', lambda s: s.apply(classifier.process_tweet),
+         len(sample), lambda: (sample,)),
+        ('Classifier.score_test_data', classifier.score_test_data, n_rows,
+         lambda: (df.copy(),)),
+        ('TweetData', TweetData, n_rows, lambda: (df.copy(), params)),
+        ('summarize_tweets_ab_candidates', tweets.summarize_tweets_ab_candidates,
+         n_rows, cold()),
+        ('summarize_follow_data', tweets.summarize_follow_data, n_rows, cold()),
+        ('summarize_sentiment Follows', tweets.summarize_sentiment, n_rows,
+         cold("Follows ")),
+        ('summarize_sentiment Mentions', tweets.summarize_sentiment, n_rows,
+         cold("Mentions ")),
+        ('summarize_sentiment_by_followers_and_mentions',
+         tweets.summarize_sentiment_by_followers_and_mentions, n_rows, cold()),
+        ('/visual/', charts.render_visual, n_rows, lambda: (tweets,)),
+        ('/wordcloud/', charts.render_wordcloud, n_rows, lambda: (tweets,)),
+    ]
+    return [measure(name, func, rows, repeat, setup)
+            for name, func, rows, setup in stages]
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              check=True).stdout.decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_suite(rows, repeat, json_path=None, compare_path=None, tolerance=1.2,
+                **options):
+    '''
+    Runs suite() for every row count, prints a table and optionally writes
+    the results as JSON, or compares them with an earlier JSON file.
+
+    Outputs:
+        (bool) False if a stage got slower than tolerance times its p50 in
+        the compared file
+    '''
+    report = {'revision': git_revision(), 'python': platform.python_version(),
+              'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'options': options,
+              'results': []}
+    for n_rows in rows:
+        report['results'].extend(suite(n_rows, repeat, **options))
+    baseline = {}
+    if compare_path:
+        with open(compare_path) as f:
+            baseline = {(r['name'], r['rows']): r for r in json.load(f)['results']}
+
+    ok = True
+    print("{:<46} {:>8} {:>9} {:>9} {:>9} {:>12} {:>9}".format(
+        'stage', 'rows', 'p50 s', 'p90 s', 'p99 s', 'rows/s', 'peak MB') +
+          (" {:>8}".format('vs p50') if baseline else ''))
+    for r in report['results']:
+        line = "{name:<46} {rows:>8} {p50_s:>9.4f} {p90_s:>9.4f} {p99_s:>9.4f} " \
+               "{rows_per_s:>12.0f} {peak_mb:>9.1f}".format(**r)
+        old = baseline.get((r['name'], r['rows']))
+        if old:
+            ratio = r['p50_s'] / old['p50_s']
+            line += " {:>7.2f}x".format(ratio)
+            if ratio > tolerance:
+                line += " SLOWER"
+                ok = False
+        print(line)
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    return ok
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('bench', choices=['normalize', 'score', 'cache', 'friends', 'fetch', 'load', 'vader',
+                                          'backends', 'startup', 'suite'])
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--chunk-size', type=int, default=20000)
+    backend_args = parser.add_argument_group('backends')
+    backend_args.add_argument('--datasets', nargs='+', help='historical csv files')
+    backend_args.add_argument('--model', help='trained ngram model, else one is trained')
+    suite_args = parser.add_argument_group('suite')
+    suite_args.add_argument('--repeat', type=int, default=5)
+    suite_args.add_argument('--json', help='file to write the results to')
+    suite_args.add_argument('--compare', help='results of an earlier run to compare with')
+    suite_args.add_argument('--tolerance', type=float, default=1.2,
+                            help='slowdown of a p50 that fails --compare')
+    suite_args.add_argument('--candidates', type=int, default=3,
+                            choices=range(1, len(CANDIDATE_POOL) + 1))
+    suite_args.add_argument('--alias-rate', type=float, default=None)
+    suite_args.add_argument('--handle-rate', type=float, default=0.5)
+    suite_args.add_argument('--url-rate', type=float, default=0.3)
+    suite_args.add_argument('--follow-rate', type=float, default=0.3)
+    suite_args.add_argument('--null-rate', type=float, default=0.2)
+    args = parser.parse_args()
+    if args.bench == 'normalize':
+        bench_normalize(args.rows)
+    elif args.bench == 'score':
+        bench_score(args.rows, args.workers, args.chunk_size)
+    elif args.bench == 'cache':
+        bench_cache(args.rows)
+    elif args.bench == 'friends':
+        bench_friends(args.rows)
+    elif args.bench == 'fetch':
+        bench_fetch(args.rows)
+    elif args.bench == 'load':
+        bench_load(args.rows)
+    elif args.bench == 'vader':
+        bench_vader(args.rows)
+    elif args.bench == 'backends':
+        bench_backends(args.rows, args.datasets, args.model)
+    elif args.bench == 'startup':
+        bench_startup()
+    elif args.bench == 'suite':
+        ok = bench_suite(args.rows, args.repeat, args.json, args.compare, args.tolerance,
+                         n_candidates=args.candidates, alias_rate=args.alias_rate,
+                         handle_rate=args.handle_rate, url_rate=args.url_rate,
+                         follow_rate=args.follow_rate, null_rate=args.null_rate)
+        sys.exit(0 if ok else 1)
@@ -0,0 +1,193 @@
+'''
+Persistent cache of processed tweets and their scores, kept in SQLite and
+keyed by a hash of the raw tweet text and the classifier version, so
+replays and overlapping searches skip the NLP work for tweets already seen.
+Classifiers use the cache named by the SCORE_CACHE environment variable,
+unless they are given one.
+'''
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import metrics
+import resources
+
+DEFAULT_CACHE_PATH = 'score_cache.sqlite'
+DEFAULT_MAX_ENTRIES = 2000000
+# SQLite's default limit on host parameters in one statement is 999.
+BATCH_SIZE = 900
+
+
+def preprocessing_digest(stop_words):
+    '''
+    Hash of everything that changes a processed tweet: the nltk version
+    (stemmer) and the stopword list.
+
+    Inputs:
+        stop_words: (set of str)
+    Outputs:
+        (hashlib.sha1) to add the scoring model to
+    '''
+    import nltk
+    digest = hashlib.sha1(nltk.__version__.encode('utf-8'))
+    digest.update(' '.join(sorted(stop_words)).encode('utf-8'))
+    return digest
+
+
+def classifier_version(analyzer, stop_words):
+    '''
+    Fingerprint of everything that changes a processed tweet or its VADER
+    score: see preprocessing_digest, and the VADER lexicon.
+
+    Inputs:
+        analyzer: (SentimentIntensityAnalyzer)
+        stop_words: (set of str)
+    Outputs:
+        (str) hex digest
+    '''
+    digest = preprocessing_digest(stop_words)
+    for word, valence in sorted(analyzer.lexicon.items()):
+        digest.update('{}\t{}\n'.format(word, valence).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ScoreCache():
+    '''
+    On-disk map of hash(tweet text, version) to (processed tweet, score) with
+    least recently used eviction once more than max_entries are stored. One
+    connection is shared by the threads of a process, one at a time. The
+    number of entries is counted when the cache is opened and kept up to date
+    from then on; it is counted again before evicting, in case other
+    processes added entries.
+    '''
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        '''
+        Inputs:
+            path: (str) SQLite file, ':memory:' for a throwaway cache
+            max_entries: (int) entries kept after eviction
+        '''
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS scores (
+                                 key BLOB PRIMARY KEY,
+                                 processed TEXT NOT NULL,
+                                 score REAL NOT NULL,
+                                 last_used REAL NOT NULL)''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS scores_last_used '
+                          'ON scores (last_used)')
+        self.conn.commit()
+        self.entries = self.count()
+
+    def count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM scores').fetchone()[0]
+
+    def key(self, tweet, version):
+        return hashlib.blake2b((version + '\0' + tweet).encode('utf-8'),
+                               digest_size=16).digest()
+
+    def get_many(self, tweets, version):
+        '''
+        Looks up a batch of tweets and marks the hits as recently used.
+
+        Inputs:
+            tweets: (list of str) raw tweet text
+            version: (str) see classifier_version
+        Outputs:
+            (dict) of tweet text to (processed tweet, score) for the hits
+        '''
+        keys = {self.key(tweet, version): tweet for tweet in set(tweets)}
+        found = {}
+        key_list = list(keys)
+        with self.lock:
+            for i in range(0, len(key_list), BATCH_SIZE):
+                batch = key_list[i:i + BATCH_SIZE]
+                rows = self.conn.execute(
+                    'SELECT key, processed, score FROM scores WHERE key IN ({})'.format(
+                        ','.join('?' * len(batch))), batch)
+                for key, processed, score in rows:
+                    found[keys[key]] = (processed, score)
+            if found:
+                now = time.time()
+                self.conn.executemany('UPDATE scores SET last_used = ? WHERE key = ?',
+                                      [(now, self.key(tweet, version)) for tweet in found])
+                self.conn.commit()
+        hits = sum(1 for tweet in tweets if tweet in found)
+        self.hits += hits
+        self.misses += len(tweets) - hits
+        metrics.count('cache_lookups_total', hits, cache='scores', result='hit')
+        metrics.count('cache_lookups_total', len(tweets) - hits, cache='scores',
+                      result='miss')
+        return found
+
+    def put_many(self, entries, version):
+        '''
+        Stores a batch of results and evicts the least recently used entries
+        beyond max_entries.
+
+        Inputs:
+            entries: (iterable of tuples) of tweet text, processed tweet, score
+            version: (str) see classifier_version
+        '''
+        now = time.time()
+        rows = [(self.key(tweet, version), processed, float(score), now)
+                for tweet, processed, score in entries]
+        with self.lock:
+            before = self.conn.total_changes
+            self.conn.executemany('INSERT OR IGNORE INTO scores VALUES (?, ?, ?, ?)', rows)
+            added = self.conn.total_changes - before
+            if added < len(rows):
+                # Some were stored already, e.g. by another thread
+                self.conn.executemany('UPDATE scores SET processed = ?, score = ?, '
+                                      'last_used = ? WHERE key = ?',
+                                      [row[1:] + row[:1] for row in rows])
+            self.entries += added
+            if self.entries > self.max_entries:
+                self.entries = self.count()
+                excess = self.entries - self.max_entries
+                if excess > 0:
+                    self.conn.execute('DELETE FROM scores WHERE key IN (SELECT key FROM '
+                                      'scores ORDER BY last_used LIMIT ?)', (excess,))
+                    self.entries -= excess
+            self.conn.commit()
+
+    def stats(self):
+        '''
+        Outputs:
+            (dict) of hits, misses, hit rate and number of stored entries
+        '''
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self)}
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute('DELETE FROM scores')
+            self.conn.commit()
+            self.entries = 0
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def __len__(self):
+        return self.entries
+
+
+def configured():
+    '''
+    Outputs:
+        ScoreCache in the file SCORE_CACHE names, shared by the classifiers
+        of this process, or None if SCORE_CACHE is not set
+    '''
+    path = os.environ.get('SCORE_CACHE')
+    if not path:
+        return None
+    return resources.load('score cache ' + path, lambda: ScoreCache(path))
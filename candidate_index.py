@@ -0,0 +1,150 @@
+'''
+Packed bitmap index of which tweets mention, tag, or are posted by followers
+of each candidate. Filters over candidates become bitwise ANDs and counts
+become popcounts instead of fresh scans of the tweet text.
+'''
+import numpy as np
+
+# Number of set bits in every possible byte.
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def pack(mask):
+    '''
+    Inputs:
+        mask: (array-like of bool)
+    Outputs:
+        (numpy.ndarray of uint8) one bit per row
+    '''
+    return np.packbits(np.asarray(mask, dtype=bool))
+
+
+def alternation(patterns):
+    '''
+    One regex that matches wherever any of the patterns matches. Aliases
+    have always been used as regexes, so they are grouped, not escaped.
+    '''
+    return '|'.join('(?:{})'.format(p) for p in patterns)
+
+
+class CandidateIndex():
+    '''
+    Bitsets over the rows of a TweetData.data frame, in its (sorted) row order.
+    '''
+
+    def __init__(self, data, candidates):
+        '''
+        Inputs:
+            data: (pandas.DataFrame) scored tweets
+            candidates: (dict) of candidate handle to list of aliases
+        '''
+        self.n = len(data)
+        self.text = data["TweetText"]
+        self.candidates = {}
+        self.primary = list(candidates)
+        self.mentions = {}
+        self.tags = {}
+
+        # One pass over all the text finds the tweets that mention anyone;
+        # the per candidate patterns then only run over those.
+        names = []
+        [names.extend(aliases + [handle]) for handle, aliases in candidates.items()]
+        mention_any = self.text.str.contains(alternation(names)).values if names \
+            else np.zeros(self.n, dtype=bool)
+        self.mention_any = pack(mention_any)
+        self.add_candidates(candidates, np.flatnonzero(mention_any))
+
+        self.follows = {}
+        self.follow_columns = []
+        starts = [i for i, col in enumerate(data.columns) if col[0:7] == "Follows"]
+        for col in data.columns[starts[0]:] if starts else []:
+            if col[0:7] != "Follows":
+                break
+            self.follow_columns.append(col)
+            self.follows[col] = pack((data[col] == True).values)
+        self.follows_known = pack(data[self.follow_columns[0]].notna().values) \
+            if self.follow_columns else pack(np.zeros(self.n, dtype=bool))
+
+    def add_candidates(self, candidates, rows=None):
+        '''
+        Indexes mentions and tags of candidates not indexed yet.
+
+        Inputs:
+            candidates: (dict) of candidate handle to list of aliases
+            rows: (numpy.ndarray of int) positions that can match at all, or
+                  None to search every row
+        '''
+        for handle, aliases in candidates.items():
+            if handle in self.mentions:
+                continue
+            self.candidates[handle] = aliases
+            text = self.text if rows is None else self.text.iloc[rows]
+            positions = np.arange(self.n) if rows is None else rows
+            mentions = np.zeros(self.n, dtype=bool)
+            tags = np.zeros(self.n, dtype=bool)
+            mentions[positions] = text.str.contains(alternation([handle] + aliases)).values
+            tags[positions] = text.str.contains(handle).values
+            self.mentions[handle] = pack(mentions)
+            self.tags[handle] = pack(tags)
+
+    def extend(self, new_data, data, order):
+        '''
+        Adds rows to the index. Only the new tweets are searched; the bitsets
+        are then interleaved into the merged row order.
+
+        Inputs:
+            new_data: (pandas.DataFrame) the new scored tweets
+            data: (pandas.DataFrame) old and new tweets merged
+            order: (numpy.ndarray of int) for every merged row, its position
+                   in the old rows followed by the rows of new_data
+        '''
+        new = CandidateIndex(new_data, {handle: self.candidates[handle]
+                                        for handle in self.primary})
+        new.add_candidates(self.candidates)
+        nothing = pack(np.zeros(new.n, dtype=bool))
+
+        def merge(old_bits, new_bits):
+            return pack(np.concatenate([self.mask(old_bits), new.mask(new_bits)])[order])
+
+        self.mention_any = merge(self.mention_any, new.mention_any)
+        for handle in self.mentions:
+            self.mentions[handle] = merge(self.mentions[handle], new.mentions[handle])
+            self.tags[handle] = merge(self.tags[handle], new.tags[handle])
+        for col in self.follow_columns:
+            self.follows[col] = merge(self.follows[col], new.follows.get(col, nothing))
+        known = pack(new_data[self.follow_columns[0]].notna().values) \
+            if self.follow_columns else nothing
+        self.follows_known = merge(self.follows_known, known)
+        self.n = len(data)
+        self.text = data["TweetText"]
+
+    def count(self, bits):
+        '''
+        Outputs:
+            (numpy.int64) number of rows set in bits
+        '''
+        return POPCOUNT[bits].sum(dtype=np.int64)
+
+    def mask(self, bits):
+        '''
+        Outputs:
+            (numpy.ndarray of bool) row mask for indexing data
+        '''
+        return np.unpackbits(bits, count=self.n).astype(bool)
+
+    def follows_and_mentions(self, follower_of, mentioned):
+        '''
+        Outputs:
+            (numpy.ndarray of uint8) tweets by followers of one candidate that
+            mention another
+        '''
+        return self.follows['Follows ' + follower_of] & self.mentions[mentioned]
+
+    def nbytes(self):
+        '''
+        Outputs:
+            (int) bytes taken by all the bitsets
+        '''
+        bitsets = [self.mention_any, self.follows_known] + list(self.mentions.values()) + \
+            list(self.tags.values()) + list(self.follows.values())
+        return sum(bits.nbytes for bits in bitsets)
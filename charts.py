@@ -0,0 +1,273 @@
+'''
+Rendering of the /visual/ and /wordcloud/ charts, and a bounded in-memory
+cache of the rendered PNGs keyed by dataset fingerprint, so each chart is
+drawn once per dataset however many times it is requested.
+'''
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from itertools import chain
+from types import SimpleNamespace
+import pandas as pd
+import metrics
+import resources
+from classifier import PUNCTUATION_TABLE, normalize_tweets, stem
+
+DEFAULT_MAX_CHARTS = 32
+WORDCLOUD_WORDS = 250
+# Tweets whose words label the stems in the word cloud
+WORDCLOUD_SAMPLE = 5000
+
+
+def plotting():
+    '''
+    matplotlib and wordcloud, imported by the first chart drawn in a process
+    rather than when the app starts.
+
+    Outputs:
+        (types.SimpleNamespace) of the classes the renderers use
+    '''
+    def loader():
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        from matplotlib.patches import Circle
+        from wordcloud import WordCloud, STOPWORDS
+        return SimpleNamespace(FigureCanvasAgg=FigureCanvasAgg, Figure=Figure,
+                               Circle=Circle, WordCloud=WordCloud, STOPWORDS=STOPWORDS)
+    return resources.load('plotting', loader)
+
+
+def render_visual(tweets):
+    '''
+    Pie charts of tweet sentiment grouped by whether or not the tweet
+    mentions a particular candidate handle or alias.
+
+    Inputs:
+        tweets: (TweetData)
+    Outputs:
+        (bytes) PNG image
+    '''
+    plot = plotting()
+    labels = tweets.data['Score_bins'].unique()
+    colors = ['orangered', 'coral', 'tan', 'yellowgreen', 'limegreen']
+    handles = [handle for handle in tweets.index.mentions if handle.startswith('@')]
+
+    # The object oriented API keeps figures out of pyplot's global state,
+    # so charts can be drawn from a background thread.
+    fig = plot.Figure(figsize=(15,4), constrained_layout=True)
+    plot.FigureCanvasAgg(fig)
+    axs = fig.subplots(1, len(handles), squeeze=False)[0]
+    fig.suptitle('Tweets Mentioning:', fontsize=15)
+
+    for i, handle in enumerate(handles):
+        filtered = tweets.data[tweets.index.mask(tweets.index.mentions[handle])]
+        frac = (filtered.groupby('Score_bins').size()/len(filtered)).fillna(0)
+        if (frac == 0).all():
+            axs[i].text(-0.5, 0.70, 'Whoops! No tweets in your search \n mentioned {}!'.format(handle))
+        axs[i].pie(frac, colors=colors, pctdistance=0.85, radius=1.25, startangle=90,\
+                         autopct=lambda p: '{:.1f}%'.format(round(p)) if p > 0 else '')
+        circle = plot.Circle((0,0),0.70,fc='white')
+        axs[i].add_artist(circle)
+        axs[i].set_title('{} \n Number of tweets: {}'.format(handle, len(filtered)))
+        axs[i].axis('equal')
+
+    fig.legend(labels=labels, loc='lower center', ncol=5)
+    img = BytesIO()
+    fig.savefig(img, format='png')
+    return img.getvalue()
+
+
+def word_labels(stems, texts):
+    '''
+    The word each stem is most often written as in texts, e.g. "amazing" for
+    "amaz". A stem that none of the words of texts has labels itself.
+
+    Inputs:
+        stems: (iterable of str) processed words
+        texts: (iterable of str) tweets as pulled
+    Outputs:
+        (dict) of stem to word
+    '''
+    stems = set(stems)
+    words = Counter(chain.from_iterable(
+        text.translate(PUNCTUATION_TABLE).lower().split() for text in texts))
+    labels = {}
+    for word, _ in words.most_common():
+        if word.isalpha() and stem(word) in stems:
+            labels.setdefault(stem(word), word)
+    return {s: labels.get(s, s) for s in stems}
+
+
+def wordcloud_frequencies(tweets, stopwords):
+    '''
+    Inputs:
+        tweets: (TweetData)
+        stopwords: (set of str) words to leave out, as typed
+    Outputs:
+        (dict) of the WORDCLOUD_WORDS most frequent words in the tweets to
+        their counts
+    '''
+    # The counted words are stems, so the stopwords and search terms are
+    # stemmed too, and each stem is shown as the word it most often was.
+    search_terms = normalize_tweets(pd.Series([tweets.query], dtype=object))[0].split()
+    stopwords = {stem(word) for word in stopwords}.union(search_terms)
+    top = tweets.terms.top(WORDCLOUD_WORDS, stopwords)
+    # The data is sorted by score, so the sample is spread evenly over it
+    # rather than taken from the most negative tweets.
+    texts = tweets.data['TweetText']
+    step = max(1, -(-len(texts) // WORDCLOUD_SAMPLE))
+    labels = word_labels([word for word, _ in top], texts.iloc[::step].dropna())
+    return {labels[word]: n for word, n in top}
+
+
+def render_wordcloud(tweets):
+    '''
+    Word cloud of the 250 most frequently occurring words in the tweets,
+    drawn from the word counts kept while the tweets were scored.
+
+    Inputs:
+        tweets: (TweetData)
+    Outputs:
+        (bytes) PNG image
+    '''
+    plot = plotting()
+    fig = plot.Figure(figsize = (10,10))
+    plot.FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1, 1, 1)
+    frequencies = wordcloud_frequencies(tweets, plot.STOPWORDS)
+    wordcloud = plot.WordCloud(background_color='white',
+                          max_words = WORDCLOUD_WORDS,
+                          max_font_size = 30,
+                          colormap='tab10').generate_from_frequencies(frequencies)
+
+    ax.imshow(wordcloud)
+    ax.set_title("Word Cloud for Your Search!", fontsize = 18)
+    ax.axis('off')
+    img = BytesIO()
+    fig.savefig(img, format='png')
+    return img.getvalue()
+
+
+def render_trend(tweets):
+    '''
+    Mean sentiment and number of tweets over time, for all tweets and for
+    the tweets mentioning each candidate, per minute, hour or day, whichever
+    is the finest that fits the time the tweets span.
+
+    Inputs:
+        tweets: (TweetData)
+    Outputs:
+        (bytes) PNG image
+    '''
+    plot = plotting()
+    fig = plot.Figure(figsize=(12,7), constrained_layout=True)
+    plot.FigureCanvasAgg(fig)
+    score_ax, count_ax = fig.subplots(2, 1, sharex=True)
+    trends = tweets.trends()
+    if trends is None:
+        score_ax.text(0.5, 0.5, 'Whoops! These tweets have no times!', ha='center')
+    else:
+        freq = trends.choose_freq()
+        for group in trends.groups:
+            series = trends.series(freq, group)
+            score_ax.plot(series.index, series['mean_score'], marker='.', label=group)
+            count_ax.plot(series.index, series['count'], marker='.', label=group)
+        score_ax.set_title('Mean sentiment per {}'.format(freq), fontsize=15)
+        count_ax.set_title('Tweets per {}'.format(freq), fontsize=15)
+        score_ax.axhline(0, color='grey', linewidth=0.5)
+        score_ax.legend(loc='upper left')
+    img = BytesIO()
+    fig.savefig(img, format='png')
+    return img.getvalue()
+
+
+RENDERERS = {'visual': render_visual, 'wordcloud': render_wordcloud, 'trend': render_trend}
+
+
+def chart_key(tweets, name):
+    '''
+    Cache key of a chart: what it is drawn from, not when it was requested.
+
+    Inputs:
+        tweets: (TweetData)
+        name: (str) key of RENDERERS
+    Outputs:
+        (tuple)
+    '''
+    if name == 'visual':
+        return (tweets.fingerprint(), name, tuple(tweets.index.mentions))
+    return (tweets.fingerprint(), name)
+
+
+class ChartCache():
+    '''
+    Least recently used cache of rendered charts. Renders can be queued on a
+    background thread; a request for a chart that is still being drawn waits
+    for that render instead of starting another one.
+    '''
+
+    def __init__(self, max_entries=DEFAULT_MAX_CHARTS):
+        self.max_entries = max_entries
+        self.charts = OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=1)
+
+    def get(self, tweets, name):
+        '''
+        Rendered chart, drawing it now if it is neither cached nor queued.
+
+        Inputs:
+            tweets: (TweetData)
+            name: (str) key of RENDERERS
+        Outputs:
+            (tuple) of PNG bytes and the ETag to serve them with
+        '''
+        key = chart_key(tweets, name)
+        with self.lock:
+            if key in self.charts:
+                self.charts.move_to_end(key)
+                return self.charts[key], self.etag(key)
+            future = self.pending.get(key)
+        if future is not None:
+            return future.result(), self.etag(key)
+        with metrics.span('chart ' + name):
+            png = RENDERERS[name](tweets)
+        self.store(key, png)
+        return png, self.etag(key)
+
+    def prerender(self, tweets):
+        '''
+        Queues every chart of a dataset on the background thread.
+
+        Inputs:
+            tweets: (TweetData)
+        '''
+        for name in RENDERERS:
+            key = chart_key(tweets, name)
+            with self.lock:
+                if key in self.charts or key in self.pending:
+                    continue
+                self.pending[key] = self.pool.submit(self.render, tweets, name, key)
+
+    def render(self, tweets, name, key):
+        try:
+            with metrics.span('chart ' + name):
+                png = RENDERERS[name](tweets)
+            self.store(key, png)
+            return png
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+
+    def store(self, key, png):
+        with self.lock:
+            self.charts[key] = png
+            self.charts.move_to_end(key)
+            while len(self.charts) > self.max_entries:
+                self.charts.popitem(last=False)
+
+    def etag(self, key):
+        return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
@@ -1,26 +1,192 @@
 
+import os
 import re
 import string
-import nltk
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
-from nltk.stem.porter import PorterStemmer
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
-nltk.download('vader_lexicon')
-nltk.download('stopwords')
+from functools import lru_cache
+from itertools import chain
+import backends
+import metrics
+import resources
+from cache import configured as configured_cache
+
+HANDLES = r'@[A-Za-z0-9_]+'
+LINKS = r'https?://[^ ]+'
+WEB_PAGE = r'www.[^ ]+'
+REMOVE_PATTERN = re.compile("(%s|%s|%s)" % (HANDLES, LINKS, WEB_PAGE))
+PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation)
+STEM_CACHE_SIZE = 2 ** 16
+SCORE_LABELS = ['Strongly Negative', 'Negative', 'Neutral', 'Positive',
+                'Strongly Positive']
+DEFAULT_CHUNK_SIZE = 20000
+# Fewer tweets are scored faster in this process than workers can start
+PARALLEL_MIN_ROWS = 100000
+
+_porter = None
+
+
+def get_stop_words():
+    '''
+    Loads the english stopword set once and reuses it afterwards.
+
+    Outputs:
+        (set of str) stopwords
+    '''
+    return resources.stop_words()
+
+
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def stem(word):
+    '''
+    Memoized Porter stem of a single lower case token.
+    '''
+    global _porter
+    if _porter is None:
+        from nltk.stem.porter import PorterStemmer
+        _porter = PorterStemmer()
+    return _porter.stem(word)
+
+
+def strip_matches(tweet, remove_words):
+    '''
+    Removes every handle, link and web page found in a tweet, in the same
+    order (and with the same str.replace semantics) as process_tweet.
+
+    Inputs:
+        tweet: (str)
+        remove_words: (list of str) matches of REMOVE_PATTERN in tweet
+    Output:
+        (str) tweet without the matches
+    '''
+    for word in remove_words:
+        tweet = tweet.replace(word, '')
+    return tweet
+
+
+def stem_lookup(vocabulary):
+    '''
+    Builds the token -> stem table for a batch, leaving out stopwords and
+    non alphabetic tokens.
+
+    Inputs:
+        vocabulary: (iterable of str) distinct lower case tokens
+    Output:
+        (dict) of kept token to its stem
+    '''
+    stop_words = get_stop_words()
+    return {word: stem(word) for word in vocabulary
+            if word not in stop_words and word.isalpha()}
+
+
+def normalize_tweets(tweets):
+    '''
+    Batch version of Classifier.process_tweet. Handles, links and web pages
+    are found for the whole column at once, duplicate tweets are normalized
+    once and each distinct token is filtered and stemmed once per batch
+    (stems are also memoized across batches). Output matches process_tweet
+    row for row.
+
+    Inputs:
+        tweets: (pandas.Series or iterable of str)
+    Output:
+        (pandas.Series of str) normalized tweets, same index as tweets
+    '''
+    if not isinstance(tweets, pd.Series):
+        tweets = pd.Series(list(tweets), dtype=object)
+    if tweets.empty:
+        return pd.Series([], index=tweets.index, dtype=object)
+
+    # Only rows that contain a handle, link or web page need the (exact)
+    # sequential replace; everything else goes straight through.
+    matches = tweets.str.findall(REMOVE_PATTERN)
+    has_match = matches.str.len() > 0
+    stripped = tweets.copy()
+    stripped[has_match] = [strip_matches(tweet, words) for tweet, words
+                           in zip(tweets[has_match], matches[has_match])]
+
+    # Retweets and copy-paste campaigns repeat text verbatim, so only the
+    # distinct strings are tokenized.
+    codes, uniques = pd.factorize(stripped)
+    tokens = [text.translate(PUNCTUATION_TABLE).lower().split() for text in uniques]
+    lookup = stem_lookup(set(chain.from_iterable(tokens)))
+    normalized = [' '.join([lookup[word] for word in words if word in lookup])
+                  for words in tokens]
+    # Missing text is factorized to code -1, which picks the trailing ''.
+    normalized = np.array(normalized + [''], dtype=object)
+    return pd.Series(normalized[codes], index=tweets.index, dtype=object)
+
+
+_worker_backend = None
+
+
+def configured_workers():
+    '''
+    Outputs:
+        (int) processes the SCORE_WORKERS environment variable asks to score
+        with, or None
+    '''
+    workers = os.environ.get('SCORE_WORKERS')
+    return int(workers) if workers else None
+
+
+def _init_worker(name=None, options=None):
+    '''
+    Builds the one backend each worker process scores with.
+
+    Inputs:
+        name: (str) key of backends.BACKENDS, or None for the configured one
+        options: (dict) keyword arguments of the backend
+    '''
+    global _worker_backend
+    _worker_backend = backends.configured() if name is None else \
+        backends.make(name, **(options or {}))
+
+
+def _score_chunk(tweets):
+    '''
+    Normalizes and scores one chunk of tweets inside a worker process.
+
+    Inputs:
+        tweets: (list of str) raw tweet text
+    Outputs:
+        (tuple) of the list of processed tweets and the list of scores
+    '''
+    processed = normalize_tweets(tweets).tolist()
+    return processed, _worker_backend.score_batch(processed).tolist()
 
 
 class Classifier():
     '''
-    Predict fine-grained sentiment classes using Vader.
+    Predict fine-grained sentiment classes using Vader, or another backend
+    of backends.py.
     '''
     
-    def __init__(self, df):
-        from nltk.sentiment.vader import SentimentIntensityAnalyzer
-        self.classifier = SentimentIntensityAnalyzer()
-        self.scored_df = self.score_test_data(df)
+    def __init__(self, df, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, cache=None,
+                 backend=None):
+        '''
+        Inputs:
+            df: (pandas.DataFrame) of tweets with a TweetText column, or None
+                to only build the classifier and call score_test_data later
+            workers: (int) number of processes to score with, 1 scores in
+                     this process, None the number SCORE_WORKERS names, if
+                     any, see score_tweets
+            chunk_size: (int) rows handed to a worker at a time
+            cache: (cache.ScoreCache) previously scored tweets, or None for
+                   the one SCORE_CACHE names, if any
+            backend: (backends.Backend) to score with, or None for the one
+                     SENTIMENT_BACKEND names
+        '''
+        self.backend = backend or backends.configured()
+        self.workers = workers if workers is not None else configured_workers()
+        self.chunk_size = chunk_size
+        self.cache = cache if cache is not None else configured_cache()
+        self.version = None
+        self.scored_df = self.score_test_data(df) if df is not None else None
 
     def score(self, tweet_text):
-        return self.classifier.polarity_scores(tweet_text)['compound']
+        return float(self.backend.score_batch([tweet_text])[0])
 
     def process_tweet(self, tweet):
         '''
@@ -37,29 +203,110 @@ class Classifier():
         Output: 
             normalized: (str)
         '''
-        stop_words = set(nltk.corpus.stopwords.words('english'))
-        handles = r'@[A-Za-z0-9_]+'
-        links = r'https?://[^ ]+'
-        web_page = r'www.[^ ]+'
-
-        remove_words = re.compile("(%s|%s|%s)" % (handles, links, web_page)).findall(tweet)
-        for word in remove_words:
-            tweet = tweet.replace(word, '')
-        tweet = tweet.translate(str.maketrans('', '', string.punctuation))
+        stop_words = get_stop_words()
+
+        remove_words = REMOVE_PATTERN.findall(tweet)
+        tweet = strip_matches(tweet, remove_words)
+        tweet = tweet.translate(PUNCTUATION_TABLE)
         cleaned = [word.lower() for word in tweet.split() if word.lower() not in stop_words and word.lower().isalpha()]
-        
-        porter = PorterStemmer()
+
         normalized = []
         for word in cleaned:
-            normalized.append(porter.stem(word))
+            normalized.append(stem(word))
 
         return ' '.join(normalized)
 
+    def score_parallel(self, tweets, workers):
+        '''
+        Splits tweets into chunks of self.chunk_size and normalizes and scores
+        them in a pool of workers processes. Chunks come back in submission
+        order, so rows keep their original order.
+
+        Inputs:
+            tweets: (pandas.Series of str) raw tweet text
+            workers: (int) processes in the pool
+        Outputs:
+            (tuple) of processed tweets and scores, both pandas.Series with
+            the index of tweets
+        '''
+        texts = tweets.tolist()
+        chunks = [texts[i:i + self.chunk_size]
+                  for i in range(0, len(texts), self.chunk_size)]
+        processed, scores = [], []
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_worker,
+                                 initargs=(self.backend.name,
+                                           self.backend.options())) as pool:
+            for chunk_processed, chunk_scores in pool.map(_score_chunk, chunks):
+                processed.extend(chunk_processed)
+                scores.extend(chunk_scores)
+        return (pd.Series(processed, index=tweets.index, dtype=object),
+                pd.Series(scores, index=tweets.index, dtype=float))
+
+    def score_tweets(self, tweets):
+        '''
+        Normalizes and scores tweets, in a process pool if self.workers asks
+        for one and there are at least PARALLEL_MIN_ROWS tweets.
+
+        A worker takes about a second to start and a tweet about 25
+        microseconds to score, so n workers only save time on a machine
+        with n free cores and on more tweets than take a second or so to
+        score serially: replays of hundreds of thousands of tweets, never a
+        live search. The pool has at most one worker per core.
+
+        Inputs:
+            tweets: (pandas.Series of str) raw tweet text
+        Outputs:
+            (tuple) of processed tweets and scores, both pandas.Series with
+            the index of tweets
+        '''
+        workers = min(self.workers or 1, os.cpu_count() or 1)
+        if workers > 1 and len(tweets) >= PARALLEL_MIN_ROWS and len(tweets) > self.chunk_size:
+            return self.score_parallel(tweets, workers)
+        processed = normalize_tweets(tweets)
+        return processed, pd.Series(self.backend.score_batch(processed.tolist()),
+                                    index=tweets.index, dtype=float)
+
+    def score_cached(self, tweets):
+        '''
+        Reads what it can from self.cache and scores only the misses, in
+        bulk, adding them to the cache.
+
+        Inputs:
+            tweets: (pandas.Series of str) raw tweet text
+        Outputs:
+            (tuple) of processed tweets and scores, both pandas.Series with
+            the index of tweets
+        '''
+        if self.version is None:
+            self.version = self.backend.version(get_stop_words())
+        missing = tweets.isna().values
+        texts = tweets[~missing].tolist()
+        found = self.cache.get_many(texts, self.version)
+        misses = pd.Series([text for text in set(texts) if text not in found],
+                           dtype=object)
+        if not misses.empty:
+            processed, scores = self.score_tweets(misses)
+            entries = list(zip(misses, processed, scores))
+            self.cache.put_many(entries, self.version)
+            found.update((text, (p, s)) for text, p, s in entries)
+        processed = np.empty(len(tweets), dtype=object)
+        scores = np.empty(len(tweets), dtype=float)
+        processed[~missing] = [found[text][0] for text in texts]
+        scores[~missing] = [found[text][1] for text in texts]
+        # Missing text is not cached; normalize_tweets processes it to ''
+        if missing.any():
+            processed[missing] = ''
+            scores[missing] = self.backend.score_batch([''])[0]
+        return (pd.Series(processed, index=tweets.index, dtype=object),
+                pd.Series(scores, index=tweets.index, dtype=float))
+
     def score_test_data(self, df):
-        df['ProcessedTweet'] = df['TweetText'].apply(self.process_tweet)
-        df['Score'] = df['ProcessedTweet'].apply(self.score)
-        df['Score_bins'] = pd.cut(df['Score'], bins=5, labels= \
-            ['Strongly Negative', 'Negative', 'Neutral', 'Positive', \
-            'Strongly Positive']) 
+        metrics.count('rows_total', len(df), stage='score')
+        with metrics.span('score'):
+            if self.cache is not None:
+                df['ProcessedTweet'], df['Score'] = self.score_cached(df['TweetText'])
+            else:
+                df['ProcessedTweet'], df['Score'] = self.score_tweets(df['TweetText'])
+        df['Score_bins'] = pd.cut(df['Score'], bins=5, labels=SCORE_LABELS)
         return df
-    
@@ -0,0 +1,29 @@
+'''
+Fixtures shared by the tests. Synthetic tweets come from synthetic.py.
+'''
+import pytest
+
+
+class FakeClock():
+    '''
+    Time that only passes when slept through.
+    '''
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+        self.slept += seconds
+
+
+@pytest.fixture
+def clock():
+    '''
+    FakeClock starting at 0, to pass as the clock and sleep of rate limiters.
+    '''
+    return FakeClock()
@@ -0,0 +1,132 @@
+'''
+Columnar storage of scored datasets. A TweetData is saved with its processed
+tweets, scores, score bins and follow/mention flags, in score order, so a
+replay loads it back without parsing csv text or scoring anything.
+
+Files ending in .arrow are Arrow IPC files, which are memory-mapped: columns
+are only paged in when they are used. Any other file is Parquet, which is
+smaller on disk and reads only the columns asked for.
+
+The csv file is read and scored a chunk at a time (see stream.py).
+
+Usage:
+    python dataset.py CA_Super_Tuesday.csv CA_Super_Tuesday.parquet \
+        --flags "Super Tuesday"
+'''
+import argparse
+import json
+import pyarrow as pa
+import pyarrow.parquet as pq
+from analyze import TweetData
+from stream import DEFAULT_CHUNK_SIZE, stream_tweets
+from term_counts import TermCounts
+
+METADATA_KEY = b'twitter_sentiment'
+
+
+def is_arrow(path):
+    return str(path).endswith('.arrow')
+
+
+def save_scored(tweets, path):
+    '''
+    Writes the scored data of a TweetData and its search parameters.
+
+    Inputs:
+        tweets: TweetData object
+        path: (str) .arrow or .parquet file
+    '''
+    table = pa.Table.from_pandas(tweets.data, preserve_index=True)
+    params = {"search_word": tweets.query, "candidates": tweets.candidates,
+              "geocode": tweets.geocode, "result_type": tweets.result_type,
+              "since_id": tweets.since_id, "terms": tweets.terms.state()}
+    metadata = dict(table.schema.metadata or {})
+    metadata[METADATA_KEY] = json.dumps(params).encode('utf-8')
+    table = table.replace_schema_metadata(metadata)
+    if is_arrow(path):
+        with pa.OSFile(path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    else:
+        pq.write_table(table, path)
+
+
+def read_scored(path, columns=None):
+    '''
+    Reads a file written by save_scored.
+
+    Inputs:
+        path: (str) .arrow or .parquet file
+        columns: (list of str) columns to read, or None for all of them
+    Outputs:
+        (tuple) of pandas.DataFrame sorted by score and dict of search
+        parameters
+    '''
+    if is_arrow(path):
+        table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        metadata = table.schema.metadata or {}
+        if columns is not None:
+            table = pa.Table.from_arrays([table.column(c) for c in columns],
+                                         names=columns)
+    else:
+        metadata = pq.read_schema(path).metadata or {}
+        table = pq.read_table(path, columns=columns, memory_map=True)
+    if METADATA_KEY not in metadata:
+        raise ValueError("{} was not written by save_scored".format(path))
+    return table.to_pandas(), json.loads(metadata[METADATA_KEY].decode('utf-8'))
+
+
+def load_tweets(path):
+    '''
+    Outputs:
+        TweetData object over the tweets saved in path, not rescored
+    '''
+    data, params = read_scored(path)
+    # Files written before word counts were saved are counted on load
+    terms = TermCounts.from_state(params["terms"]) if "terms" in params else None
+    tweets = TweetData(data, params, scored=True, terms=terms)
+    tweets.since_id = params["since_id"]
+    return tweets
+
+
+def convert_csv(csv_path, path, search_params, update_flags=None, workers=None,
+                cache=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    Scores a csv file of tweets, such as a historical dataset, once and saves
+    the result for load_tweets.
+
+    Inputs:
+        csv_path: (str) csv file of tweets
+        path: (str) .arrow or .parquet file to write
+        search params: (dict) parameters of the search that pulled the tweets
+        update flags: (list of str) identifier of historical data topic
+        workers: (int) processes to score with, see Classifier
+        cache: (cache.ScoreCache) previously scored tweets, see Classifier
+        chunk_size: (int) rows of the csv file read and scored at a time
+    Outputs:
+        TweetData object
+    '''
+    tweets = stream_tweets(csv_path, search_params, update_flags, chunk_size,
+                           workers=workers, cache=cache)
+    if tweets is None:
+        raise ValueError("{} has no tweets".format(csv_path))
+    save_scored(tweets, path)
+    return tweets
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('csv_path')
+    parser.add_argument('path')
+    parser.add_argument('--flags', nargs='*', default=[],
+                        help='historical data topic, e.g. "Super Tuesday" or 8Ver')
+    parser.add_argument('--search-word', default='')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+    params = {"search_word": args.search_word, "q": args.search_word, "candidates": {},
+              "geocode": None, "result_type": "recent"}
+    tweets = convert_csv(args.csv_path, args.path, params, args.flags, args.workers,
+                         chunk_size=args.chunk_size)
+    print("Saved {} scored tweets to {}".format(len(tweets.data), args.path))
@@ -6,18 +6,26 @@ https://flask-wtf.readthedocs.io/en/stable/
 Jinja documentation:
 https://jinja.palletsprojects.com/en/2.11.x/
 '''
+import time
+_import_started = time.perf_counter()
+import json
+import os
+import threading
+from itertools import chain
 import flask
 from flask_wtf import FlaskForm
+from flask_wtf.csrf import generate_csrf
 from wtforms import StringField, IntegerField, SelectField, SubmitField
 from wtforms.validators import DataRequired, Optional
-from io import BytesIO
-from matplotlib import pyplot as plt
-import matplotlib
-matplotlib.use('Agg')
-import seaborn as sns
-from wordcloud import WordCloud, STOPWORDS
+from batch import load_historical, run_batch, spec_error
+from charts import ChartCache
+from jobs import JobQueue, QueueFull, DEFAULT_MAX_RUNNING, DEFAULT_MAX_PENDING
+from results import ResultStore, DEFAULT_MAX_BYTES
 from search import search_tweets
-import csv_to_tweets
+from summaries import summary_sections
+from trends import FREQUENCIES
+import metrics
+import resources
 import templates
 
 class SearchForm(FlaskForm):
@@ -52,11 +60,234 @@ class SearchForm(FlaskForm):
 app = flask.Flask('twitter_sentiment')
 # Disable the cache, ensuring up-to-date visualizations
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
+# Render charts on a background thread as soon as an analysis finishes
+app.config['PRERENDER_CHARTS'] = True
+# Rendered charts, keyed by dataset fingerprint
+charts = ChartCache()
+# Memory budget of the analysis results kept in each process, and an
+# optional directory to share results between worker processes
+app.config['RESULT_STORE_MAX_BYTES'] = DEFAULT_MAX_BYTES
+app.config['RESULT_STORE_DIR'] = os.environ.get('RESULT_STORE_DIR')
+# Scored tweets are kept across searches and replays in the SQLite file the
+# SCORE_CACHE environment variable names, see cache.configured. Replays of
+# large historical files can be scored in SCORE_WORKERS processes, see
+# Classifier.score_tweets for when that helps
 
 # Secret key required for form submission
 app.config['SECRET_KEY'] = '5b73e80c580fcb85c325e459883c7f58'
-# Initializing global TweetData object variable (to be defined in index())
-obj = ""
+# Run analyses as background jobs: a POST to / returns a job id right away
+app.config['ASYNC_JOBS'] = False
+app.config['MAX_RUNNING_JOBS'] = DEFAULT_MAX_RUNNING
+app.config['MAX_PENDING_JOBS'] = DEFAULT_MAX_PENDING
+# Stage timings and counters, served at /metrics. With METRICS on,
+# TIMING_HEADER adds a Server-Timing header to every response that is not
+# streamed (the results page is); independently,
+# PROFILE_SLOW_REQUESTS (seconds) samples each request's stack and logs where
+# requests slower than that spent their time
+app.config['METRICS'] = bool(os.environ.get('METRICS'))
+app.config['TIMING_HEADER'] = False
+app.config['PROFILE_SLOW_REQUESTS'] = None
+# Most specs one request to /batch/ may analyze
+app.config['MAX_BATCH_SPECS'] = 20
+
+# Seconds taken to import this module, to serve the first request, and to
+# load the nltk data and plotting libraries (loaded on first use)
+startup_timings = {'import': time.perf_counter() - _import_started}
+
+# Objects built from app.config the first time a request needs them, so the
+# config can still be changed after this module is imported
+_built = {}
+_built_lock = threading.Lock()
+
+
+def built(name, build):
+    '''
+    Returns build(), calling it only the first time name is needed.
+    '''
+    with _built_lock:
+        if name not in _built:
+            _built[name] = build()
+        return _built[name]
+
+
+def result_store():
+    '''
+    Outputs:
+        (ResultStore) of this process, within RESULT_STORE_MAX_BYTES and
+        spilling to RESULT_STORE_DIR if it is set
+    '''
+    return built('results', lambda: ResultStore(app.config['RESULT_STORE_MAX_BYTES'],
+                                                app.config['RESULT_STORE_DIR']))
+
+
+def job_queue():
+    '''
+    Outputs:
+        (JobQueue) running the background jobs of this process, limited by
+        MAX_RUNNING_JOBS and MAX_PENDING_JOBS
+    '''
+    return built('jobs', lambda: JobQueue(app.config['MAX_RUNNING_JOBS'],
+                                          app.config['MAX_PENDING_JOBS']))
+
+
+@app.before_request
+def start_timer():
+    flask.g.request_started = time.perf_counter()
+    metrics.enable(app.config['METRICS'])
+    if metrics.enabled:
+        metrics.start_request()
+    if app.config['PROFILE_SLOW_REQUESTS'] is not None:
+        flask.g.sampler = metrics.StackSampler(threading.get_ident())
+
+
+@app.after_request
+def log_first_request(response):
+    if 'first_request' not in startup_timings:
+        startup_timings['first_request'] = time.perf_counter() - flask.g.request_started
+        startup_timings.update(resources.timings)
+        app.logger.info("Startup timings (s): %s", startup_timings)
+    return response
+
+
+@app.after_request
+def record_request(response):
+    '''
+    Times the request, or for a streamed response (the results page) times
+    it once the whole body has been produced, which happens after this runs.
+    Streamed responses get no Server-Timing header, since their headers are
+    sent before most of their work is done.
+    '''
+    started = flask.g.request_started
+    sampler = flask.g.pop('sampler', None)
+    method, path = flask.request.method, flask.request.path
+    rule = flask.request.url_rule
+    endpoint = rule.rule if rule is not None else 'unmatched'
+
+    def finish():
+        elapsed = time.perf_counter() - started
+        if sampler is not None:
+            sampler.stop()
+            if elapsed >= app.config['PROFILE_SLOW_REQUESTS']:
+                app.logger.warning("Slow request %s %s took %.2fs, most sampled stacks:\n%s",
+                                   method, path, elapsed, sampler.report())
+        spans = metrics.finish_request() if metrics.enabled else []
+        if metrics.enabled:
+            metrics.observe('request_seconds', elapsed, endpoint=endpoint)
+            metrics.count('requests_total', endpoint=endpoint,
+                          status=str(response.status_code))
+        return spans, elapsed
+
+    if response.is_streamed:
+        # The body is produced on the request thread, so its spans are
+        # still collected until the response is closed.
+        response.call_on_close(finish)
+        return response
+    spans, elapsed = finish()
+    if metrics.enabled and app.config['TIMING_HEADER']:
+        response.headers['Server-Timing'] = metrics.server_timing(spans, elapsed)
+    return response
+
+
+def search_spec(form):
+    '''
+    Reads what to analyze out of a submitted SearchForm, so the analysis can
+    run outside of the request.
+
+    Inputs:
+        form: (SearchForm) validated form
+    Outputs:
+        (dict) with 'search_word', 'loc' and 'candidates' for a live search,
+        or 'historical' naming a historical dataset
+    '''
+    # If the user enters a search term, the app will go here and query data in real
+    # time.
+    if form.search.data:
+        # Formatting the input from the FlaskForm object so that our search functions
+        # are ready to call.
+        if not form.cityTerm.data or not form.stateTerm.data or not form.radiusVal.data:
+            loc = {}
+        else:
+            loc = {"city": form.cityTerm.data, "state": form.stateTerm.data,
+                   "radius": form.radiusVal.data}
+
+        candidates = {form.candidateTerm1.data: [form.candidateAlias1.data], 
+                      form.candidateTerm2.data: [form.candidateAlias2.data],
+                      form.candidateTerm3.data: [form.candidateAlias3.data],
+                      form.candidateTerm4.data: [form.candidateAlias4.data],
+                      form.candidateTerm5.data: [form.candidateAlias5.data]}
+        
+        candidates.pop("", None)
+        return {"search_word": form.searchTerm.data, "loc": loc,
+                "candidates": candidates}
+    # If the user does not enter  a search term and simply wants historical data,
+    # they can access 4 summaries from recent election events.
+    elif form.CA_Super_Tues.data:
+        return {"historical": "CA_Super_Tuesday"}
+    elif form.CA_Local.data:
+        return {"historical": "Local_Candidates/CA_local"}
+    elif form.March10:
+        return {"historical": "Mar10_Elections"}
+
+
+def load_tweets(spec):
+    '''
+    Pulls and scores the tweets described by a search_spec().
+
+    Outputs:
+        TweetData object
+    '''
+    if "historical" in spec:
+        return load_historical(spec["historical"])
+    if not spec["candidates"]:
+        return search_tweets(spec["search_word"], spec["loc"], result_type="recent")
+    return search_tweets(spec["search_word"], spec["loc"], result_type="recent", 
+                         candidates=spec["candidates"])
+
+
+def stream_template(name, **context):
+    '''
+    Renders a template as the response body a piece at a time, so the
+    browser gets the top of the page while generators in the context (such
+    as summary_sections) are still computing the rest. The headers, session
+    cookie included, are sent before the body.
+    '''
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(name)
+
+    def generate():
+        with metrics.span('render_template'):
+            yield from template.stream(context)
+
+    return flask.Response(flask.stream_with_context(generate()))
+
+
+def store_result(tweets):
+    '''
+    Keeps a finished analysis for the chart routes.
+
+    Outputs:
+        (str) result id
+    '''
+    result_id = result_store().put(tweets)
+    if app.config['PRERENDER_CHARTS']:
+        charts.prerender(tweets)
+    return result_id
+
+
+def run_analysis(job, spec):
+    '''
+    Background job body: publishes each summary section as soon as it is
+    computed.
+
+    Outputs:
+        (str) result id
+    '''
+    tweets = load_tweets(spec)
+    for name, summary in summary_sections(tweets):
+        job.add_section(name, summary.lines())
+    return store_result(tweets)
+
+
 # The default route
 # (handling data submitted in a form)
 @app.route('/', methods=['GET', 'POST'])
@@ -65,131 +296,206 @@ def index():
     This is what happens when a search query is entered on the Flask server.
     If the search is validated, it will call our functions to pull data from 
     Twitter, store it in a Pandas dataframe, and produce analyses of the 
-    information.
+    information. With ASYNC_JOBS set, the analysis is queued instead and the
+    job id is returned right away.
     If the search is not validated, nothing happens.
     '''
-    global obj
-
     form = SearchForm()
-    result = []
-    result1 = []
-    result2 = []
-    result3 = []
-    result4 = []
+    result_id = None
+    sections = iter(())
 
     if form.validate_on_submit():
-        # If the user enters a search term, the app will go here and query data in real
-        # time.
-        if form.search.data:
-            # Formatting the input from the FlaskForm object so that our search functions
-            # are ready to call.
-            if not form.cityTerm.data or not form.stateTerm.data or not form.radiusVal.data:
-                loc = {}
-            else:
-                loc = {"city": form.cityTerm.data, "state": form.stateTerm.data,
-                       "radius": form.radiusVal.data}
-
-            candidates = {form.candidateTerm1.data: [form.candidateAlias1.data], 
-                          form.candidateTerm2.data: [form.candidateAlias2.data],
-                          form.candidateTerm3.data: [form.candidateAlias3.data],
-                          form.candidateTerm4.data: [form.candidateAlias4.data],
-                          form.candidateTerm5.data: [form.candidateAlias5.data]}
-            
-            candidates.pop("", None)
-            if not candidates:
-                tweets = search_tweets(form.searchTerm.data, loc, result_type="recent")
-            else:
-                tweets = search_tweets(form.searchTerm.data, loc, result_type="recent", 
-                                   candidates=candidates)
-        # If the user does not enter  a search term and simply wants historical data,
-        # they can access 4 summaries from recent election events.
-        elif form.CA_Super_Tues.data:
-            tweets = csv_to_tweets.go("CA_Super_Tuesday")
-        elif form.CA_Local.data:
-            tweets = csv_to_tweets.go("Local_Candidates/CA_local")
-        elif form.March10:
-            tweets = csv_to_tweets.go("Mar10_Elections")
-        
-        obj = tweets
-        result = tweets.summarize_tweets_ab_candidates().split('\n')
-        result1 = (['\n'] + tweets.summarize_follow_data().split('\n'))
-        result2 = (['\n'] + tweets.summarize_sentiment("Follows ").split('\n'))
-        result3 = (['\n'] + tweets.summarize_sentiment("Mentions ").split('\n'))
-        result4 = (['\n'] + tweets.summarize_sentiment_by_followers_and_mentions().split('\n'))
+        spec = search_spec(form)
+        if app.config['ASYNC_JOBS']:
+            try:
+                job = job_queue().submit(run_analysis, spec)
+            except QueueFull as e:
+                return flask.jsonify(error=str(e)), 503
+            return flask.jsonify(job_id=job.id,
+                                 status_url=flask.url_for('job_status', job_id=job.id),
+                                 stream_url=flask.url_for('job_stream', job_id=job.id)), 202
+
+        tweets = load_tweets(spec)
+        sections = summary_sections(tweets)
+        # The first summary adds the mention columns, so it runs before the
+        # charts are drawn in the background; the others are computed while
+        # the page streams.
+        first = next(sections)
+        result_id = store_result(tweets)
+        flask.session['result_id'] = result_id
+        sections = chain([first], sections)
         
     else:
         pass                                              
 
-    return flask.render_template('main.html', title='Search page', form=form,
-                                 result=result, result1=result1, result2=result2,
-                                 result3=result3, result4=result4)
+    # The CSRF token goes in the session, which is sent before the page
+    generate_csrf()
+    return stream_template('main.html', title='Search page', form=form,
+                           result_id=result_id, sections=sections)
 
 
-# route for a pie chart visualization
-@app.route('/visual/', methods=['GET'])
-def visual():
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
     '''
-    Function to visualize tweet sentiment grouped by whether or not the tweet 
-    mentions a particular candidate handle or alias.
+    Stage timings and counters since the process started, in the Prometheus
+    text format. Not found unless METRICS is set.
+    '''
+    if not app.config['METRICS']:
+        flask.abort(404)
+    return flask.Response(metrics.registry.render(),
+                          mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/jobs/<job_id>/', methods=['GET'])
+def job_status(job_id):
+    '''
+    Reports the state of a background job and the sections finished so far.
+    '''
+    job = job_queue().get(job_id)
+    if job is None:
+        flask.abort(404)
+    return flask.jsonify(job.status())
+
 
-    Makes use of the TweetData object created in index()
+@app.route('/jobs/<job_id>/stream', methods=['GET'])
+def job_stream(job_id):
+    '''
+    Streams a background job as newline delimited JSON: one line per summary
+    section as soon as it is ready, then a final line with the job status.
     '''
-    img = BytesIO()
-    
-    labels = obj.data['Score_bins'].unique() 
-    colors = ['orangered', 'coral', 'tan', 'yellowgreen', 'limegreen']
-    mention_cols = [(col, col[9:]) for col in obj.data.columns if 'Mentions @' in col]
+    job = job_queue().get(job_id)
+    if job is None:
+        flask.abort(404)
 
-    fig, axs = plt.subplots(1, len(mention_cols), figsize=(15,4), constrained_layout=True)
-    fig.suptitle('Tweets Mentioning:', fontsize=15)
+    def generate():
+        sent = 0
+        while True:
+            job.wait(sent)
+            status = job.status()
+            for name, lines in list(status['sections'].items())[sent:]:
+                yield json.dumps({'section': name, 'lines': lines}) + '\n'
+                sent += 1
+            if status['state'] in ('done', 'failed'):
+                del status['sections']
+                yield json.dumps(status) + '\n'
+                return
 
-    for i, (col, handle) in enumerate(mention_cols):
-        filtered = obj.data[obj.data[col] == True]
-        frac = (filtered.groupby('Score_bins').size()/len(filtered)).fillna(0)
-        if (frac == 0).all():
-            axs[i].text(-0.5, 0.70, 'Whoops! No tweets in your search \n mentioned {}!'.format(handle))
-        axs[i].pie(frac, colors=colors, pctdistance=0.85, radius=1.25, startangle=90,\
-                         autopct=lambda p: '{:.1f}%'.format(round(p)) if p > 0 else '')
-        circle = plt.Circle((0,0),0.70,fc='white') 
-        axs[i].add_artist(circle)
-        axs[i].set_title('{} \n Number of tweets: {}'.format(handle, len(filtered)))
-        axs[i].axis('equal')
+    return flask.Response(generate(), mimetype='application/x-ndjson')
 
-    fig.legend(labels=labels, loc='lower center', ncol=5)
-    fig.savefig(img, format='png')
-    img.seek(0)
 
-    return flask.send_file(img, mimetype='image/png')
+def send_chart(name, result_id):
+    '''
+    Serves a cached chart of a TweetData object created in index(), by
+    default the latest one of this session. The ETag changes only with the
+    dataset, so browsers can revalidate with a conditional GET and get a 304
+    instead of the image.
+    '''
+    tweets = requested_result(result_id)
+    png, etag = charts.get(tweets, name)
+    response = flask.Response(png, mimetype='image/png')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(flask.request)
+
+
+def requested_result(result_id):
+    '''
+    TweetData object of a result id, by default the latest one of this
+    session, or a 404.
+    '''
+    tweets = result_store().get(result_id or flask.session.get('result_id', ''))
+    if tweets is None:
+        flask.abort(404)
+    return tweets
+
+
+# route for a pie chart visualization
+@app.route('/visual/', methods=['GET'])
+@app.route('/visual/<result_id>/', methods=['GET'])
+def visual(result_id=None):
+    '''
+    Function to visualize tweet sentiment grouped by whether or not the tweet 
+    mentions a particular candidate handle or alias.
+
+    Makes use of a TweetData object created in index()
+    '''
+    return send_chart('visual', result_id)
 
 # Route for a word cloud visualization
 @app.route('/wordcloud/', methods=['GET'])
-def wordcloud():
+@app.route('/wordcloud/<result_id>/', methods=['GET'])
+def wordcloud(result_id=None):
     '''
     Function to visualize a word cloud of the 250 most frequently occurring
     words in the tweet data pulled from the user request.
 
-    Makes use of the TweetData object created in index()
+    Makes use of a TweetData object created in index()
     '''
-    img = BytesIO()
-    all_text = obj.data['TweetText'].sum().replace('\n', '')
+    return send_chart('wordcloud', result_id)
 
-    fig = plt.figure(figsize = (10,10))
-    search_terms = obj.query.split()
-    stopwords = set(STOPWORDS).union(set(search_terms))
-    wordcloud = WordCloud(background_color='white',
-                          stopwords=stopwords, 
-                          max_words = 250, 
-                          max_font_size = 30,
-                          colormap='tab10').generate(all_text) 
 
-    plt.imshow(wordcloud) 
-    plt.title("Word Cloud for Your Search!", fontsize = 18) 
-    plt.axis('off') 
-    fig.savefig(img, format='png')
-    img.seek(0)
+# Route for a trend chart of sentiment over time
+@app.route('/trend/', methods=['GET'])
+@app.route('/trend/<result_id>/', methods=['GET'])
+def trend(result_id=None):
+    '''
+    Function to visualize mean sentiment and tweet counts over time, for all
+    tweets and for the tweets mentioning each candidate.
+
+    Makes use of a TweetData object created in index()
+    '''
+    return send_chart('trend', result_id)
+
+
+# JSON API for sentiment over time
+@app.route('/trends/', methods=['GET'])
+@app.route('/trends/<result_id>/', methods=['GET'])
+def trends_json(result_id=None):
+    '''
+    Tweet counts, mean score and Score_bins counts per time window, for all
+    tweets and for the tweets mentioning each candidate. Query parameters:
+    freq (minute, hour or day, by default the finest that spans the tweets
+    in at most 240 windows) and window (rolling sum over that many windows,
+    by default 1).
+    '''
+    tweets = requested_result(result_id)
+    trends = tweets.trends()
+    if trends is None:
+        return flask.jsonify(error="These tweets have no times"), 404
+    freq = flask.request.args.get('freq') or trends.choose_freq()
+    window = flask.request.args.get('window', 1, type=int)
+    if freq not in FREQUENCIES or window < 1:
+        return flask.jsonify(error="freq must be one of {} and window at least 1"
+                             .format(', '.join(FREQUENCIES))), 400
+    return flask.jsonify(trends.to_json(freq, window))
+
+
+# Batch API comparing several searches or historical datasets
+@app.route('/batch/', methods=['POST'])
+def batch():
+    '''
+    Analyzes a JSON list of specs, {"specs": [...]}, each with search_word,
+    loc and candidates like the search form, or historical naming a dataset,
+    and an optional label. Tweets pulled by more than one search are scored
+    once. Returns every spec's summaries and result id (for the chart
+    routes) and a table comparing the specs.
+    '''
+    specs = (flask.request.get_json(silent=True) or {}).get('specs')
+    if not isinstance(specs, list) or not specs:
+        return flask.jsonify(error="specs must be a list of searches or historical "
+                                   "datasets"), 400
+    if len(specs) > app.config['MAX_BATCH_SPECS']:
+        return flask.jsonify(error="at most {} specs per batch".format(
+            app.config['MAX_BATCH_SPECS'])), 400
+    for i, spec in enumerate(specs):
+        error = spec_error(spec)
+        if error is not None:
+            return flask.jsonify(error="spec {}: {}".format(i, error)), 400
+    result = run_batch(specs)
+    result_ids = [store_result(tweets) if tweets is not None else None
+                  for tweets in result.tweets]
+    return flask.jsonify(result.to_json(result_ids))
 
-    return flask.send_file(img, mimetype='image/png')
-    
 
 # Entry point for the app
 if __name__ == '__main__':
@@ -0,0 +1,118 @@
+'''
+Offline stand-in for the parts of tweepy.API the app uses, so searches and
+follow lookups can be exercised and benchmarked without Twitter, including
+what happens when an endpoint's rate limit runs out.
+'''
+import datetime
+import hashlib
+import threading
+import time
+from types import SimpleNamespace
+
+WORDS = ["vote", "election", "primary", "debate", "great", "terrible", "love",
+         "hate", "not", "very", "tonight", "results", "polls", "win", "lose"]
+LOCATIONS = ["New York, NY", "Los Angeles, CA", "Chicago, IL", "Austin, TX", ""]
+FIRST_TWEET_TIME = datetime.datetime(2020, 3, 3, 12, 0)
+
+
+class RateLimitError(Exception):
+    '''
+    Raised like tweepy.RateLimitError once an endpoint's calls for the
+    current window are used up.
+    '''
+    api_code = 88
+
+
+class FakeAPI():
+    '''
+    Answers show_friendship, get_user and search deterministically after a
+    simulated network latency, counting the calls it receives. Endpoints
+    given limits allow that many calls per fixed window, like Twitter, and
+    raise RateLimitError beyond them.
+    '''
+
+    def __init__(self, latency=0.05, follow_rate=0.3, fail_rate=0.0, seed=0,
+                 limits=None, n_tweets=1000, n_authors=500, clock=time.monotonic):
+        '''
+        Inputs:
+            latency: (float) seconds each call takes
+            follow_rate: (float) fraction of (user, candidate) pairs that follow
+            fail_rate: (float) fraction of show_friendship calls that raise
+            seed: (int) changes which pairs follow and which calls fail
+            limits: (dict) of endpoint to calls allowed and window in
+                    seconds, endpoints left out are unlimited
+            n_tweets: (int) tweets every search matches, with ids 1 to n_tweets
+            n_authors: (int) distinct users the tweets are by
+            clock: (callable) time source of the rate limit windows
+        '''
+        self.latency = latency
+        self.follow_rate = follow_rate
+        self.fail_rate = fail_rate
+        self.seed = seed
+        self.limits = limits or {}
+        self.n_tweets = n_tweets
+        self.n_authors = n_authors
+        self.clock = clock
+        self.calls = {'show_friendship': 0, 'get_user': 0, 'search': 0}
+        self.rejected = {endpoint: 0 for endpoint in self.calls}
+        self.windows = {}
+        self.lock = threading.Lock()
+
+    def draw(self, *key):
+        '''
+        Deterministic pseudo-random number in [0, 1) for key.
+        '''
+        digest = hashlib.md5(repr((self.seed,) + key).encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], 'big') / 2 ** 64
+
+    def call(self, endpoint):
+        with self.lock:
+            self.calls[endpoint] += 1
+            if endpoint in self.limits:
+                allowed, window = self.limits[endpoint]
+                now = self.clock()
+                start, used = self.windows.get(endpoint, (None, 0))
+                if start is None or now - start >= window:
+                    start, used = now, 0
+                if used >= allowed:
+                    self.rejected[endpoint] += 1
+                    raise RateLimitError("Rate limit exceeded for {}".format(endpoint))
+                self.windows[endpoint] = (start, used + 1)
+        time.sleep(self.latency)
+
+    def show_friendship(self, source_id, target_id):
+        self.call('show_friendship')
+        if self.draw('fail', source_id, target_id) < self.fail_rate:
+            raise RuntimeError("simulated friendships/show failure")
+        follows = self.draw('follows', source_id, target_id) < self.follow_rate
+        source = SimpleNamespace(id=source_id, following=follows, followed_by=False)
+        target = SimpleNamespace(id=target_id, following=False, followed_by=follows)
+        return source, target
+
+    def get_user(self, screen_name):
+        self.call('get_user')
+        return SimpleNamespace(id=int(self.draw('user', screen_name.lower()) * 10 ** 12),
+                               screen_name=screen_name.lstrip('@'))
+
+    def status(self, tweet_id, q):
+        '''
+        The tweet with tweet_id, containing the search words.
+        '''
+        words = [WORDS[int(self.draw('word', tweet_id, i) * len(WORDS))]
+                 for i in range(1 + int(self.draw('length', tweet_id) * 12))]
+        user_id = int(self.draw('author', tweet_id) * self.n_authors)
+        user = SimpleNamespace(id=user_id, location=LOCATIONS[user_id % len(LOCATIONS)])
+        return SimpleNamespace(
+            id=tweet_id, full_text=' '.join([q.split(' -')[0]] + words), user=user,
+            created_at=FIRST_TWEET_TIME + datetime.timedelta(seconds=30 * tweet_id),
+            favorite_count=int(self.draw('favorites', tweet_id) * 50),
+            retweet_count=int(self.draw('retweets', tweet_id) * 20))
+
+    def search(self, q, count=15, since_id=None, max_id=None, **params):
+        '''
+        One page of matching tweets, newest (highest id) first.
+        '''
+        self.call('search')
+        newest = self.n_tweets if max_id is None else min(max_id, self.n_tweets)
+        oldest = max(since_id or 0, newest - count)
+        return [self.status(tweet_id, q) for tweet_id in range(newest, oldest, -1)]
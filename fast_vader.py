@@ -0,0 +1,225 @@
+'''
+VADER compound scores for a whole column of processed tweets at once.
+
+SentimentIntensityAnalyzer.polarity_scores tokenizes and looks up every
+tweet in Python and also works out the pos, neg and neu scores nobody reads.
+FastVader loads the lexicon into arrays once, tokenizes a batch into one
+array of word codes and applies the booster, negation, "least" and idiom
+rules to every position with NumPy, reproducing polarity_scores(text)
+['compound'] exactly, including its quirk of scoring a repeated word as if
+it were at its first position.
+
+Processed tweets are lowercase letters and spaces. Any other text (capitals,
+punctuation and so on, which change the score in ways that depend on the
+whole tweet) is passed to polarity_scores. So are tweets containing "but",
+whose rule differs between nltk versions; "but" is a stopword, so these are
+rare.
+'''
+import numpy as np
+import pandas as pd
+
+NORMALIZE_ALPHA = 15
+
+
+class FastVader():
+    '''
+    Batch scorer equivalent to an nltk SentimentIntensityAnalyzer.
+    '''
+
+    def __init__(self, analyzer):
+        '''
+        Inputs:
+            analyzer: (SentimentIntensityAnalyzer) whose lexicon and rules to
+                      apply
+        '''
+        import nltk.sentiment.vader as vader
+        self.analyzer = analyzer
+        # nltk 3.4 keeps the rule constants in the module, later versions on
+        # the analyzer.
+        constants = getattr(analyzer, 'constants', vader)
+        self.n_scalar = constants.N_SCALAR
+        self.b_decr = constants.B_DECR
+        self.booster = constants.BOOSTER_DICT
+        self.negate = constants.NEGATE
+        self.idioms = constants.SPECIAL_CASE_IDIOMS
+
+    def word_arrays(self, words):
+        '''
+        Per word properties, at the position of the word in words.
+
+        Inputs:
+            words: (list of str) distinct words of a batch
+        Outputs:
+            (dict) of numpy arrays
+        '''
+        lexicon = self.analyzer.lexicon
+        return {
+            'plain': np.array([w.isalpha() and w.islower() for w in words], dtype=bool),
+            'in_lexicon': np.array([w in lexicon for w in words], dtype=bool),
+            'valence': np.array([lexicon.get(w, 0.0) for w in words], dtype=float),
+            'is_booster': np.array([w in self.booster for w in words], dtype=bool),
+            'booster': np.array([self.booster.get(w, 0.0) for w in words], dtype=float),
+            'negated': np.array([w in self.negate or "n't" in w for w in words],
+                                dtype=bool),
+        }
+
+    def polarity_compound(self, texts):
+        '''
+        Inputs:
+            texts: (list of str) processed tweets
+        Outputs:
+            (numpy.ndarray of float) compound score of each tweet
+        '''
+        n_texts = len(texts)
+        scores = np.zeros(n_texts)
+        if n_texts == 0:
+            return scores
+        split = [text.split() for text in texts]
+        lengths = np.fromiter((len(words) for words in split), dtype=np.int64,
+                              count=n_texts)
+        flat = [w for words in split for w in words]
+        codes, words = pd.factorize(pd.Series(flat, dtype=object), sort=False)
+        words = list(words)
+        props = self.word_arrays(words)
+        code_of = {w: i for i, w in enumerate(words)}
+
+        def code(word):
+            return code_of.get(word, -1)
+
+        rows = np.repeat(np.arange(n_texts), lengths)
+        # Texts with anything but lowercase words, or with "but", go to nltk.
+        slow = np.zeros(n_texts, dtype=bool)
+        slow[rows[~props['plain'][codes]]] = True
+        if code('but') >= 0:
+            slow[rows[codes == code('but')]] = True
+        # One letter words are dropped before scoring.
+        keep = np.array([len(w) > 1 for w in words], dtype=bool)[codes] & ~slow[rows]
+        codes, rows = codes[keep], rows[keep]
+        lengths = np.bincount(rows, minlength=n_texts)
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        pos = np.arange(len(codes)) - starts[rows]
+        ends = lengths[rows]
+
+        sentiments = self.valences(codes, pos, ends, props, code)
+        # A repeated word is scored as at its first position in the tweet.
+        key = rows * len(words) + codes
+        _, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+        sentiments = sentiments[first[inverse.ravel()]]
+
+        # Summed left to right, like sum() on the list of sentiments.
+        totals = np.zeros(n_texts)
+        for j in range(int(lengths.max()) if len(lengths) else 0):
+            has = lengths > j
+            totals[has] += sentiments[starts[has] + j]
+        compound = totals / np.sqrt(totals * totals + NORMALIZE_ALPHA)
+        scores = np.array([round(c, 4) for c in compound.tolist()])
+        for i in np.flatnonzero(slow):
+            scores[i] = self.analyzer.polarity_scores(texts[i])['compound']
+        return scores
+
+    def valences(self, codes, pos, ends, props, code):
+        '''
+        sentiment_valence of every word as if it were the word at its
+        position, for every position of a batch at once.
+
+        Inputs:
+            codes: (numpy.ndarray of int) word at each position
+            pos: (numpy.ndarray of int) position of the word in its tweet
+            ends: (numpy.ndarray of int) number of words in its tweet
+            props: (dict) from word_arrays
+            code: (callable) word to code, -1 if not in the batch
+        Outputs:
+            (numpy.ndarray of float)
+        '''
+        n = len(codes)
+
+        def neighbour(offset):
+            # Code of the word offset positions away, -1 outside the tweet.
+            at = np.arange(n) + offset
+            valid = (pos + offset >= 0) & (pos + offset < ends)
+            return np.where(valid, codes[np.clip(at, 0, max(n - 1, 0))], -1)
+
+        def prop(name, codes):
+            values = props[name][np.maximum(codes, 0)]
+            return np.where(codes >= 0, values, np.zeros_like(values))
+
+        def is_word(codes, *words):
+            found = np.zeros(len(codes), dtype=bool)
+            for word in words:
+                if code(word) >= 0:
+                    found |= codes == code(word)
+            return found
+
+        prev = {k: neighbour(-k) for k in (1, 2, 3)}
+        following = {k: neighbour(k) for k in (1, 2)}
+        in_lexicon = props['in_lexicon'][codes]
+        skipped = props['is_booster'][codes] | \
+            (is_word(codes, 'kind') & is_word(following[1], 'of'))
+        scored = in_lexicon & ~skipped
+        valence = props['valence'][codes].copy()
+        so_this = {k: is_word(prev[k], 'so', 'this') for k in (1, 2)}
+
+        for start_i, damp in ((0, 1.0), (1, 0.95), (2, 0.9)):
+            before = prev[start_i + 1]
+            applies = scored & (pos > start_i) & ~prop('in_lexicon', before)
+            s = np.where(valence < 0, -prop('booster', before), prop('booster', before))
+            if damp != 1.0:
+                s = np.where(s != 0, s * damp, s)
+            valence = np.where(applies, valence + s, valence)
+            negated = prop('negated', before)
+            if start_i == 0:
+                valence = np.where(applies & negated, valence * self.n_scalar, valence)
+            elif start_i == 1:
+                never_so = is_word(prev[2], 'never') & so_this[1]
+                valence = np.where(applies & never_so, valence * 1.5,
+                                   np.where(applies & negated,
+                                            valence * self.n_scalar, valence))
+            else:
+                never_so = (is_word(prev[3], 'never') & so_this[2]) | so_this[1]
+                valence = np.where(applies & never_so, valence * 1.25,
+                                   np.where(applies & negated,
+                                            valence * self.n_scalar, valence))
+                valence = self.idioms_check(valence, applies, codes, prev, following,
+                                            code, is_word)
+
+        least = scored & is_word(prev[1], 'least') & ~prop('in_lexicon', prev[1])
+        least &= (pos == 1) | ((pos > 1) & ~is_word(prev[2], 'at', 'very'))
+        valence = np.where(least, valence * self.n_scalar, valence)
+        return np.where(scored, valence, 0.0)
+
+    def idioms_check(self, valence, applies, codes, prev, following, code, is_word):
+        '''
+        _idioms_check for the positions in applies.
+        '''
+        def present(phrases):
+            # Only phrases whose words all occur in the batch can match.
+            return [phrase for phrase in phrases
+                    if all(code(word) >= 0 for word in phrase.split(' '))]
+
+        def matches(phrase, window):
+            words = phrase.split(' ')
+            found = applies.copy()
+            if len(words) != len(window):
+                return found & False
+            for word, at in zip(words, window):
+                found &= at == code(word)
+            return found
+
+        idioms = {phrase: self.idioms[phrase] for phrase in present(self.idioms)}
+
+        # The first of these to match wins, then the two looking ahead.
+        sequences = [(prev[1], codes), (prev[2], prev[1], codes), (prev[2], prev[1]),
+                     (prev[3], prev[2], prev[1]), (prev[3], prev[2])]
+        idiom = np.full(len(codes), np.nan)
+        for window in reversed(sequences):
+            for phrase, value in idioms.items():
+                idiom = np.where(matches(phrase, window), value, idiom)
+        for window in [(codes, following[1]), (codes, following[1], following[2])]:
+            for phrase, value in idioms.items():
+                idiom = np.where(matches(phrase, window), value, idiom)
+        valence = np.where(np.isnan(idiom), valence, idiom)
+
+        bigram = np.zeros(len(codes), dtype=bool)
+        for phrase in present(p for p in self.booster if ' ' in p):
+            bigram |= matches(phrase, (prev[3], prev[2])) | matches(phrase, (prev[2], prev[1]))
+        return np.where(bigram, valence + self.b_decr, valence)
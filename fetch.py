@@ -0,0 +1,251 @@
+'''
+Rate limit aware access to the Twitter endpoints a search uses. Each
+endpoint has a friends.RateLimiter allowing its quota in any window, so the
+calls never go over Twitter's fixed windows. Search pages are pulled before
+any follow relationship is looked up, and calls that cannot be made before
+a deadline are given up, so a search returns the tweets and follow
+relationships it has instead of blocking a web request until the window
+resets. Candidate user ids are kept in SQLite, so a search spends no
+get_user calls on candidates it has seen before.
+'''
+import sqlite3
+import threading
+import time
+import metrics
+from friends import FriendshipLookup, RateLimiter, rate_limited
+
+# Calls allowed and window in seconds of each endpoint, Twitter's user
+# authentication limits
+LIMITS = {'search': (180, 15 * 60),
+          'get_user': (900, 15 * 60),
+          'show_friendship': (180, 15 * 60)}
+# Fraction of each window added to it, so calls delayed on their way to the
+# API still land in the window they were counted in
+WINDOW_MARGIN = 0.01
+# Most tweets api.search returns per page
+PAGE_SIZE = 100
+DEFAULT_USER_IDS_PATH = 'user_ids.sqlite'
+DEFAULT_USER_ID_TTL = 30 * 24 * 60 * 60
+
+
+class Scheduler():
+    '''
+    Rate limit of each endpoint. Twitter counts each endpoint's calls
+    separately, so the endpoints never wait on each other.
+    '''
+
+    def __init__(self, limits=LIMITS, clock=time.monotonic, sleep=time.sleep):
+        '''
+        Inputs:
+            limits: (dict) of endpoint to calls allowed and window in seconds
+            clock: (callable) time source, for tests
+            sleep: (callable) waits a number of seconds, for tests
+        '''
+        self.limiters = {endpoint: RateLimiter(calls, period * (1 + WINDOW_MARGIN),
+                                               clock, sleep)
+                         for endpoint, (calls, period) in limits.items()}
+        self.clock = clock
+
+    def acquire(self, endpoint, deadline=None):
+        '''
+        Waits for a call to endpoint to be allowed.
+
+        Inputs:
+            endpoint: (str) key of the limits
+            deadline: (float) clock() time to give up at, or None to wait as
+                      long as it takes
+        Outputs:
+            (bool) True once the call may be made, False if it could not be
+            made before deadline
+        '''
+        if self.limiters[endpoint].acquire(deadline):
+            return True
+        metrics.count('rate_limit_giveups_total', endpoint=endpoint)
+        return False
+
+    def exhausted(self, endpoint):
+        '''
+        Waits a whole window before the next call to endpoint, after the API
+        reports its limit reached (by calls made elsewhere).
+        '''
+        self.limiters[endpoint].exhausted()
+
+    def limiter(self, endpoint):
+        '''
+        Outputs:
+            friends.RateLimiter of endpoint, e.g. for
+            friends.FriendshipLookup
+        '''
+        return self.limiters[endpoint]
+
+    def remaining(self):
+        '''
+        Outputs:
+            (dict) of endpoint to the calls that can be made right now
+        '''
+        return {endpoint: limiter.remaining()
+                for endpoint, limiter in self.limiters.items()}
+
+
+def screen_name_key(screen_name):
+    return screen_name.lstrip('@').lower()
+
+
+class UserIds():
+    '''
+    On-disk map of screen name to user id, each trusted for ttl seconds.
+    The database is opened on the first lookup, not when it is created.
+    '''
+
+    def __init__(self, path=DEFAULT_USER_IDS_PATH, ttl=DEFAULT_USER_ID_TTL):
+        '''
+        Inputs:
+            path: (str) SQLite file, ':memory:' for a throwaway cache
+            ttl: (float) seconds a user id is trusted
+        '''
+        self.path = path
+        self.ttl = ttl
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def connection(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS user_ids (
+                                     screen_name TEXT PRIMARY KEY,
+                                     user_id INTEGER NOT NULL,
+                                     updated REAL NOT NULL)''')
+            self.conn.commit()
+        return self.conn
+
+    def get_many(self, screen_names):
+        '''
+        Inputs:
+            screen_names: (list of str) with or without the leading @
+        Outputs:
+            (dict) of screen name as given to user id, for those known
+        '''
+        keys = {screen_name_key(name): name for name in screen_names}
+        with self.lock:
+            rows = self.connection().execute(
+                'SELECT screen_name, user_id FROM user_ids WHERE updated > ? AND '
+                'screen_name IN ({})'.format(','.join('?' * len(keys))),
+                [time.time() - self.ttl] + list(keys)).fetchall()
+        return {keys[key]: user_id for key, user_id in rows}
+
+    def put(self, screen_name, user_id):
+        with self.lock:
+            conn = self.connection()
+            conn.execute('INSERT OR REPLACE INTO user_ids VALUES (?, ?, ?)',
+                         (screen_name_key(screen_name), user_id, time.time()))
+            conn.commit()
+
+
+class Fetcher():
+    '''
+    Makes the calls of a search through a Scheduler: candidate ids, then
+    the pages of search results, then follow relationships with whatever
+    time is left, each within the deadline of the search.
+    '''
+
+    def __init__(self, api, scheduler=None, user_ids=None, friend_lookup=None):
+        '''
+        Inputs:
+            api: (tweepy.API or fake_api.FakeAPI)
+            scheduler: (Scheduler) defaults to Twitter's limits
+            user_ids: (UserIds) defaults to one in DEFAULT_USER_IDS_PATH
+            friend_lookup: (friends.FriendshipLookup) defaults to one
+                           limited by the scheduler's show_friendship limit
+        '''
+        self.api = api
+        self.scheduler = scheduler or Scheduler()
+        self.user_ids = user_ids or UserIds()
+        self.friend_lookup = friend_lookup or FriendshipLookup(
+            api, limiter=self.scheduler.limiter('show_friendship'),
+            clock=self.scheduler.clock)
+
+    def deadline(self, timeout):
+        '''
+        Outputs:
+            (float) scheduler clock time timeout seconds from now, or None
+            if timeout is None
+        '''
+        return None if timeout is None else self.scheduler.clock() + timeout
+
+    def call(self, endpoint, deadline=None, **params):
+        '''
+        Calls an api method once the scheduler allows it, again whenever the
+        API reports its rate limit reached.
+
+        Outputs:
+            what the method returns, or None if it could not be called
+            before deadline
+        '''
+        while self.scheduler.acquire(endpoint, deadline):
+            metrics.count('api_calls_total', endpoint=endpoint)
+            try:
+                return getattr(self.api, endpoint)(**params)
+            except Exception as error:
+                if not rate_limited(error):
+                    raise
+                self.scheduler.exhausted(endpoint)
+                metrics.count('rate_limited_total', endpoint=endpoint)
+        return None
+
+    def candidate_ids(self, screen_names, deadline=None):
+        '''
+        Inputs:
+            screen_names: (list of str) candidate handles
+            deadline: (float) from deadline(), or None
+        Outputs:
+            (list) user id of each candidate, None if it is not cached and
+            could not be looked up in time
+        '''
+        known = self.user_ids.get_many(screen_names)
+        metrics.count('cache_lookups_total', len(known), cache='user_ids', result='hit')
+        metrics.count('cache_lookups_total', len(screen_names) - len(known),
+                      cache='user_ids', result='miss')
+        ids = []
+        for screen_name in screen_names:
+            if screen_name not in known:
+                user = self.call('get_user', deadline, screen_name=screen_name)
+                if user is not None:
+                    known[screen_name] = user.id
+                    self.user_ids.put(screen_name, user.id)
+            ids.append(known.get(screen_name))
+        return ids
+
+    def search(self, tweets_to_pull, deadline=None, since_id=None, **params):
+        '''
+        Pages through api.search newest tweet first, as tweepy.Cursor does,
+        one scheduled call per page.
+
+        Inputs:
+            tweets_to_pull: (int) tweet limit
+            deadline: (float) from deadline(), or None
+            since_id: (int) only pull tweets newer than this one, or None
+            params: other keyword arguments of api.search
+        Outputs:
+            (tuple) of the list of tweets and whether the search ran to the
+            end, False if it stopped early on the rate limit
+        '''
+        pulled = []
+        max_id = None
+        with metrics.span('search'):
+            while len(pulled) < tweets_to_pull:
+                page = self.call('search', deadline,
+                                 count=min(PAGE_SIZE, tweets_to_pull - len(pulled)),
+                                 since_id=since_id, max_id=max_id, **params)
+                if page is None:
+                    return pulled, False
+                if not page:
+                    break
+                pulled.extend(page[:tweets_to_pull - len(pulled)])
+                max_id = min(t.id for t in page) - 1
+        return pulled, True
+
+    def friendships(self, user_ids, candidate_ids, deadline=None):
+        '''
+        See friends.FriendshipLookup.lookup_many.
+        '''
+        return self.friend_lookup.lookup_many(user_ids, candidate_ids, deadline)
@@ -0,0 +1,196 @@
+'''
+Batched lookup of whether tweet authors follow candidates. User ids are
+deduplicated across a batch, known relationships are cached for a while,
+and the remaining api.show_friendship calls run concurrently under a rate
+limit. Lookups that cannot be made before a deadline are left unknown.
+'''
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_TTL = 6 * 60 * 60
+# Twitter allows 180 friendships/show calls per 15 minute window.
+SHOW_FRIENDSHIP_CALLS = 180
+SHOW_FRIENDSHIP_WINDOW = 15 * 60
+# Twitter's error code for "Rate limit exceeded"
+RATE_LIMIT_CODE = 88
+
+
+def rate_limited(error):
+    '''
+    Whether an API error reports a used up rate limit, from tweepy
+    (tweepy.RateLimitError) or fake_api.FakeAPI.
+    '''
+    return getattr(error, 'api_code', None) == RATE_LIMIT_CODE or \
+        getattr(getattr(error, 'response', None), 'status_code', None) == 429
+
+
+class RateLimiter():
+    '''
+    Allows at most `calls` acquisitions in any `period` seconds, blocking
+    callers until a slot frees up.
+    '''
+
+    def __init__(self, calls, period, clock=time.monotonic, sleep=time.sleep):
+        self.calls = calls
+        self.period = period
+        self.clock = clock
+        self.sleep = sleep
+        self.times = deque()
+        self.lock = threading.Lock()
+
+    def acquire(self, deadline=None):
+        '''
+        Inputs:
+            deadline: (float) clock() time to give up at, or None to wait as
+                      long as it takes
+        Outputs:
+            (bool) True once a call may be made, False if none can be made
+            before deadline
+        '''
+        while True:
+            with self.lock:
+                now = self.clock()
+                while self.times and now - self.times[0] >= self.period:
+                    self.times.popleft()
+                if len(self.times) < self.calls:
+                    self.times.append(now)
+                    return True
+                wait = self.period - (now - self.times[0])
+            if deadline is not None and now + wait > deadline:
+                return False
+            self.sleep(wait)
+
+    def remaining(self):
+        '''
+        Outputs:
+            (int) calls that can be made right now
+        '''
+        with self.lock:
+            now = self.clock()
+            return self.calls - sum(1 for t in self.times if now - t < self.period)
+
+    def exhausted(self):
+        '''
+        Treats the window as used up, after the API reports its limit
+        reached.
+        '''
+        with self.lock:
+            if self.calls != float('inf'):
+                now = self.clock()
+                self.times.extend([now] * max(0, self.calls - len(self.times)))
+
+
+class FriendshipLookup():
+    '''
+    Cached, concurrent replacement for calling api.show_friendship once per
+    tweet and candidate.
+    '''
+
+    def __init__(self, api, max_workers=DEFAULT_MAX_WORKERS, ttl=DEFAULT_TTL,
+                 limiter=None, clock=time.monotonic):
+        '''
+        Inputs:
+            api: (tweepy.API or fake_api.FakeAPI)
+            max_workers: (int) concurrent show_friendship calls
+            ttl: (float) seconds a known relationship is trusted
+            limiter: (RateLimiter) defaults to Twitter's friendships/show
+                     limit
+            clock: (callable) time source, for tests
+        '''
+        self.api = api
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self.limiter = limiter or RateLimiter(SHOW_FRIENDSHIP_CALLS,
+                                              SHOW_FRIENDSHIP_WINDOW)
+        self.clock = clock
+        self.known = {}
+        self.lock = threading.Lock()
+        self.api_calls = 0
+
+    def cached(self, user_id, candidate_id):
+        with self.lock:
+            entry = self.known.get((user_id, candidate_id))
+        if entry is None or entry[1] < self.clock():
+            return None
+        return entry[0]
+
+    def follows(self, user_id, candidate_id, deadline=None):
+        '''
+        Asks the API whether user_id follows candidate_id.
+
+        Inputs:
+            deadline: (float) clock() time to give up waiting on the rate
+                      limit at, or None
+        Outputs:
+            (bool) or None if the call failed or could not be made in time
+        '''
+        if candidate_id is None:
+            return None
+        while self.limiter.acquire(deadline):
+            with self.lock:
+                self.api_calls += 1
+            metrics.count('api_calls_total', endpoint='show_friendship')
+            try:
+                followed_by = self.api.show_friendship(
+                    source_id=user_id, target_id=candidate_id)[1].followed_by
+            except Exception as error:
+                if rate_limited(error):
+                    # Asked again once the limiter allows another call
+                    self.limiter.exhausted()
+                    continue
+                return None
+            with self.lock:
+                self.known[(user_id, candidate_id)] = (followed_by,
+                                                       self.clock() + self.ttl)
+            return followed_by
+        return None
+
+    def lookup_many(self, user_ids, candidate_ids, deadline=None):
+        '''
+        Follow relationships of every user with every candidate.
+
+        Inputs:
+            user_ids: (iterable) users who tweeted, duplicates allowed
+            candidate_ids: (list) candidate user_ids, None for a candidate
+                           whose id is unknown
+            deadline: (float) clock() time after which lookups still waiting
+                      on the rate limit are left unknown, or None
+        Outputs:
+            (dict) of user id to list of bool, whether or not the user is
+            following the candidate at the same index in candidate_ids, or a
+            list of None if any lookup for that user failed
+        '''
+        with metrics.span('friendships'):
+            return self.lookup_users(list(dict.fromkeys(user_ids)), candidate_ids,
+                                     deadline)
+
+    def lookup_users(self, users, candidate_ids, deadline=None):
+        '''
+        lookup_many for a list of distinct users.
+        '''
+        answers = {}
+        missing = []
+        for user_id in users:
+            for candidate_id in candidate_ids:
+                known = self.cached(user_id, candidate_id)
+                if known is None:
+                    missing.append((user_id, candidate_id))
+                else:
+                    answers[(user_id, candidate_id)] = known
+        metrics.count('cache_lookups_total', len(answers), cache='friendships', result='hit')
+        metrics.count('cache_lookups_total', len(missing), cache='friendships',
+                      result='miss')
+        if missing:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                found = pool.map(lambda pair: self.follows(*pair, deadline), missing)
+                answers.update(zip(missing, found))
+
+        friends = {}
+        for user_id in users:
+            row = [answers[(user_id, c)] for c in candidate_ids]
+            friends[user_id] = [None] * len(candidate_ids) if None in row else row
+        return friends
@@ -0,0 +1,102 @@
+'''
+Index of US city coordinates for building search geocodes. The city file
+is only read the first time a location is looked up, and the parsed index
+can be saved next to it in a binary file that loads much faster than the
+csv.
+'''
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS_MILES = 3958.8
+
+
+def normalize(name):
+    '''
+    Key used to match city and state names regardless of case and spacing.
+    '''
+    return ' '.join(str(name).split()).casefold()
+
+
+class GeocodeIndex():
+    '''
+    (city, state) -> (lat, lng) lookups in O(1) and nearest city to a point,
+    over the rows of uscities.csv (columns city, state_id, lat, lng).
+    '''
+
+    def __init__(self, csv_path, cache_path=None):
+        '''
+        Inputs:
+            csv_path: (str) city file
+            cache_path: (str) .npz file to load the index from and save it to,
+                        or None to always parse the csv
+        '''
+        self.csv_path = csv_path
+        self.cache_path = cache_path
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        '''
+        Builds the index on first use.
+        '''
+        with self.lock:
+            if self.loaded:
+                return
+            if self.cache_is_fresh():
+                arrays = np.load(self.cache_path)
+                self.cities, self.states = arrays['cities'], arrays['states']
+                self.lat, self.lng = arrays['lat'], arrays['lng']
+            else:
+                cities = pd.read_csv(self.csv_path, usecols=['city', 'state_id', 'lat', 'lng'])
+                self.cities = np.array(cities['city'].tolist(), dtype=str)
+                self.states = np.array(cities['state_id'].tolist(), dtype=str)
+                self.lat = cities['lat'].values.astype(float)
+                self.lng = cities['lng'].values.astype(float)
+                if self.cache_path:
+                    np.savez(self.cache_path, cities=self.cities, states=self.states,
+                             lat=self.lat, lng=self.lng)
+            # The first row wins, as with the boolean mask lookup it replaces.
+            self.rows = {}
+            for i, (city, state) in enumerate(zip(self.cities, self.states)):
+                self.rows.setdefault((normalize(city), normalize(state)), i)
+            self.lat_radians = np.radians(self.lat)
+            self.lng_radians = np.radians(self.lng)
+            self.loaded = True
+
+    def cache_is_fresh(self):
+        return bool(self.cache_path) and os.path.exists(self.cache_path) and \
+            os.path.getmtime(self.cache_path) >= os.path.getmtime(self.csv_path)
+
+    def lookup(self, city, state):
+        '''
+        Inputs:
+            city: (str)
+            state: (str) state abbreviation
+        Outputs:
+            (tuple) of latitude and longitude, or None if the city is unknown
+        '''
+        self.load()
+        row = self.rows.get((normalize(city), normalize(state)))
+        if row is None:
+            return None
+        return float(self.lat[row]), float(self.lng[row])
+
+    def nearest(self, lat, lng):
+        '''
+        Closest known city to a point, by great circle distance.
+
+        Inputs:
+            lat: (float) latitude in degrees
+            lng: (float) longitude in degrees
+        Outputs:
+            (tuple) of city, state abbreviation and distance in miles
+        '''
+        self.load()
+        lat, lng = np.radians(lat), np.radians(lng)
+        a = np.sin((self.lat_radians - lat) / 2) ** 2 + np.cos(lat) * \
+            np.cos(self.lat_radians) * np.sin((self.lng_radians - lng) / 2) ** 2
+        row = int(np.argmin(a))
+        distance = 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a[row]))
+        return str(self.cities[row]), str(self.states[row]), float(distance)
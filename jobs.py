@@ -0,0 +1,141 @@
+'''
+Background jobs for searches and analyses too slow to run inside a request.
+Jobs run on a bounded thread pool, report each summary section as soon as
+it is ready, and can be polled or streamed by job id.
+'''
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MAX_RUNNING = 2
+DEFAULT_MAX_PENDING = 16
+DEFAULT_MAX_FINISHED = 256
+
+
+class QueueFull(Exception):
+    '''
+    Raised when a job is submitted while max_pending jobs are waiting.
+    '''
+
+
+def short_error(error):
+    '''
+    Type and first line of the message of an exception, for a job's status.
+    '''
+    lines = str(error).splitlines()
+    return "{}: {}".format(type(error).__name__, lines[0] if lines else '')
+
+
+class Job():
+    '''
+    State of one background job: 'queued', 'running', 'done' or 'failed',
+    the sections produced so far, and the id of the stored result.
+    '''
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.state = 'queued'
+        self.sections = OrderedDict()
+        self.result_id = None
+        self.error = None
+        self.changed = threading.Condition()
+
+    def update(self, **attrs):
+        with self.changed:
+            for name, value in attrs.items():
+                setattr(self, name, value)
+            self.changed.notify_all()
+
+    def add_section(self, name, lines):
+        '''
+        Publishes one finished section of the summary.
+
+        Inputs:
+            name: (str) section name
+            lines: (list of str) lines to display
+        '''
+        with self.changed:
+            self.sections[name] = lines
+            self.changed.notify_all()
+
+    @property
+    def finished(self):
+        return self.state in ('done', 'failed')
+
+    def wait(self, n_sections, timeout=None):
+        '''
+        Blocks until more than n_sections sections exist or the job finished.
+
+        Outputs:
+            (bool) False if the timeout passed first
+        '''
+        with self.changed:
+            return self.changed.wait_for(
+                lambda: len(self.sections) > n_sections or self.finished, timeout)
+
+    def status(self):
+        '''
+        Outputs:
+            (dict) JSON-serializable state of the job
+        '''
+        with self.changed:
+            return {'job_id': self.id, 'state': self.state,
+                    'sections': OrderedDict(self.sections),
+                    'result_id': self.result_id, 'error': self.error}
+
+
+class JobQueue():
+    '''
+    Runs jobs on at most max_running threads with at most max_pending jobs
+    waiting for a thread. Finished jobs are remembered, oldest dropped first,
+    up to max_finished.
+    '''
+
+    def __init__(self, max_running=DEFAULT_MAX_RUNNING, max_pending=DEFAULT_MAX_PENDING,
+                 max_finished=DEFAULT_MAX_FINISHED):
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        self.pool = ThreadPoolExecutor(max_workers=max_running)
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, func, *args):
+        '''
+        Queues func(job, *args). func reports sections through
+        job.add_section and returns the id of the stored result.
+
+        Outputs:
+            (Job)
+        '''
+        job = Job()
+        with self.lock:
+            pending = sum(1 for j in self.jobs.values() if j.state == 'queued')
+            if pending >= self.max_pending:
+                raise QueueFull("{} jobs are already waiting".format(pending))
+            self.jobs[job.id] = job
+            self.forget_finished()
+        self.pool.submit(self.run, job, func, args)
+        return job
+
+    def run(self, job, func, args):
+        job.update(state='running')
+        try:
+            result_id = func(job, *args)
+        except Exception as error:
+            # The traceback stays in the server log, the public status only
+            # says what went wrong
+            logging.getLogger(__name__).exception("Job %s failed", job.id)
+            job.update(state='failed', error=short_error(error))
+        else:
+            job.update(state='done', result_id=result_id)
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def forget_finished(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job_id]
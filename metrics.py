@@ -0,0 +1,287 @@
+'''
+Timing spans and counters for the stages of an analysis (search, follow
+lookups, scoring, each summary, charts and templates), exposed in the
+Prometheus text format.
+
+Everything is off until enable() is called: span() then returns one shared
+do-nothing context manager and count() returns after checking a flag, so
+instrumented code costs next to nothing when metrics are disabled.
+
+Spans finished on the thread of a request started with start_request() are
+also kept for that request, for a per-request timing header.
+'''
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from contextlib import nullcontext
+
+PREFIX = 'twitter_sentiment_'
+# Upper bounds, in seconds, of the stage duration histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+DESCRIPTIONS = {
+    'stage_seconds': 'Seconds spent in each stage of an analysis',
+    'request_seconds': 'Seconds spent serving each endpoint',
+    'rows_total': 'Tweets processed by each stage',
+    'api_calls_total': 'Twitter API calls, by endpoint',
+    'cache_lookups_total': 'Cache lookups, by cache and result',
+    'requests_total': 'Requests served, by endpoint and status',
+}
+
+enabled = False
+_disabled_span = nullcontext()
+_request = threading.local()
+
+
+class Histogram():
+    '''
+    Cumulative bucket counts, sum and count of observed values.
+    '''
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        '''
+        Outputs:
+            (list of tuples) of upper bound (str) and number of values at or
+            below it, ending with +Inf
+        '''
+        bounds = [repr(float(b)) for b in self.buckets] + ['+Inf']
+        total, counts = 0, []
+        for count in self.counts:
+            total += count
+            counts.append(total)
+        return list(zip(bounds, counts))
+
+
+class Registry():
+    '''
+    Counters and histograms keyed by metric name and labels.
+    '''
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def count(self, name, value, labels):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels):
+        key = (name, labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    def clear(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def render(self):
+        '''
+        Outputs:
+            (str) every metric in the Prometheus text exposition format
+        '''
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (h.cumulative(), h.sum, h.count))
+                                for key, h in self.histograms.items())
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                lines.append('# HELP {}{} {}'.format(PREFIX, name, DESCRIPTIONS.get(name, name)))
+                lines.append('# TYPE {}{} {}'.format(PREFIX, name, kind))
+
+        for (name, labels), value in counters:
+            describe(name, 'counter')
+            lines.append('{}{}{} {}'.format(PREFIX, name, format_labels(labels), value))
+        for (name, labels), (buckets, total, count) in histograms:
+            describe(name, 'histogram')
+            for bound, n in buckets:
+                lines.append('{}{}_bucket{} {}'.format(
+                    PREFIX, name, format_labels(labels + (('le', bound),)), n))
+            lines.append('{}{}_sum{} {!r}'.format(PREFIX, name, format_labels(labels), total))
+            lines.append('{}{}_count{} {}'.format(PREFIX, name, format_labels(labels), count))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in labels)
+    return '{' + ','.join('{}="{}"'.format(name, value)
+                          for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def enable(on=True):
+    global enabled
+    enabled = bool(on)
+
+
+def count(name, value=1, **labels):
+    '''
+    Adds value to a counter, if metrics are enabled.
+
+    Inputs:
+        name: (str) key of DESCRIPTIONS
+        value: (int) amount to add
+        labels: (str) label values of the counter
+    '''
+    if enabled:
+        registry.count(name, value, tuple(sorted(labels.items())))
+
+
+def observe(name, value, **labels):
+    '''
+    Adds a value to a histogram, if metrics are enabled.
+    '''
+    if enabled:
+        registry.observe(name, value, tuple(sorted(labels.items())))
+
+
+class Span():
+    '''
+    Context manager timing one stage into the stage_seconds histogram and
+    the spans of the current request.
+    '''
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.started
+        registry.observe('stage_seconds', seconds, (('stage', self.stage),))
+        spans = getattr(_request, 'spans', None)
+        if spans is not None:
+            spans.append((self.stage, seconds))
+        return False
+
+
+def span(stage):
+    '''
+    Inputs:
+        stage: (str) name of the stage
+    Outputs:
+        Span timing the stage, or a shared do-nothing context manager if
+        metrics are disabled
+    '''
+    return Span(stage) if enabled else _disabled_span
+
+
+def start_request():
+    '''
+    Starts collecting the spans finished on this thread.
+    '''
+    _request.spans = []
+
+
+def finish_request():
+    '''
+    Outputs:
+        (list of tuples) of stage and seconds for each span finished on this
+        thread since start_request(), in order
+    '''
+    spans = getattr(_request, 'spans', None) or []
+    _request.spans = None
+    return spans
+
+
+def server_timing(spans, total=None):
+    '''
+    Value of a Server-Timing header, with stages timed more than once added
+    together.
+
+    Inputs:
+        spans: (list of tuples) from finish_request()
+        total: (float) seconds the whole request took, or None
+    Outputs:
+        (str)
+    '''
+    stages = {}
+    for stage, seconds in spans:
+        stages[stage] = stages.get(stage, 0.0) + seconds
+    if total is not None:
+        stages['total'] = total
+    return ', '.join('{};dur={:.1f}'.format(stage.replace(' ', '_'), seconds * 1000)
+                     for stage, seconds in stages.items())
+
+
+class StackSampler():
+    '''
+    Sampling profiler for one thread: a background thread records the stack
+    of the profiled thread every interval seconds until stop().
+    '''
+
+    def __init__(self, thread_id, interval=0.005):
+        '''
+        Inputs:
+            thread_id: (int) threading.get_ident() of the thread to profile
+            interval: (float) seconds between samples
+        '''
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            stack = traceback.extract_stack(frame)
+            self.samples[';'.join('{}:{}:{}'.format(os.path.basename(f.filename), f.name,
+                                                    f.lineno) for f in stack)] += 1
+
+    def stop(self):
+        '''
+        Outputs:
+            (collections.Counter) of collapsed stacks (outermost frame first,
+            separated by ;) to the number of samples taken in them
+        '''
+        self.stopped.set()
+        self.thread.join()
+        return self.samples
+
+    def report(self, top=10):
+        '''
+        Outputs:
+            (str) the most sampled stacks, one per line after their count
+        '''
+        if not self.samples:
+            return '(no samples)'
+        return '\n'.join('{:6d} {}'.format(n, stack)
+                         for stack, n in self.samples.most_common(top))
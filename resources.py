@@ -0,0 +1,105 @@
+'''
+The nltk data the classifier needs, found on the local nltk data path and
+loaded once per process, the first time it is used. Nothing is downloaded
+at import; run this module once to fetch the data on a new host:
+
+    python resources.py
+'''
+import threading
+import time
+
+# Name of each resource for nltk.download, and its path for nltk.data.find
+RESOURCES = {'vader_lexicon': 'sentiment/vader_lexicon.zip',
+             'stopwords': 'corpora/stopwords'}
+
+# Seconds spent loading each resource in this process
+timings = {}
+
+_loaded = {}
+_lock = threading.RLock()
+
+
+class MissingResource(LookupError):
+    '''
+    Raised when nltk data the classifier needs is not installed.
+    '''
+
+
+def require(name):
+    '''
+    Checks that a resource is installed, without downloading it.
+
+    Inputs:
+        name: (str) key of RESOURCES
+    '''
+    import nltk
+    try:
+        nltk.data.find(RESOURCES[name])
+    except LookupError:
+        raise MissingResource("nltk resource '{}' is not installed; run "
+                              "python resources.py".format(name)) from None
+
+
+def load(name, loader):
+    '''
+    Returns loader(), calling it only the first time name is loaded in this
+    process and recording how long it took.
+    '''
+    with _lock:
+        if name not in _loaded:
+            start = time.perf_counter()
+            _loaded[name] = loader()
+            timings[name] = time.perf_counter() - start
+        return _loaded[name]
+
+
+def stop_words():
+    '''
+    Outputs:
+        (set of str) english stopwords
+    '''
+    def loader():
+        require('stopwords')
+        import nltk
+        return set(nltk.corpus.stopwords.words('english'))
+    return load('stopwords', loader)
+
+
+def analyzer():
+    '''
+    Outputs:
+        (SentimentIntensityAnalyzer) shared by the classifiers of this
+        process; polarity_scores does not change it
+    '''
+    def loader():
+        require('vader_lexicon')
+        from nltk.sentiment.vader import SentimentIntensityAnalyzer
+        return SentimentIntensityAnalyzer()
+    return load('vader_lexicon', loader)
+
+
+def fast_vader():
+    '''
+    Outputs:
+        (fast_vader.FastVader) over analyzer()
+    '''
+    def loader():
+        from fast_vader import FastVader
+        return FastVader(analyzer())
+    return load('fast_vader', loader)
+
+
+def download():
+    '''
+    Downloads every resource that is not installed yet.
+    '''
+    import nltk
+    for name in RESOURCES:
+        try:
+            require(name)
+        except MissingResource:
+            nltk.download(name)
+
+
+if __name__ == '__main__':
+    download()
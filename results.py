@@ -0,0 +1,147 @@
+'''
+Store of analysis results (TweetData objects) keyed by result id, so each
+user's charts are drawn from their own analysis. Results live in an
+in-process LRU bounded by memory and can also be written to a directory
+that every worker process reads, which lets several gunicorn workers serve
+the same results.
+'''
+import os
+import pickle
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2
+DEFAULT_MAX_DISK_BYTES = 4 * 1024 ** 3
+
+
+def result_size(tweets):
+    '''
+    Approximate memory held by a TweetData object, dominated by its data.
+
+    Inputs:
+        tweets: (TweetData)
+    Outputs:
+        (int) bytes
+    '''
+    if tweets.data is None:
+        return 0
+    return int(tweets.data.memory_usage(deep=True).sum())
+
+
+class ResultStore():
+    '''
+    Least recently used map of result id to TweetData, evicting once the
+    results held take more than max_bytes. With a directory, results are
+    also pickled there and looked up there on a memory miss.
+    '''
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, directory=None,
+                 max_disk_bytes=DEFAULT_MAX_DISK_BYTES):
+        '''
+        Inputs:
+            max_bytes: (int) memory budget of the in-process LRU
+            directory: (str) shared spill directory, or None to keep results
+                       in this process only
+            max_disk_bytes: (int) budget of the spill directory
+        '''
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.results = OrderedDict()
+        self.sizes = {}
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def put(self, tweets):
+        '''
+        Stores a new result.
+
+        Inputs:
+            tweets: (TweetData)
+        Outputs:
+            (str) result id
+        '''
+        result_id = uuid.uuid4().hex
+        if self.directory:
+            self.write(result_id, tweets)
+        self.remember(result_id, tweets)
+        return result_id
+
+    def get(self, result_id):
+        '''
+        Inputs:
+            result_id: (str)
+        Outputs:
+            (TweetData) or None if the result is unknown or was evicted
+        '''
+        with self.lock:
+            if result_id in self.results:
+                self.results.move_to_end(result_id)
+                return self.results[result_id]
+        tweets = self.read(result_id)
+        if tweets is not None:
+            self.remember(result_id, tweets)
+        return tweets
+
+    def remember(self, result_id, tweets):
+        size = result_size(tweets)
+        with self.lock:
+            if result_id in self.results:
+                return
+            self.results[result_id] = tweets
+            self.sizes[result_id] = size
+            self.total_bytes += size
+            # Always keep the newest result, even if it alone is over budget.
+            while self.total_bytes > self.max_bytes and len(self.results) > 1:
+                old_id, _ = self.results.popitem(last=False)
+                self.total_bytes -= self.sizes.pop(old_id)
+
+    def path(self, result_id):
+        return os.path.join(self.directory, result_id + '.pickle')
+
+    def write(self, result_id, tweets):
+        '''
+        Pickles a result into the spill directory. The file is renamed into
+        place so other workers never see a partial write.
+        '''
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(tweets, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path(result_id))
+        self.prune_disk()
+
+    def read(self, result_id):
+        # Result ids are generated hex strings; anything else is not ours.
+        if not self.directory or not all(c in '0123456789abcdef' for c in result_id):
+            return None
+        try:
+            with open(self.path(result_id), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+    def prune_disk(self):
+        '''
+        Deletes the oldest spilled results beyond max_disk_bytes.
+        '''
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pickle'):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
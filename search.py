@@ -1,6 +1,10 @@
 import pandas as pd
 import tweepy as tw
 from analyze import TweetData
+from fetch import Fetcher, Scheduler
+from friends import FriendshipLookup
+from geocode import GeocodeIndex
+import metrics
 
 #Credentials related to twitter API have been censored 
 consumer_key = "key"
@@ -9,13 +13,26 @@ access_token = "access_token"
 access_token_secret = "access_token_secret"
 auth = tw.OAuthHandler(consumer_key, consumer_secret)
 auth.set_access_token(access_token, access_token_secret)
-api = tw.API(auth, wait_on_rate_limit_notify=True)
+# Rate limits are waited on by the fetch.Scheduler, up to FETCH_TIMEOUT
+api = tw.API(auth)
 
 pres_candidates = {"@BernieSanders":["Bernie", "Sanders"],
                    "@JoeBiden":["Biden"],
                    "@realDonaldTrump":["Trump"]}
 
-cities = pd.read_csv("uscities.csv")
+# Read from uscities.csv on the first lookup, not at import
+geocodes = GeocodeIndex("uscities.csv", cache_path="uscities.npz")
+
+# Seconds a search may wait on rate limits before it returns the tweets and
+# follow relationships it has, leaving the rest unknown
+FETCH_TIMEOUT = 20
+
+# Quota left on each endpoint, shared by every search
+scheduler = Scheduler()
+# Follow relationships already looked up, shared by every search
+friend_lookup = FriendshipLookup(api, limiter=scheduler.limiter('show_friendship'))
+# Candidate user ids are read from user_ids.sqlite on the first search
+fetcher = Fetcher(api, scheduler, friend_lookup=friend_lookup)
 
 
 def get_candidate_friends(user_id, candidate_ids):
@@ -28,11 +45,7 @@ def get_candidate_friends(user_id, candidate_ids):
     Outputs: 
         (list of bool) whether or not user is following candidate at same index in candidate_ids
     '''
-    try:
-        friends = [api.show_friendship(source_id=user_id, target_id=c)[1].followed_by for c in candidate_ids] 
-    except:
-        friends = [None] * len(candidate_ids)
-    return friends
+    return friend_lookup.lookup_many([user_id], candidate_ids)[user_id]
 
 
 def get_geocode(city, state, radius):
@@ -46,10 +59,10 @@ def get_geocode(city, state, radius):
     Outputs:
         (str) of latitiude, longitude, and radius or None
     '''
-    city = cities.loc[(cities["city"] == city) & (cities["state_id"] == state)]
-    if city.empty:
+    coordinates = geocodes.lookup(city, state)
+    if coordinates is None:
         return None
-    return "{},{},{}".format(city.lat.values[0], city.lng.values[0], str(radius) + "mi")
+    return "{},{},{}".format(coordinates[0], coordinates[1], str(radius) + "mi")
 
 
 def search_tweets(search_word, loc, tweets_to_pull=150, result_type='recent',
@@ -59,39 +72,113 @@ def search_tweets(search_word, loc, tweets_to_pull=150, result_type='recent',
 
     Inputs:
         search_word: (str)
-        loc: (dict) where keys are 'city', 'state', and 'radius'
+        loc: (dict) where keys are 'city', 'state', and 'radius', or empty to
+             search everywhere
         step: (int) tweet limit set at 150
         result_type: (str)
         candidates: (dict) set to pres_candidates 
     Outputs:
         TweetData object
     '''
+    pulled = search_frame(search_word, loc, tweets_to_pull, result_type, candidates)
+    if pulled is None:
+        return None
+    tweets_df, search_params, since_id = pulled
+    tweets_df.to_csv('test_data.csv')
+
+    tweets = TweetData(tweets_df, search_params)
+    tweets.since_id = since_id
+    return tweets
+
+
+def search_frame(search_word, loc, tweets_to_pull=150, result_type='recent',
+                 candidates=None):
+    '''
+    Pulls the tweets search_tweets() analyzes, without scoring them.
+
+    Inputs:
+        see search_tweets()
+    Outputs:
+        (tuple) of pandas.DataFrame of tweets, search parameters for
+        TweetData and id of the newest tweet, or None if the location is
+        unknown (an empty or None loc searches everywhere)
+    '''
     if not candidates:
         candidates = pres_candidates
-    geocode = get_geocode(loc["city"], loc["state"], loc["radius"])
-    if not geocode:
-        return None
+    # Without a location the search is not limited to a place
+    geocode = None
+    if loc:
+        geocode = get_geocode(loc["city"], loc["state"], loc["radius"])
+        if not geocode:
+            return None
     search_params = locals()
-    candidate_ids = [api.get_user(screen_name=sn).id for sn in candidates.keys()]
+    tweets_df, since_id = pull_tweets(search_word, geocode, tweets_to_pull, result_type,
+                                      candidates)
+    return tweets_df, search_params, since_id
+
+
+def pull_tweets(search_word, geocode, tweets_to_pull, result_type, candidates,
+                since_id=None, timeout=FETCH_TIMEOUT, fetcher=fetcher):
+    '''
+    Pulls tweets and whether their authors follow the candidates. Search
+    pages are pulled before any follow relationship is looked up; whatever
+    the rate limits do not allow within timeout is left out, so fewer
+    tweets may come back and their follow columns may be None (unknown).
+
+    Inputs:
+        search_word: (str)
+        geocode: (str) from get_geocode()
+        tweets_to_pull: (int) tweet limit
+        result_type: (str)
+        candidates: (dict) of candidate handle to list of aliases
+        since_id: (int) only pull tweets newer than this one, or None
+        timeout: (float) seconds to wait on rate limits, None to wait as long
+                 as they take
+        fetcher: (fetch.Fetcher) defaults to the one every search shares
+    Outputs:
+        (tuple) of pandas.DataFrame of tweets and id of the newest tweet
+        (since_id if there are none)
+    '''
+    deadline = fetcher.deadline(timeout)
+    candidate_ids = fetcher.candidate_ids(list(candidates.keys()), deadline)
 
     columns = ["TweetText", "user_id", "User Location", "Time Searched",
                "Favorite Count", "Retweet Count"] + \
                ["Follows " + k for k in candidates.keys()]
 
-    data = []
-    cursor = tw.Cursor(api.search,
-                       q=search_word + ' -filter:retweets',
-                       geocode=geocode,
-                       lang="en",
-                       result_type=result_type,
-                       tweet_mode="extended").items(tweets_to_pull)
-    for t in cursor:
-        candidate_friends = get_candidate_friends(t.user.id, candidate_ids)
-        row = [t.full_text, t.user.id, t.user.location, t.created_at, \
-               t.favorite_count, t.retweet_count] + candidate_friends
-        data.append(row)
-
-    tweets_df = pd.DataFrame(data, columns=columns)
-    tweets_df.to_csv('test_data.csv')
+    pulled, complete = fetcher.search(tweets_to_pull, deadline, since_id=since_id,
+                                      q=search_word + ' -filter:retweets',
+                                      geocode=geocode,
+                                      lang="en",
+                                      result_type=result_type,
+                                      tweet_mode="extended")
+    metrics.count('rows_total', len(pulled), stage='search')
+    # One batch of lookups for all the authors, each looked up once
+    friends = fetcher.friendships([t.user.id for t in pulled], candidate_ids, deadline)
+    unknown = sum(1 for t in pulled if None in friends[t.user.id])
+    if not complete or unknown:
+        metrics.count('partial_results_total')
+        metrics.count('unknown_follows_total', unknown)
+    data = [[t.full_text, t.user.id, t.user.location, t.created_at, \
+             t.favorite_count, t.retweet_count] + friends[t.user.id]
+            for t in pulled]
+
+    newest = max([t.id for t in pulled], default=since_id)
+    return pd.DataFrame(data, columns=columns), newest
+
+
+def update_search(tweets, tweets_to_pull=150):
+    '''
+    Pulls the tweets posted since a search_tweets() search (or the last
+    update) and adds them to its TweetData, scoring only the new tweets.
 
-    return TweetData(tweets_df, search_params)
+    Inputs:
+        tweets: TweetData object returned by search_tweets()
+        tweets_to_pull: (int) tweet limit
+    Outputs:
+        (int) number of tweets added
+    '''
+    tweets_df, since_id = pull_tweets(tweets.query, tweets.geocode, tweets_to_pull,
+                                      tweets.result_type, tweets.candidates,
+                                      tweets.since_id)
+    return tweets.add_tweets(tweets_df, since_id)
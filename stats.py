@@ -0,0 +1,242 @@
+'''
+Grouped descriptive statistics over tweets sorted by score. Every follower,
+mention and follower/mention group is counted per distinct score in one
+sweep over the rows; five-number summaries, means and the most positive,
+negative and neutral tweets are then read off those counts.
+'''
+import math
+from fractions import Fraction
+import numpy as np
+import pandas as pd
+
+DESCRIBE_INDEX = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+# Rows unpacked at a time is 8 * BLOCK_BYTES.
+BLOCK_BYTES = 4096
+# Bits per limb when summing scores exactly with int64 arithmetic.
+LIMB_BITS = 21
+
+
+def quantile(values, cumulative, q):
+    '''
+    Linearly interpolated quantile, as pandas computes it, from sorted
+    distinct values and their cumulative counts.
+    '''
+    position = q * (cumulative[-1] - 1)
+    below = int(math.floor(position))
+    lo = values[int(cumulative.searchsorted(below, side='right'))]
+    hi = values[int(cumulative.searchsorted(below + 1, side='right'))] \
+        if below + 1 < cumulative[-1] else lo
+    return lo + (hi - lo) * (position - below)
+
+
+def describe_counts(values, counts, mean):
+    '''
+    Same layout as Series.describe() on scores given as counts per value.
+
+    Inputs:
+        values: (numpy.ndarray of float) sorted distinct scores
+        counts: (numpy.ndarray of int) number of tweets at each score
+        mean: (float) mean score
+    Outputs:
+        (pandas.Series)
+    '''
+    present = counts > 0
+    values = values[present]
+    counts = counts[present]
+    n = int(counts.sum())
+    cumulative = counts.cumsum()
+    std = math.sqrt((counts * (values - mean) ** 2).sum() / (n - 1)) if n > 1 \
+        else float('nan')
+    stats = [n, mean, std, values[0]] + \
+            [quantile(values, cumulative, q) for q in (0.25, 0.5, 0.75)] + \
+            [values[-1]]
+    return pd.Series(stats, index=DESCRIBE_INDEX, name='Score', dtype=float)
+
+
+def exact_sums(values, counts):
+    '''
+    Exact sums of scores given as counts per value, for many groups at once.
+    Every score is written as an integer over a shared power of two and the
+    integers are split into small limbs, so the sums can be done with int64
+    matrix products without overflow or rounding.
+
+    Inputs:
+        values: (numpy.ndarray of float) distinct scores
+        counts: (numpy.ndarray of int) values x groups
+    Outputs:
+        (list of fractions.Fraction) sum per group
+    '''
+    ratios = [float(v).as_integer_ratio() for v in values]
+    shift = max(den.bit_length() - 1 for _, den in ratios)
+    scaled = [num << (shift - (den.bit_length() - 1)) for num, den in ratios]
+    n_limbs = max(1, -(-max(abs(w).bit_length() for w in scaled) // LIMB_BITS))
+    mask = (1 << LIMB_BITS) - 1
+    limbs = np.array([[(1 if w >= 0 else -1) * ((abs(w) >> (LIMB_BITS * j)) & mask)
+                       for j in range(n_limbs)] for w in scaled], dtype=np.int64)
+    limb_sums = counts.T.astype(np.int64) @ limbs
+    return [Fraction(sum(int(s) << (LIMB_BITS * j) for j, s in enumerate(row)),
+                     1 << shift) for row in limb_sums]
+
+
+class GroupedStats():
+    '''
+    Statistics for many subsets of one score-sorted dataset, each subset
+    given as a packed bitset over the rows (see candidate_index).
+    '''
+
+    def __init__(self, scores, texts, groups, k=3):
+        '''
+        Inputs:
+            scores: (numpy.ndarray of float) sorted ascending
+            texts: (numpy.ndarray of str) tweet text in the same order
+            groups: (dict) of group key to packed bitset
+            k: (int) number of tweets reported at each end and at the median
+        '''
+        self.n = len(scores)
+        self.texts = texts
+        self.k = k
+        self.keys = list(groups)
+        self.columns = {key: i for i, key in enumerate(self.keys)}
+        self.bits = groups
+        self.values, self.starts = np.unique(scores, return_index=True)
+        self.ends = np.append(self.starts[1:], self.n)
+        self.counts = self.count_groups()
+        totals = self.counts.sum(axis=0)
+        self.sizes = dict(zip(self.keys, totals.tolist()))
+        sums = exact_sums(self.values, self.counts) if self.n else [0] * len(self.keys)
+        self.means = {key: float(s) / size if size else float('nan')
+                      for key, s, size in zip(self.keys, sums, self.sizes.values())}
+
+    def count_groups(self):
+        '''
+        Number of tweets of every group at every distinct score, from a single
+        pass over the rows in blocks.
+
+        Outputs:
+            (numpy.ndarray of int64) distinct scores x groups
+        '''
+        counts = np.zeros((len(self.values), len(self.keys)), dtype=np.int64)
+        if not self.keys or not self.n:
+            return counts
+        packed = np.vstack([self.bits[key] for key in self.keys])
+        run = np.repeat(np.arange(len(self.values)), self.ends - self.starts)
+        for b0 in range(0, packed.shape[1], BLOCK_BYTES):
+            r0 = 8 * b0
+            r1 = min(self.n, 8 * (b0 + BLOCK_BYTES))
+            block = np.unpackbits(packed[:, b0:b0 + BLOCK_BYTES], axis=1)[:, :r1 - r0]
+            block_run = run[r0:r1]
+            first = np.flatnonzero(np.r_[True, block_run[1:] != block_run[:-1]])
+            counts[block_run[first]] += np.add.reduceat(block, first, axis=1,
+                                                        dtype=np.int64).T
+        return counts
+
+    def rows_in_run(self, key, r):
+        '''
+        Positions of the tweets of a group that have the r-th distinct score.
+        '''
+        start, end = self.starts[r], self.ends[r]
+        bits = self.bits[key][start // 8:(end + 7) // 8]
+        offset = start % 8
+        members = np.unpackbits(bits)[offset:offset + end - start].astype(bool)
+        return start + np.flatnonzero(members)
+
+    def end_rows(self, key, column, last):
+        '''
+        Positions of the first (or last) k tweets of a group in score order.
+        '''
+        runs = np.flatnonzero(self.counts[:, column])
+        if last:
+            runs = runs[::-1]
+        rows = []
+        for r in runs:
+            found = self.rows_in_run(key, r)
+            rows = (list(found) + rows) if last else (rows + list(found))
+            if len(rows) >= self.k:
+                break
+        return rows[-self.k:] if last else rows[:self.k]
+
+    def stats(self, key):
+        '''
+        Inputs:
+            key: group key
+        Outputs:
+            (tuple) of the describe() series, the mean, and lists of the k
+            most positive, k most negative and k median tweets, the tweets in
+            ascending order of score
+        '''
+        column = self.columns[key]
+        counts = self.counts[:, column]
+        summary = describe_counts(self.values, counts, self.means[key])
+        pos = self.texts[self.end_rows(key, column, last=True)].tolist()
+        neg = self.texts[self.end_rows(key, column, last=False)].tolist()
+        med = []
+        r = int(self.values.searchsorted(summary['50%']))
+        if r < len(self.values) and self.values[r] == summary['50%'] and counts[r]:
+            med = self.texts[self.rows_in_run(key, r)[:self.k]].tolist()
+        return summary, self.means[key], pos, neg, med
+
+
+class RunningStats():
+    '''
+    The statistics GroupedStats.stats reports for one group, folded in a
+    chunk of tweets at a time. Only the count of tweets at each distinct
+    score is kept, with the k tweets at each end and the first k at each
+    score (for the median tweets), so memory is bounded by the number of
+    distinct scores, at most 20001 for scores rounded to 4 places.
+    '''
+
+    def __init__(self, k=3):
+        self.k = k
+        self.counts = {}
+        self.lowest = []
+        self.highest = []
+        self.at_score = {}
+        self.n = 0
+
+    def add(self, scores, texts, order):
+        '''
+        Inputs:
+            scores: (numpy.ndarray of float) sorted ascending
+            texts: (numpy.ndarray of str) tweet text in the same order
+            order: (numpy.ndarray of int) position of each tweet in the
+                   whole dataset sorted by score with ties in file order,
+                   increasing with it among tweets of equal score
+        '''
+        if not len(scores):
+            return
+        k = self.k
+        values, starts, counts = np.unique(scores, return_index=True, return_counts=True)
+        for value, start, count in zip(values.tolist(), starts.tolist(), counts.tolist()):
+            self.counts[value] = self.counts.get(value, 0) + count
+            at_score = self.at_score.setdefault(value, [])
+            if len(at_score) < k:
+                at_score.extend(texts[start:start + min(count, k - len(at_score))])
+        ends = [(s, o, t) for s, o, t in zip(scores[:k].tolist(), order[:k].tolist(),
+                                             texts[:k])]
+        self.lowest = sorted(self.lowest + ends)[:k]
+        ends = [(s, o, t) for s, o, t in zip(scores[-k:].tolist(), order[-k:].tolist(),
+                                             texts[-k:])]
+        self.highest = sorted(self.highest + ends)[-k:]
+        self.n += len(scores)
+
+    def mean(self):
+        '''
+        Correctly rounded mean, equal to the mean GroupedStats reports.
+        '''
+        values = np.array(sorted(self.counts))
+        counts = np.array([self.counts[v] for v in values.tolist()], dtype=np.int64)
+        return float(exact_sums(values, counts[:, None])[0]) / self.n
+
+    def stats(self):
+        '''
+        Outputs:
+            (tuple) laid out like GroupedStats.stats
+        '''
+        values = np.array(sorted(self.counts))
+        counts = np.array([self.counts[v] for v in values.tolist()], dtype=np.int64)
+        mean = self.mean()
+        summary = describe_counts(values, counts, mean)
+        pos = [text for _, _, text in self.highest]
+        neg = [text for _, _, text in self.lowest]
+        med = list(self.at_score.get(summary['50%'], []))
+        return summary, mean, pos, neg, med
@@ -0,0 +1,252 @@
+'''
+Chunked replay of historical csv files. Tweets are read and scored a chunk
+at a time, with the column renames of TweetData.update_handler applied to
+each chunk.
+
+summarize_csv folds every chunk into running aggregates (candidate counts,
+score statistics and word counts) and keeps none of the tweets, so its
+memory stays flat however large the file is, and its summaries match those
+of a TweetData of the whole file. stream_tweets builds that TweetData for
+the charts and dataset.py, with the raw and processed text of only one
+chunk in memory at once beyond the scored data.
+
+Usage:
+    python stream.py tweets.csv --flags "Super Tuesday" --chunk-size 50000
+'''
+import argparse
+from itertools import permutations
+import numpy as np
+import pandas as pd
+from analyze import TweetData, compact_schema, historical_columns, historical_params
+from candidate_index import CandidateIndex
+from classifier import Classifier, SCORE_LABELS
+from stats import RunningStats
+from summaries import (PAIRS_TITLE, FollowSummary, GroupStats, MentionSummary,
+                       SentimentSummary, summary_sections)
+from term_counts import TermCounts
+
+DEFAULT_CHUNK_SIZE = 50000
+
+
+def read_chunks(path, update_flags=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    Reads a csv file of tweets in chunks, renaming the columns of historical
+    files the same way TweetData.update_handler does.
+
+    Inputs:
+        path: (str) csv file
+        update_flags: (list of str) identifier of historical data topic
+        chunk_size: (int) rows per chunk
+    Outputs:
+        (generator of pandas.DataFrame)
+    '''
+    columns = historical_columns(update_flags or [])
+    for chunk in pd.read_csv(path, chunksize=chunk_size):
+        yield chunk.rename(columns=columns)
+
+
+def scored_chunks(path, update_flags=None, chunk_size=DEFAULT_CHUNK_SIZE, workers=None,
+                  cache=None):
+    '''
+    Reads and scores a csv file of tweets a chunk at a time, with one
+    Classifier.
+
+    Outputs:
+        (generator of pandas.DataFrame) non-empty scored chunks, with
+        ProcessedTweet and Score columns
+    '''
+    classifier = Classifier(None, workers=workers, cache=cache)
+    for chunk in read_chunks(path, update_flags, chunk_size):
+        if not chunk.empty:
+            yield classifier.score_test_data(chunk)
+
+
+class StreamSummary():
+    '''
+    Running aggregates of a stream of scored tweets, with the summary
+    methods of TweetData, so summaries.summary_sections renders it the same
+    way.
+    '''
+
+    def __init__(self, search_params, other_candidates={}, k=3):
+        '''
+        Inputs:
+            search params: (dict) parameters of search from ui
+            other_candidates: (dict) extra handles to count mentions of in
+                              summarize_tweets_ab_candidates
+            k: (int) number of tweets reported at each end and at the median
+        '''
+        self.query = search_params["search_word"]
+        self.candidates = search_params["candidates"]
+        self.other_candidates = other_candidates
+        self.k = k
+        self.n = 0
+        self.mention_any = 0
+        self.mentions = {handle: 0 for handle in dict(self.candidates, **other_candidates)}
+        self.follow_columns = None
+        self.follows_known = 0
+        self.follows = {}
+        self.all = RunningStats(k)
+        self.groups = {}
+        self.terms = TermCounts()
+
+    def add(self, chunk):
+        '''
+        Folds a chunk of scored tweets into the aggregates.
+
+        Inputs:
+            chunk: (pandas.DataFrame) from scored_chunks, in file order
+        '''
+        chunk = chunk.sort_values(['Score'], kind='mergesort')
+        index = CandidateIndex(chunk, self.candidates)
+        index.add_candidates(self.other_candidates)
+        self.terms.update(chunk['ProcessedTweet'])
+
+        self.mention_any += index.count(index.mention_any)
+        for handle in self.mentions:
+            self.mentions[handle] += index.count(index.mentions[handle])
+        if self.follow_columns is None:
+            self.follow_columns = index.follow_columns
+            self.follows = {col: 0 for col in self.follow_columns}
+        self.follows_known += index.count(index.follows_known)
+        for col in self.follow_columns:
+            self.follows[col] += index.count(index.follows_known & index.follows[col])
+
+        # Ties sort in file order, so later chunks go after earlier ones.
+        scores = chunk['Score'].values
+        texts = chunk['TweetText'].values
+        order = self.n + np.arange(len(chunk))
+        self.all.add(scores, texts, order)
+        for key, bits in self.group_bits(index).items():
+            rows = index.mask(bits)
+            self.groups.setdefault(key, RunningStats(self.k)).add(
+                scores[rows], texts[rows], order[rows])
+        self.n += len(chunk)
+
+    def group_bits(self, index):
+        '''
+        Bitsets of the groups TweetData.grouped_stats keeps statistics for.
+        '''
+        groups = {}
+        for handle in self.candidates:
+            if 'Follows ' + handle in index.follows:
+                groups[('Follows ', handle)] = index.follows['Follows ' + handle]
+            groups[('Mentions ', handle)] = index.mentions[handle]
+        for cand1, cand2 in permutations(self.candidates.keys(), 2):
+            if 'Follows ' + cand1 in index.follows:
+                groups[(cand1, cand2)] = index.follows_and_mentions(cand1, cand2)
+        return groups
+
+    def calc_stats(self, handle, col_string):
+        '''
+        See TweetData.calc_stats.
+        '''
+        key = handle if isinstance(handle, tuple) else (col_string, handle)
+        group = self.groups.get(key)
+        if group is None or group.n < 5:
+            return None
+        summary, mean, tweet_pos, tweet_neg, tweet_med = group.stats()
+        handles = handle if isinstance(handle, tuple) else (handle,)
+        return GroupStats(handles, summary, self.all.mean() - mean, tweet_pos, tweet_neg,
+                          tweet_med)
+
+    def summarize_sentiment(self, col_string):
+        groups = [self.calc_stats(handle, col_string) for handle in self.candidates]
+        return SentimentSummary([group for group in groups if group])
+
+    def summarize_sentiment_by_followers_and_mentions(self):
+        groups = [self.calc_stats(pair, '')
+                  for pair in permutations(self.candidates.keys(), 2)]
+        return SentimentSummary([group for group in groups if group], PAIRS_TITLE)
+
+    def summarize_follow_data(self):
+        follows = [(col[7:], self.follows[col]) for col in self.follow_columns or []]
+        return FollowSummary(self.n, self.follows_known, follows)
+
+    def summarize_tweets_ab_candidates(self, other_candidates={}):
+        '''
+        See TweetData.summarize_tweets_ab_candidates. The tweets are not
+        kept, so other_candidates must have been given to the constructor.
+        '''
+        missing = set(other_candidates) - set(self.mentions)
+        if missing:
+            raise ValueError("mentions of {} were not counted".format(sorted(missing)))
+        mentions = [(handle, self.mentions[handle])
+                    for handle in dict(self.candidates, **other_candidates)]
+        return MentionSummary(self.n, self.mention_any, mentions)
+
+
+def summarize_csv(path, search_params, update_flags=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                  workers=None, cache=None, other_candidates={}):
+    '''
+    Summarizes a csv file of tweets a chunk at a time.
+
+    Inputs:
+        path: (str) csv file of tweets
+        search params: (dict) parameters of search from ui
+        update flag: (list of str) identifier of historical data topic
+        chunk_size: (int) rows read and scored at a time
+        workers: (int) processes to score with, see Classifier
+        cache: (cache.ScoreCache) previously scored tweets, see Classifier
+        other_candidates: (dict) see StreamSummary
+    Outputs:
+        StreamSummary object, or None if the file has no tweets
+    '''
+    summary = StreamSummary(historical_params(search_params, update_flags or []),
+                            other_candidates)
+    for chunk in scored_chunks(path, update_flags, chunk_size, workers, cache):
+        summary.add(chunk)
+    return summary if summary.n else None
+
+
+def stream_tweets(path, search_params, update_flags=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                  workers=None, cache=None, keep_processed=True):
+    '''
+    Builds a TweetData from a csv file, scoring it a chunk at a time and
+    putting the scored chunks together once.
+
+    Inputs:
+        path: (str) csv file of tweets
+        search params: (dict) parameters of search from ui
+        update flag: (list of str) identifier of historical data topic
+        chunk_size: (int) rows read and scored at a time
+        workers: (int) processes to score with, see Classifier
+        cache: (cache.ScoreCache) previously scored tweets, see Classifier
+        keep_processed: (bool) keep the ProcessedTweet column, see
+                        analyze.compact_schema
+    Outputs:
+        TweetData object, or None if the file has no tweets
+    '''
+    terms = TermCounts()
+    chunks = []
+    for chunk in scored_chunks(path, update_flags, chunk_size, workers, cache):
+        terms.update(chunk['ProcessedTweet'])
+        chunks.append(compact_schema(chunk, keep_processed))
+    if not chunks:
+        return None
+    data = pd.concat(chunks, sort=False).sort_values(['Score'], kind='mergesort')
+    # Each chunk was binned over its own range of scores
+    data['Score_bins'] = pd.cut(data['Score'], bins=5, labels=SCORE_LABELS)
+    return TweetData(data, historical_params(search_params, update_flags or []),
+                     workers=workers, cache=cache, scored=True,
+                     keep_processed=keep_processed, terms=terms)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('csv_path')
+    parser.add_argument('--flags', nargs='*', default=[],
+                        help='historical data topic, e.g. "Super Tuesday" or 8Ver')
+    parser.add_argument('--search-word', default='')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+    params = {"search_word": args.search_word, "q": args.search_word, "candidates": {},
+              "geocode": None, "result_type": "recent"}
+    summary = summarize_csv(args.csv_path, params, args.flags, args.chunk_size, args.workers)
+    if summary is None:
+        print("{} has no tweets".format(args.csv_path))
+    else:
+        for name, section in summary_sections(summary):
+            print(section)
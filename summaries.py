@@ -0,0 +1,198 @@
+'''
+Results of the TweetData summaries. Each keeps the numbers and tweets it
+reports, so main.html can lay them out, and renders the same text as the
+summaries always have with str(), built with join rather than repeated
+string concatenation.
+'''
+import metrics
+
+GROUP_TEMPLATE = """Summary of tweets from followers of {}.
+                         {}
+                         Average tweet is {} more positive than the average tweet pulled.
+
+                         3 most positive tweets:
+                         {}
+
+                         3 most negative tweets:
+                         {}
+
+                         3 neutral tweets:
+                         {}\n"""
+FEW_TWEETS = "Whoops! Fewer than 5 tweets meet these criteria."
+PAIRS_TITLE = 'Summary of tweet sentiment by followers and mentions:\n'
+# Name, TweetData method and its arguments of each summary on the results
+# page, in page order
+SECTIONS = [('result', 'summarize_tweets_ab_candidates', ()),
+            ('result1', 'summarize_follow_data', ()),
+            ('result2', 'summarize_sentiment', ("Follows ",)),
+            ('result3', 'summarize_sentiment', ("Mentions ",)),
+            ('result4', 'summarize_sentiment_by_followers_and_mentions', ())]
+
+
+def summary_sections(tweets):
+    '''
+    Produces the summaries shown on the results page one at a time, in
+    page order.
+
+    Inputs:
+        tweets: TweetData object
+    Outputs:
+        (generator of tuples) of section name and Summary
+    '''
+    for name, method, args in SECTIONS:
+        with metrics.span(' '.join((method,) + args).strip()):
+            summary = getattr(tweets, method)(*args)
+        yield name, summary
+
+
+def format_tweets(tweets):
+    '''
+    Numbers tweets, one per line.
+
+    Inputs:
+        tweets: (iterable of str)
+    Outputs:
+        (str) of number and tweet text
+    '''
+    return ''.join('Tweet {}: {} \n'.format(i + 1, text) for i, text in enumerate(tweets))
+
+
+def percent(count, total):
+    return (count / total) * 100
+
+
+class Summary():
+    '''
+    Base of the summary results: equal when they render the same text.
+    '''
+    kind = None
+
+    def __eq__(self, other):
+        return type(self) is type(other) and str(self) == str(other)
+
+    def lines(self):
+        '''
+        Outputs:
+            (list of str) the text, one line at a time
+        '''
+        return str(self).split('\n')
+
+
+class GroupStats(Summary):
+    '''
+    Statistics of the tweets by followers of one candidate (or mentioning
+    them), or by followers of one candidate mentioning another.
+    '''
+    kind = 'group'
+
+    def __init__(self, handles, summary, mean_diff, positive, negative, neutral):
+        '''
+        Inputs:
+            handles: (tuple of str) one candidate, or the followed and the
+                     mentioned candidate
+            summary: (pandas.Series) five-number summary of the scores
+            mean_diff: (float) mean score of all tweets minus that of these
+            positive, negative, neutral: (list of str) 3 most positive,
+                     most negative and median tweets
+        '''
+        self.handles = tuple(handles)
+        self.summary = summary
+        self.mean_diff = mean_diff
+        self.positive = list(positive)
+        self.negative = list(negative)
+        self.neutral = list(neutral)
+
+    def heading(self):
+        if len(self.handles) == 2:
+            return '{} and mentioning {}'.format(*self.handles)
+        return self.handles[0]
+
+    def __str__(self):
+        return GROUP_TEMPLATE.format(self.heading(), self.summary.to_string(),
+                                     str(self.mean_diff), format_tweets(self.positive),
+                                     format_tweets(self.negative),
+                                     format_tweets(self.neutral))
+
+
+class SentimentSummary(Summary):
+    '''
+    GroupStats of every candidate or pair of candidates with at least 5
+    tweets.
+    '''
+    kind = 'sentiment'
+
+    def __init__(self, groups, title=''):
+        '''
+        Inputs:
+            groups: (list of GroupStats)
+            title: (str) line above the groups
+        '''
+        self.groups = groups
+        self.title = title
+
+    def __str__(self):
+        return self.title + (''.join(map(str, self.groups)) or FEW_TWEETS)
+
+
+class FollowSummary(Summary):
+    '''
+    How many tweets have follow data, and how many of those are by followers
+    of each candidate.
+    '''
+    kind = 'follows'
+
+    def __init__(self, n_tweets, n_known, follows):
+        '''
+        Inputs:
+            n_tweets: (int) tweets in the dataset
+            n_known: (int) tweets whose author's follows are known
+            follows: (list of tuples) of candidate handle and number of those
+                     tweets by followers of the candidate
+        '''
+        self.n_tweets = n_tweets
+        self.n_known = n_known
+        self.follows = follows
+
+    def __str__(self):
+        rv = ["Of the {} tweets {} have data on who user \
+                is following\n".format(self.n_tweets, self.n_known)]
+        rv.extend("Of those {} tweets,\
+                   {} follow {}\n".format(self.n_known, n, handle)
+                  for handle, n in self.follows)
+        return ''.join(rv)
+
+
+class MentionSummary(Summary):
+    '''
+    How many tweets tag or mention any candidate, and how many of those
+    mention each candidate.
+    '''
+    kind = 'mentions'
+
+    def __init__(self, n_tweets, n_mention, mentions):
+        '''
+        Inputs:
+            n_tweets: (int) tweets in the dataset
+            n_mention: (int) tweets tagging or mentioning any candidate
+            mentions: (list of tuples) of candidate handle and number of
+                      tweets mentioning the candidate
+        '''
+        self.n_tweets = n_tweets
+        self.n_mention = n_mention
+        self.mentions = mentions
+
+    def mention_percent(self):
+        return percent(self.n_mention, self.n_tweets)
+
+    def candidate_percent(self, n):
+        return percent(n, self.n_mention)
+
+    def __str__(self):
+        rv = ["Of the {} tweets gathered, {} ({} %) tag one of the candidates \
+               or mention them by an \
+               alias \n".format(self.n_tweets, self.n_mention, self.mention_percent())]
+        rv.extend("Of the {} tweets that mention any candidate, \
+                  {} ({} %) mention {} \
+                  \n".format(self.n_mention, n, self.candidate_percent(n), handle)
+                  for handle, n in self.mentions)
+        return ''.join(rv)
@@ -0,0 +1,110 @@
+'''
+Synthetic tweets that look enough like the real ones to exercise every
+branch of the pipeline, shared by the benchmarks and the tests.
+'''
+import random
+import pandas as pd
+from fast_vader import FastVader
+
+WORDS = ["vote", "election", "primary", "debate", "great", "terrible",
+         "love", "hate", "not", "very", "but", "tonight", "results",
+         "polls", "win", "lose", "amazing", "awful", "the", "and", "is"]
+CANDIDATE_POOL = {"@BernieSanders": ["Bernie", "Sanders"],
+                  "@JoeBiden": ["Biden"],
+                  "@realDonaldTrump": ["Trump"],
+                  "@ewarren": ["Warren"],
+                  "@MikeBloomberg": ["Bloomberg"],
+                  "@PeteButtigieg": ["Pete", "Buttigieg"]}
+CANDIDATES = dict(list(CANDIDATE_POOL.items())[:3])
+LOCATIONS = ["New York, NY", "Los Angeles, CA", "Chicago, IL", "Austin, TX",
+             "Sacramento, CA", ""]
+
+
+def synthetic_tweets(n_rows, seed=0, candidates=CANDIDATES, alias_rate=None,
+                     handle_rate=0.5, url_rate=0.3):
+    '''
+    Generates tweets that look enough like the real ones to exercise every
+    branch of the normalizer (handles, links, punctuation, stopwords).
+
+    Inputs:
+        n_rows: (int) number of tweets
+        seed: (int) random seed
+        candidates: (dict) of candidate handle to list of aliases
+        alias_rate: (float) chance of each word being a candidate alias, or
+                    None to draw aliases as often as any other word
+        handle_rate: (float) fraction of tweets tagging a candidate
+        url_rate: (float) fraction of tweets ending in a link
+    Outputs:
+        (pandas.Series of str)
+    '''
+    rng = random.Random(seed)
+    handles = list(candidates.keys())
+    aliases = [a for names in candidates.values() for a in names]
+    tweets = []
+    for _ in range(n_rows):
+        n_words = rng.randint(5, 20)
+        if alias_rate is None:
+            words = rng.choices(WORDS + aliases, k=n_words)
+        else:
+            words = [rng.choice(aliases) if aliases and rng.random() < alias_rate
+                     else rng.choice(WORDS) for _ in range(n_words)]
+        if handles and rng.random() < handle_rate:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(handles))
+        if rng.random() < url_rate:
+            words.append("https://t.co/{:08x}".format(rng.getrandbits(32)))
+        tweets.append(' '.join(words) + rng.choice(['!', '?', '...', '']))
+    return pd.Series(tweets, dtype=object)
+
+
+def synthetic_frame(n_rows, seed=0, candidates=CANDIDATES, follow_rate=0.3,
+                    null_rate=0.2, **tweet_options):
+    '''
+    Generates the DataFrame search_tweets would build: tweets, authors,
+    locations and whether each author follows each candidate.
+
+    Inputs:
+        n_rows: (int) number of tweets
+        seed: (int) random seed
+        candidates: (dict) of candidate handle to list of aliases
+        follow_rate: (float) chance of an author following a candidate
+        null_rate: (float) fraction of authors whose follows are unknown
+        tweet_options: keyword arguments of synthetic_tweets
+    Outputs:
+        (pandas.DataFrame)
+    '''
+    rng = random.Random(seed)
+    n_users = max(1, int(n_rows * 0.7))
+    users = [rng.randrange(n_users) for _ in range(n_rows)]
+    df = pd.DataFrame({'TweetText': synthetic_tweets(n_rows, seed, candidates,
+                                                     **tweet_options),
+                       'user_id': users,
+                       'User Location': [rng.choice(LOCATIONS) for _ in range(n_rows)]})
+    # Follows belong to the author, so every tweet by a user agrees.
+    unknown = {u: rng.random() < null_rate for u in set(users)}
+    for handle in candidates:
+        follows = {u: rng.random() < follow_rate for u in unknown}
+        df['Follows ' + handle] = [None if unknown[u] else follows[u] for u in users]
+    return df
+
+
+def vader_conformance_texts(analyzer, n_texts, seed=0):
+    '''
+    Word salad of lexicon words mixed with the words VADER's rules look for
+    (boosters, negations, "least", "kind of", "never so", idioms), with
+    repeats, to check FastVader against polarity_scores.
+    '''
+    rng = random.Random(seed)
+    fast = FastVader(analyzer)
+    rule_words = ['kind', 'of', 'least', 'at', 'very', 'so', 'this', 'never', 'but',
+                  'the', 'sort', 'just', 'enough', 'yeah', 'right', 'cut', 'mustard',
+                  'kiss', 'death', 'hand', 'to', 'mouth', 'bomb', 'shit', 'bad', 'ass']
+    rule_words += list(fast.booster) + list(fast.negate)
+    lexicon = [w for w in analyzer.lexicon if w.isalpha() and w.islower()]
+    texts = []
+    for _ in range(n_texts):
+        words = [rng.choice(rule_words) if rng.random() < 0.5 else rng.choice(lexicon)
+                 for _ in range(rng.randint(0, 25))]
+        texts.append(' '.join(words))
+    texts += ['great but bad', 'I LOVE it!', 'at least good', 'not at least good',
+              'kind of good', 'never so good', 'cut the mustard', 'a good good']
+    return texts
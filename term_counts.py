@@ -0,0 +1,102 @@
+'''
+Bounded counts of the most frequent words of processed tweets, for the word
+cloud. Counts are added a batch of tweets at a time as the tweets are
+scored, so drawing the cloud never goes back over the tweets themselves.
+
+The counts are a Space-Saving sketch: at most `capacity` words are tracked.
+A word that is not tracked starts from the count of the last word evicted
+(the floor), so every count is an overestimate by at most its recorded
+error, and any word seen more often than the floor is always tracked.
+'''
+import heapq
+from collections import Counter
+from itertools import chain
+from operator import itemgetter
+
+DEFAULT_CAPACITY = 4096
+BATCH_SIZE = 50000
+
+
+class TermCounts():
+    '''
+    Space-Saving heavy hitters sketch over the words of processed tweets.
+    '''
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        '''
+        Inputs:
+            capacity: (int) most words tracked at once
+        '''
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.floor = 0
+        self.words = 0
+
+    def update(self, processed):
+        '''
+        Counts the words of a column of processed tweets.
+
+        Inputs:
+            processed: (iterable of str) lowercase words separated by spaces
+        '''
+        processed = list(processed)
+        for i in range(0, len(processed), BATCH_SIZE):
+            batch = Counter(chain.from_iterable(
+                map(str.split, processed[i:i + BATCH_SIZE])))
+            self.add_counts(batch)
+
+    def add_counts(self, batch):
+        '''
+        Adds exact counts of a batch of words, then evicts the least
+        frequent words beyond capacity.
+
+        Inputs:
+            batch: (dict) of word to number of occurrences
+        '''
+        for word, n in batch.items():
+            if word in self.counts:
+                self.counts[word] += n
+            else:
+                self.counts[word] = self.floor + n
+                self.errors[word] = self.floor
+            self.words += n
+        if len(self.counts) > self.capacity:
+            kept = heapq.nlargest(self.capacity + 1, self.counts.items(),
+                                  key=itemgetter(1))
+            self.floor = max(self.floor, kept.pop()[1])
+            self.counts = dict(kept)
+            self.errors = {word: self.errors[word] for word in self.counts}
+
+    def top(self, k, exclude=()):
+        '''
+        Inputs:
+            k: (int) number of words
+            exclude: (set of str) words to leave out
+        Outputs:
+            (list of tuples) of the k most frequent words and their counts,
+            most frequent first
+        '''
+        return heapq.nlargest(k, ((word, n) for word, n in self.counts.items()
+                                  if word not in exclude), key=itemgetter(1))
+
+    def state(self):
+        '''
+        Outputs:
+            (dict) of plain values that from_state() rebuilds the sketch from,
+            e.g. after a round trip through JSON
+        '''
+        return {'capacity': self.capacity, 'floor': self.floor, 'words': self.words,
+                'counts': self.counts, 'errors': self.errors}
+
+    @classmethod
+    def from_state(cls, state):
+        terms = cls(state['capacity'])
+        terms.floor = state['floor']
+        terms.words = state['words']
+        terms.counts = dict(state['counts'])
+        terms.errors = dict(state['errors'])
+        return terms
+
+    def __len__(self):
+        return len(self.counts)
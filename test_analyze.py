@@ -0,0 +1,87 @@
+'''
+TweetData.add_tweets gives the same data and summaries as building the
+TweetData from all the tweets at once, and compact_schema changes none of
+the summaries.
+'''
+from itertools import permutations
+import pandas as pd
+import pytest
+import analyze
+from analyze import TweetData
+from synthetic import CANDIDATES, synthetic_frame
+from summaries import summary_sections
+
+PARAMS = {"search_word": "vote", "candidates": CANDIDATES, "geocode": None,
+          "result_type": "recent"}
+
+
+@pytest.fixture(scope='module')
+def frames():
+    df = synthetic_frame(2400, seed=3)
+    df['Time Searched'] = pd.date_range('2020-03-03', periods=len(df), freq='41s')
+    return df.iloc[:1000].reset_index(drop=True), df.iloc[1000:].reset_index(drop=True)
+
+
+def assert_same(added, rebuilt):
+    assert added.data.equals(rebuilt.data)
+    assert added.fingerprint() == rebuilt.fingerprint()
+    assert added.terms.counts == rebuilt.terms.counts
+    assert dict(summary_sections(added)) == dict(summary_sections(rebuilt))
+    assert added.trends().to_json('hour') == rebuilt.trends().to_json('hour')
+
+
+def test_equals_rebuild(frames):
+    first, second = frames
+    added = TweetData(first.copy(), dict(PARAMS))
+    added.trends()
+    assert added.add_tweets(second) == len(second)
+    rebuilt = TweetData(pd.concat(frames, ignore_index=True), dict(PARAMS))
+    assert_same(added, rebuilt)
+
+
+def test_in_batches(frames):
+    first, second = frames
+    added = TweetData(first.copy(), dict(PARAMS))
+    for start in range(0, len(second), 500):
+        added.add_tweets(second.iloc[start:start + 500])
+    rebuilt = TweetData(pd.concat(frames, ignore_index=True), dict(PARAMS))
+    assert_same(added, rebuilt)
+
+
+def test_leaves_df_unchanged(frames):
+    first, second = frames
+    added = TweetData(first.copy(), dict(PARAMS))
+    new = second.iloc[::-1]
+    before = new.copy()
+    added.add_tweets(new)
+    assert new.equals(before)
+    assert new.index.equals(before.index)
+
+
+def test_labels_after_existing(frames):
+    # Neither frame is labelled 0 to n - 1
+    first, second = frames
+    added = TweetData(first.set_index(first.index + 5000), dict(PARAMS))
+    added.add_tweets(second.set_index(second.index + 10))
+    assert added.data.index.is_unique
+    rebuilt = TweetData(pd.concat(frames, ignore_index=True), dict(PARAMS))
+    assert added.data.reset_index(drop=True).equals(rebuilt.data.reset_index(drop=True))
+
+
+def test_compact_schema_keeps_summaries(frames, monkeypatch):
+    df = pd.concat(frames, ignore_index=True)
+    # Some follows are unknown
+    df.loc[::9, [col for col in df.columns if col.startswith('Follows')]] = None
+    compact = TweetData(df.copy(), dict(PARAMS))
+    monkeypatch.setattr(analyze, 'compact_schema', lambda data, keep_processed=True: data)
+    plain = TweetData(df.copy(), dict(PARAMS))
+    assert compact.data['Follows @JoeBiden'].dtype.name == 'category'
+    assert plain.data['Follows @JoeBiden'].dtype == object
+    assert compact.data.memory_usage(deep=True).sum() < \
+        plain.data.memory_usage(deep=True).sum()
+    assert dict(summary_sections(compact)) == dict(summary_sections(plain))
+    groups = [(handle, col) for handle in CANDIDATES for col in ('Follows ', 'Mentions ')]
+    groups += [(pair, '') for pair in permutations(CANDIDATES, 2)]
+    stats = [compact.calc_stats(handle, col) for handle, col in groups]
+    assert all(stats)
+    assert stats == [plain.calc_stats(handle, col) for handle, col in groups]
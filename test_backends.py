@@ -0,0 +1,43 @@
+'''
+Every backend scores the same in worker processes as in this one, a model
+trained in memory included.
+'''
+import numpy as np
+import pandas as pd
+import pytest
+import backends
+from classifier import Classifier, normalize_tweets
+from synthetic import synthetic_tweets
+
+
+@pytest.fixture(scope='module')
+def tweets():
+    return pd.Series(synthetic_tweets(600, seed=5), dtype=object)
+
+
+def ngram_backend(tweets):
+    processed = normalize_tweets(tweets).tolist()
+    positive = np.array(['love' in text or 'great' in text for text in tweets])
+    return backends.NgramBackend.train(processed, positive, n_features=2 ** 12,
+                                       epochs=5)
+
+
+@pytest.mark.parametrize('name', sorted(backends.BACKENDS))
+def test_parallel_scores_match_serial(tweets, name):
+    if name == backends.NgramBackend.name:
+        backend = ngram_backend(tweets)
+    else:
+        backend = backends.make(name)
+    classifier = Classifier(None, workers=1, chunk_size=200, backend=backend)
+    serial_processed, serial_scores = classifier.score_tweets(tweets)
+    processed, scores = classifier.score_parallel(tweets, 2)
+    assert processed.equals(serial_processed)
+    assert scores.equals(serial_scores)
+
+
+def test_trained_model_has_no_file(tweets, tmp_path):
+    backend = ngram_backend(tweets)
+    backend.path = str(tmp_path / 'missing.npz')
+    rebuilt = backends.make(backend.name, **backend.options())
+    processed = normalize_tweets(tweets).tolist()
+    assert np.array_equal(rebuilt.score_batch(processed), backend.score_batch(processed))
@@ -0,0 +1,104 @@
+'''
+run_batch with fake searches: shared scores, repeated specs, failures and
+the comparison table.
+'''
+import pickle
+import pandas as pd
+import pytest
+import batch
+from analyze import TweetData
+from synthetic import CANDIDATES, synthetic_frame
+from summaries import summary_sections
+
+
+def params(search_word):
+    return {"search_word": search_word, "candidates": CANDIDATES, "geocode": None,
+            "result_type": "recent"}
+
+
+@pytest.fixture
+def searches(monkeypatch):
+    frames = {'vote': synthetic_frame(300, seed=1), 'primary': synthetic_frame(200, seed=2)}
+    # The second search pulls some of the same tweets as the first
+    frames['primary'] = pd.concat([frames['primary'], frames['vote'].iloc[:50]],
+                                  ignore_index=True)
+    calls = []
+
+    def search_frame(search_word, loc, result_type='recent', candidates=None):
+        calls.append(search_word)
+        if search_word == 'fail':
+            raise RuntimeError('search failed')
+        if search_word not in frames:
+            return None
+        return frames[search_word].copy(), params(search_word), 7
+
+    def load_historical(name):
+        raise FileNotFoundError(name + '.csv')
+
+    monkeypatch.setattr(batch, 'search_frame', search_frame)
+    monkeypatch.setattr(batch, 'load_historical', load_historical)
+    return frames, calls
+
+
+def test_spec_error():
+    assert batch.spec_error({"search_word": "vote"}) is None
+    assert batch.spec_error({"historical": "CA_Super_Tuesday"}) is None
+    assert batch.spec_error({}) is not None
+    assert batch.spec_error({"search_word": "vote", "historical": "x"}) is not None
+    assert batch.spec_error({"historical": 3}) is not None
+    assert batch.spec_error({"search_word": "vote", "loc": {"city": "Chicago"}}) is not None
+    assert batch.spec_error({"search_word": "vote", "candidates": ["@JoeBiden"]}) is not None
+
+
+def test_same_as_separate_searches(searches):
+    frames, calls = searches
+    result = batch.run_batch([{"search_word": "vote"}, {"search_word": "primary"}])
+    assert result.errors == [None, None]
+    assert result.n_pulled == 550
+    assert result.n_scored == len(pd.unique(pd.concat(
+        [frames['vote']['TweetText'], frames['primary']['TweetText']])))
+    for word, tweets, summary in zip(['vote', 'primary'], result.tweets, result.summaries):
+        alone = TweetData(frames[word].copy(), params(word))
+        assert summary == dict(summary_sections(alone))
+        assert tweets.data.equals(alone.data)
+        assert tweets.since_id == 7
+        # The batch's shared scores are not kept, so results pickle small
+        assert tweets.cache is None
+        assert 'SharedScores' not in repr(pickle.loads(pickle.dumps(tweets)).__dict__)
+
+
+def test_repeated_specs_run_once(searches):
+    frames, calls = searches
+    result = batch.run_batch([{"label": "a", "search_word": "vote"},
+                              {"label": "b", "search_word": "vote"}])
+    assert calls == ['vote']
+    assert result.tweets[0] is result.tweets[1]
+    assert list(result.comparison.index) == ['a', 'b']
+
+
+def test_failed_specs_report_errors(searches):
+    result = batch.run_batch([{"search_word": "fail"}, {"search_word": "nowhere"},
+                              {"historical": "missing"}, {"search_word": "vote"}])
+    assert result.errors[:3] == ["RuntimeError: search failed", None,
+                                 "FileNotFoundError: missing.csv"]
+    assert result.tweets[:3] == [None, None, None]
+    assert result.errors[3] is None and result.tweets[3] is not None
+    assert list(result.comparison.index) == ['vote']
+    report = result.to_json()
+    assert [entry['error'] for entry in report['results']] == result.errors
+
+
+def test_comparison_row(searches):
+    result = batch.run_batch([{"search_word": "vote"}])
+    row = result.comparison.loc['vote']
+    scores = result.tweets[0].data['Score']
+    assert row['tweets'] == len(scores)
+    assert row['mean_score'] == pytest.approx(scores.mean())
+    assert row['median_score'] == pytest.approx(scores.median())
+    assert row['positive'] == pytest.approx((scores > 0.05).mean())
+    assert row['negative'] == pytest.approx((scores < -0.05).mean())
+    assert row['positive'] + row['neutral'] + row['negative'] == pytest.approx(1)
+    for handle in CANDIDATES:
+        if 'mentions ' + handle in row:
+            mentions = result.tweets[0].data['Mentions ' + handle]
+            assert row['mentions ' + handle] == mentions.sum()
@@ -0,0 +1,86 @@
+'''
+ScoreCache hits, misses, eviction and versions, and Classifier scores read
+through it.
+'''
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+import pytest
+import cache
+from cache import ScoreCache
+from classifier import Classifier
+
+
+class Clock():
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        self.now += 1
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, 'time', SimpleNamespace(time=clock.time))
+    return clock
+
+
+def test_hits_and_misses():
+    scores = ScoreCache(':memory:')
+    scores.put_many([('a', 'p', 0.5)], 'v')
+    assert scores.get_many(['a', 'b', 'a'], 'v') == {'a': ('p', 0.5)}
+    assert (scores.hits, scores.misses) == (2, 1)
+
+
+def test_versions_do_not_share_entries():
+    scores = ScoreCache(':memory:')
+    scores.put_many([('a', 'p', 0.5)], 'v1')
+    assert scores.get_many(['a'], 'v2') == {}
+    scores.put_many([('a', 'q', -0.5)], 'v2')
+    assert scores.get_many(['a'], 'v1') == {'a': ('p', 0.5)}
+    assert scores.get_many(['a'], 'v2') == {'a': ('q', -0.5)}
+    assert len(scores) == 2
+
+
+def test_least_recently_used_are_evicted(clock):
+    scores = ScoreCache(':memory:', max_entries=3)
+    scores.put_many([('a', 'a', 0.1), ('b', 'b', 0.2), ('c', 'c', 0.3)], 'v')
+    scores.get_many(['a'], 'v')
+    scores.put_many([('d', 'd', 0.4)], 'v')
+    assert set(scores.get_many(['a', 'b', 'c', 'd'], 'v')) == {'a', 'c', 'd'}
+    assert len(scores) == scores.count() == 3
+
+
+def test_put_again_keeps_count():
+    scores = ScoreCache(':memory:')
+    scores.put_many([('a', 'p', 0.5), ('b', 'p', 0.5)], 'v')
+    scores.put_many([('a', 'q', 0.25)], 'v')
+    assert len(scores) == scores.count() == 2
+    assert scores.get_many(['a'], 'v') == {'a': ('q', 0.25)}
+
+
+def test_reopened_file(tmp_path):
+    path = str(tmp_path / 'scores.sqlite')
+    ScoreCache(path).put_many([('a', 'p', 0.5)], 'v')
+    reopened = ScoreCache(path)
+    assert len(reopened) == 1
+    assert reopened.get_many(['a'], 'v') == {'a': ('p', 0.5)}
+
+
+def test_warm_classifier_reads_the_cache():
+    tweets = pd.DataFrame({'TweetText': ['I love it', 'I hate it', 'I love it', 'meh']})
+    scores = ScoreCache(':memory:')
+    cold = Classifier(tweets.copy(), cache=scores).scored_df
+    assert (scores.hits, scores.misses) == (0, 4)
+    warm = Classifier(tweets.copy(), cache=scores).scored_df
+    assert (scores.hits, scores.misses) == (4, 4)
+    assert warm.equals(cold)
+    assert warm.equals(Classifier(tweets.copy(), cache=None).scored_df)
+
+
+def test_missing_text_scores_as_uncached():
+    tweets = pd.DataFrame({'TweetText': ['I love it', np.nan, 'I hate it', None]})
+    cached = Classifier(tweets.copy(), cache=ScoreCache(':memory:')).scored_df
+    assert cached.equals(Classifier(tweets.copy(), cache=None).scored_df)
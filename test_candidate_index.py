@@ -0,0 +1,71 @@
+'''
+CandidateIndex bitsets give the same rows as matching the tweet text and
+follow columns directly, also after extend().
+'''
+import numpy as np
+import pandas as pd
+import pytest
+from candidate_index import CandidateIndex, alternation, pack
+from synthetic import CANDIDATES, synthetic_frame
+
+FOLLOWS = ['Follows ' + handle for handle in CANDIDATES]
+
+
+@pytest.fixture(scope='module')
+def data():
+    df = synthetic_frame(1000, seed=4)
+    df.loc[::11, FOLLOWS] = None
+    return df
+
+
+def mentions(data, handle):
+    return data['TweetText'].str.contains(alternation([handle] + CANDIDATES[handle])).values
+
+
+def assert_matches(index, data):
+    names = [name for handle, aliases in CANDIDATES.items() for name in [handle] + aliases]
+    assert index.n == len(data)
+    assert np.array_equal(index.mask(index.mention_any),
+                          data['TweetText'].str.contains(alternation(names)).values)
+    for handle in CANDIDATES:
+        assert np.array_equal(index.mask(index.mentions[handle]), mentions(data, handle))
+        assert np.array_equal(index.mask(index.tags[handle]),
+                              data['TweetText'].str.contains(handle).values)
+        assert np.array_equal(index.mask(index.follows['Follows ' + handle]),
+                              (data['Follows ' + handle] == True).values)
+    assert index.follow_columns == FOLLOWS
+    assert np.array_equal(index.mask(index.follows_known), data[FOLLOWS[0]].notna().values)
+
+
+def test_bitsets_match_the_data(data):
+    index = CandidateIndex(data, CANDIDATES)
+    assert_matches(index, data)
+    assert index.nbytes() == (2 + 3 * len(CANDIDATES)) * ((len(data) + 7) // 8)
+
+
+def test_count_and_follows_and_mentions(data):
+    index = CandidateIndex(data, CANDIDATES)
+    first, second = list(CANDIDATES)[:2]
+    bits = index.follows_and_mentions(first, second)
+    expected = (data['Follows ' + first] == True).values & mentions(data, second)
+    assert np.array_equal(index.mask(bits), expected)
+    assert index.count(bits) == expected.sum()
+    assert index.count(pack(np.zeros(13, dtype=bool))) == 0
+
+
+def test_added_candidates(data):
+    index = CandidateIndex(data, {})
+    assert index.count(index.mention_any) == 0
+    index.add_candidates(CANDIDATES)
+    for handle in CANDIDATES:
+        assert np.array_equal(index.mask(index.mentions[handle]), mentions(data, handle))
+
+
+def test_extend(data):
+    old, new = data.iloc[:600], data.iloc[600:]
+    index = CandidateIndex(old, CANDIDATES)
+    # Merged in an order that interleaves old and new rows
+    order = np.random.RandomState(2).permutation(len(data))
+    merged = pd.concat([old, new]).iloc[order]
+    index.extend(new, merged, order)
+    assert_matches(index, merged)
@@ -0,0 +1,114 @@
+'''
+The word cloud shows whole words, without stopwords or the search terms,
+and ChartCache draws each chart of a dataset once.
+'''
+import threading
+import pandas as pd
+import pytest
+from wordcloud import STOPWORDS
+from analyze import TweetData
+from synthetic import CANDIDATES
+import charts
+from charts import ChartCache, word_labels, wordcloud_frequencies
+
+PARAMS = {"search_word": "voting", "candidates": CANDIDATES, "geocode": None,
+          "result_type": "recent"}
+TWEETS = ["Amazing debate tonight, however the election is amazing!",
+          "The elections were amazing, would vote again",
+          "Voting is amazing however you look at it",
+          "Elections, elections, elections. Also amazed."]
+
+
+def test_word_labels():
+    labels = word_labels(['amaz', 'elect', 'xyz'], TWEETS)
+    assert labels == {'amaz': 'amazing', 'elect': 'elections', 'xyz': 'xyz'}
+
+
+def test_wordcloud_frequencies():
+    tweets = TweetData(pd.DataFrame({'TweetText': TWEETS}), dict(PARAMS))
+    frequencies = wordcloud_frequencies(tweets, STOPWORDS)
+    assert frequencies['amazing'] == 5
+    assert frequencies['elections'] == 5
+    assert frequencies['debate'] == 1
+    # "however" and "also" are WordCloud stopwords, "voting" and "vote" the
+    # search term
+    assert not {'however', 'howev', 'also', 'voting', 'vote', 'amaz'} & set(frequencies)
+
+
+def test_labels_from_all_scores(monkeypatch):
+    # Sorted by score the negative tweets come first; most tweets write
+    # "election"
+    texts = ["Terrible elections"] * 3 + ["Great election, love it"] * 6
+    tweets = TweetData(pd.DataFrame({'TweetText': texts}), dict(PARAMS))
+    assert tweets.data['TweetText'].iloc[0] == texts[0]
+    monkeypatch.setattr(charts, 'WORDCLOUD_SAMPLE', 4)
+    frequencies = wordcloud_frequencies(tweets, STOPWORDS)
+    assert frequencies['election'] == 9
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    # Renderers that record what they drew; 'slow' waits for a release
+    drawn = []
+    release = threading.Event()
+
+    def renderer(name):
+        def render(tweets):
+            if name == 'slow':
+                release.wait(10)
+            drawn.append((tweets.fingerprint(), name))
+            return '{} {}'.format(name, len(drawn)).encode()
+        return render
+
+    for name in ['wordcloud', 'trend', 'slow']:
+        monkeypatch.setitem(charts.RENDERERS, name, renderer(name))
+    monkeypatch.delitem(charts.RENDERERS, 'visual')
+    return drawn, release
+
+
+def tweet_data(texts=TWEETS):
+    return TweetData(pd.DataFrame({'TweetText': texts}), dict(PARAMS))
+
+
+def test_chart_cache_draws_once(renders):
+    drawn, _ = renders
+    cache = ChartCache()
+    png, etag = cache.get(tweet_data(), 'wordcloud')
+    # The same tweets analyzed again are the same dataset
+    assert cache.get(tweet_data(), 'wordcloud') == (png, etag)
+    assert len(drawn) == 1
+    other_png, other_etag = cache.get(tweet_data(TWEETS[:2]), 'wordcloud')
+    assert other_etag != etag and len(drawn) == 2
+    assert cache.get(tweet_data(), 'trend')[1] not in (etag, other_etag)
+
+
+def test_chart_cache_evicts_least_recently_used(renders):
+    drawn, _ = renders
+    cache = ChartCache(max_entries=2)
+    datasets = [tweet_data(TWEETS[:n]) for n in (1, 2, 3)]
+    cache.get(datasets[0], 'trend')
+    cache.get(datasets[1], 'trend')
+    cache.get(datasets[0], 'trend')
+    cache.get(datasets[2], 'trend')
+    assert len(drawn) == 3
+    cache.get(datasets[0], 'trend')
+    assert len(drawn) == 3
+    cache.get(datasets[1], 'trend')
+    assert len(drawn) == 4
+
+
+def test_chart_cache_waits_for_prerender(renders):
+    drawn, release = renders
+    cache = ChartCache()
+    tweets = tweet_data()
+    cache.prerender(tweets)
+    cache.prerender(tweets)
+    got = []
+    waiting = threading.Thread(target=lambda: got.append(cache.get(tweets, 'slow')))
+    waiting.start()
+    release.set()
+    waiting.join(10)
+    cache.pool.shutdown(wait=True)
+    assert sorted(name for _, name in drawn) == ['slow', 'trend', 'wordcloud']
+    assert got == [cache.get(tweets, 'slow')]
+    assert not cache.pending
@@ -0,0 +1,73 @@
+'''
+Datasets saved as Parquet or Arrow load back as the same TweetData, with
+the same summaries, without being scored again.
+'''
+import pandas as pd
+import pytest
+import dataset
+from analyze import TweetData
+from synthetic import CANDIDATES, synthetic_frame
+from summaries import summary_sections
+
+PARAMS = {"search_word": "vote", "candidates": CANDIDATES, "geocode": None,
+          "result_type": "recent"}
+
+
+@pytest.fixture(scope='module')
+def csv_path(tmp_path_factory):
+    df = synthetic_frame(1500, seed=8)
+    df['Time Searched'] = pd.date_range('2020-03-03', periods=len(df), freq='53s')
+    path = tmp_path_factory.mktemp('tweets') / 'tweets.csv'
+    df.to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.fixture(scope='module')
+def tweets(csv_path):
+    tweets = TweetData(pd.read_csv(csv_path), dict(PARAMS))
+    tweets.since_id = 1234
+    return tweets
+
+
+@pytest.mark.parametrize('suffix', ['.parquet', '.arrow'])
+def test_round_trip(tweets, tmp_path, monkeypatch, suffix):
+    path = str(tmp_path / ('tweets' + suffix))
+    dataset.save_scored(tweets, path)
+
+    def rescored(*args, **kwargs):
+        raise AssertionError("a saved dataset is scored again")
+    monkeypatch.setattr('analyze.Classifier', rescored)
+    loaded = dataset.load_tweets(path)
+    # Processed text is read back as pandas strings
+    assert loaded.data.astype({'ProcessedTweet': object}).equals(tweets.data)
+    assert loaded.data.index.equals(tweets.data.index)
+    assert loaded.fingerprint() == tweets.fingerprint()
+    assert loaded.terms.counts == tweets.terms.counts
+    assert loaded.since_id == 1234
+    assert dict(summary_sections(loaded)) == dict(summary_sections(tweets))
+
+
+@pytest.mark.parametrize('suffix', ['.parquet', '.arrow'])
+def test_read_columns(tweets, tmp_path, suffix):
+    path = str(tmp_path / ('tweets' + suffix))
+    dataset.save_scored(tweets, path)
+    data, params = dataset.read_scored(path, columns=['Score'])
+    assert list(data.columns) == ['Score']
+    assert data['Score'].tolist() == tweets.data['Score'].tolist()
+    assert params['search_word'] == 'vote'
+    assert params['candidates'] == CANDIDATES
+
+
+def test_foreign_file(tmp_path):
+    path = str(tmp_path / 'other.parquet')
+    pd.DataFrame({'Score': [0.5]}).to_parquet(path)
+    with pytest.raises(ValueError):
+        dataset.read_scored(path)
+
+
+def test_convert_csv(csv_path, tweets, tmp_path):
+    path = str(tmp_path / 'converted.arrow')
+    converted = dataset.convert_csv(csv_path, path, dict(PARAMS), chunk_size=400)
+    loaded = dataset.load_tweets(path)
+    assert loaded.data.astype({'ProcessedTweet': object}).equals(converted.data)
+    assert dict(summary_sections(loaded)) == dict(summary_sections(tweets))
@@ -0,0 +1,47 @@
+'''
+FastVader gives the same compound scores as
+SentimentIntensityAnalyzer.polarity_scores.
+'''
+import pytest
+from nltk.sentiment.vader import SentimentIntensityAnalyzer
+from synthetic import synthetic_tweets, vader_conformance_texts
+from classifier import normalize_tweets
+from fast_vader import FastVader
+
+# Text FastVader passes to polarity_scores, and lowercase text whose rules
+# it applies itself
+CORPUS = [
+    '', 'good', 'not good', 'very good', 'kind of good', 'at least good',
+    'not at least good', 'never so good', 'never this good', 'cut the mustard',
+    'hand to mouth', 'the bomb', 'bad ass', 'good good', 'good not good',
+    'great but bad', 'bad but great', 'it was ok but the ending was awful',
+    'I LOVE it', 'I love it!!', 'GOOD but BAD', 'Not Bad At All', 'what?!',
+    'this is :) great', "don't like it", 'no no no', 'extremely horrible day',
+    'The Best candidate, but not the most liked.',
+]
+
+
+@pytest.fixture(scope='module')
+def analyzer():
+    return SentimentIntensityAnalyzer()
+
+
+def expected(analyzer, texts):
+    return [analyzer.polarity_scores(text)['compound'] for text in texts]
+
+
+def test_corpus(analyzer):
+    assert FastVader(analyzer).polarity_compound(CORPUS).tolist() == expected(
+        analyzer, CORPUS)
+
+
+def test_rule_words(analyzer):
+    texts = vader_conformance_texts(analyzer, 5000)
+    assert FastVader(analyzer).polarity_compound(texts).tolist() == expected(
+        analyzer, texts)
+
+
+def test_processed_tweets(analyzer):
+    texts = normalize_tweets(synthetic_tweets(2000)).tolist()
+    assert FastVader(analyzer).polarity_compound(texts).tolist() == expected(
+        analyzer, texts)
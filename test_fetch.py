@@ -0,0 +1,77 @@
+'''
+Fetcher and Scheduler against fake_api.FakeAPI: calls stay within Twitter's
+windows, rate limited calls are retried and calls that cannot be made before
+a deadline are given up.
+'''
+from fake_api import FakeAPI
+from fetch import WINDOW_MARGIN, Fetcher, Scheduler, UserIds
+
+LIMITS = {'search': (4, 60), 'get_user': (2, 60), 'show_friendship': (5, 60)}
+SCREEN_NAMES = ['@JoeBiden', '@BernieSanders', '@ewarren']
+
+
+def fetcher(clock, api_limits=LIMITS, limits=LIMITS, **kwargs):
+    api = FakeAPI(latency=0, limits=api_limits, clock=clock, **kwargs)
+    scheduler = Scheduler(limits, clock, clock.sleep)
+    return Fetcher(api, scheduler, UserIds(':memory:')), api
+
+
+def test_search_pages(clock):
+    fetch, api = fetcher(clock, n_tweets=1000)
+    tweets, complete = fetch.search(650, q='vote')
+    assert complete
+    assert [t.id for t in tweets] == list(range(1000, 350, -1))
+    assert api.calls['search'] == 7
+    assert not any(api.rejected.values())
+    # Seven pages at four a window
+    assert clock() == 60 * (1 + WINDOW_MARGIN)
+
+
+def test_search_since_id(clock):
+    fetch, api = fetcher(clock, n_tweets=300)
+    tweets, complete = fetch.search(1000, q='vote', since_id=120)
+    assert complete
+    assert [t.id for t in tweets] == list(range(300, 120, -1))
+
+
+def test_search_deadline(clock):
+    fetch, api = fetcher(clock, n_tweets=1000)
+    tweets, complete = fetch.search(1000, deadline=fetch.deadline(30), q='vote')
+    assert not complete
+    assert len(tweets) == 400
+    assert clock.slept == 0
+
+
+def test_retries_rate_limited_calls(clock):
+    # The API allows fewer calls than the scheduler, e.g. because the same
+    # account searched elsewhere.
+    fetch, api = fetcher(clock, api_limits=dict(LIMITS, search=(2, 60)))
+    tweets, complete = fetch.search(500, q='vote')
+    assert complete and len(tweets) == 500
+    assert api.rejected['search'] > 0
+
+
+def test_candidate_ids_are_cached(clock):
+    fetch, api = fetcher(clock)
+    ids = fetch.candidate_ids(SCREEN_NAMES)
+    assert None not in ids
+    assert fetch.candidate_ids(SCREEN_NAMES) == ids
+    assert api.calls['get_user'] == len(SCREEN_NAMES)
+    assert not any(api.rejected.values())
+
+
+def test_candidate_ids_deadline(clock):
+    fetch, api = fetcher(clock)
+    ids = fetch.candidate_ids(SCREEN_NAMES, deadline=fetch.deadline(30))
+    assert ids[:2] == [FakeAPI(latency=0).get_user(name).id for name in SCREEN_NAMES[:2]]
+    assert ids[2] is None
+
+
+def test_friendships_share_the_limit(clock):
+    fetch, api = fetcher(clock)
+    fetch.friend_lookup.max_workers = 1
+    ids = fetch.candidate_ids(SCREEN_NAMES[:1])
+    friends = fetch.friendships(range(12), ids)
+    assert None not in sum(friends.values(), [])
+    assert not any(api.rejected.values())
+    assert fetch.scheduler.remaining()['show_friendship'] == 3
@@ -0,0 +1,102 @@
+'''
+FriendshipLookup against fake_api.FakeAPI: the rate limiter, retries after
+the API reports its limit reached, and rows of None for failed lookups.
+'''
+from fake_api import FakeAPI
+from friends import FriendshipLookup, RateLimiter
+
+USERS = list(range(20))
+CANDIDATES = [101, 102, 103]
+
+
+def follows(api, user_id, candidate_id):
+    return api.draw('follows', user_id, candidate_id) < api.follow_rate
+
+
+def expected(api, users=USERS):
+    return {u: [follows(api, u, c) for c in CANDIDATES] for u in users}
+
+
+def lookup(api, clock, calls=5, period=60, **kwargs):
+    limiter = RateLimiter(calls, period, clock, clock.sleep)
+    return FriendshipLookup(api, max_workers=1, limiter=limiter, clock=clock, **kwargs)
+
+
+def test_limiter_allows_calls_per_period(clock):
+    limiter = RateLimiter(3, 10, clock, clock.sleep)
+    times = []
+    for _ in range(9):
+        assert limiter.acquire()
+        times.append(clock())
+    assert times == [0, 0, 0, 10, 10, 10, 20, 20, 20]
+    assert limiter.remaining() == 0
+
+
+def test_limiter_deadline(clock):
+    limiter = RateLimiter(2, 10, clock, clock.sleep)
+    assert limiter.acquire(deadline=1) and limiter.acquire(deadline=1)
+    assert not limiter.acquire(deadline=5)
+    assert clock.slept == 0
+    assert limiter.acquire(deadline=10)
+    assert clock() == 10
+
+
+def test_limiter_exhausted(clock):
+    limiter = RateLimiter(4, 10, clock, clock.sleep)
+    limiter.acquire()
+    limiter.exhausted()
+    assert limiter.remaining() == 0
+    assert not limiter.acquire(deadline=9)
+
+
+def test_within_limit(clock):
+    api = FakeAPI(latency=0, limits={'show_friendship': (5, 60)}, clock=clock)
+    assert lookup(api, clock).lookup_many(USERS, CANDIDATES) == expected(api)
+    assert api.calls['show_friendship'] == len(USERS) * len(CANDIDATES)
+    assert api.rejected['show_friendship'] == 0
+
+
+def test_retries_rate_limited_calls(clock):
+    # The limiter allows more calls than the API, whose rejections are
+    # retried in the next window.
+    api = FakeAPI(latency=0, limits={'show_friendship': (5, 60)}, clock=clock)
+    assert lookup(api, clock, calls=8).lookup_many(USERS, CANDIDATES) == expected(api)
+    assert api.rejected['show_friendship'] > 0
+
+
+def test_failures_give_none_rows(clock):
+    api = FakeAPI(latency=0, fail_rate=0.2, clock=clock)
+    friends = lookup(api, clock, calls=1000).lookup_many(USERS, CANDIDATES)
+    failed = {u for u in USERS
+              if any(api.draw('fail', u, c) < api.fail_rate for c in CANDIDATES)}
+    assert failed and failed != set(USERS)
+    for user_id, row in friends.items():
+        if user_id in failed:
+            assert row == [None] * len(CANDIDATES)
+        else:
+            assert row == expected(api, [user_id])[user_id]
+
+
+def test_unknown_candidate_gives_none_rows(clock):
+    api = FakeAPI(latency=0, clock=clock)
+    friends = lookup(api, clock).lookup_many(USERS[:2], [101, None])
+    assert friends == {u: [None, None] for u in USERS[:2]}
+
+
+def test_deadline_leaves_lookups_unknown(clock):
+    api = FakeAPI(latency=0, clock=clock)
+    friends = lookup(api, clock).lookup_many(USERS, CANDIDATES, deadline=30)
+    assert clock.slept == 0
+    assert api.calls['show_friendship'] == 5
+    # Five calls answer the first user and two candidates of the second
+    assert friends[0] == expected(api, [0])[0]
+    assert all(friends[u] == [None] * len(CANDIDATES) for u in USERS[1:])
+
+
+def test_known_relationships_are_cached(clock):
+    api = FakeAPI(latency=0, clock=clock)
+    friends = lookup(api, clock, calls=1000)
+    first = friends.lookup_many(USERS + USERS, CANDIDATES)
+    assert friends.api_calls == len(USERS) * len(CANDIDATES)
+    assert friends.lookup_many(USERS, CANDIDATES) == first
+    assert friends.api_calls == len(USERS) * len(CANDIDATES)
@@ -0,0 +1,64 @@
+'''
+GeocodeIndex lookups and nearest cities, read from the csv or from the
+saved index.
+'''
+import os
+import pandas as pd
+import pytest
+from geocode import GeocodeIndex
+
+CITIES = pd.DataFrame({
+    'city': ['New York', 'Los Angeles', 'Chicago', 'Springfield', 'Springfield'],
+    'state_id': ['NY', 'CA', 'IL', 'IL', 'MA'],
+    'lat': [40.6943, 34.1139, 41.8373, 39.7710, 42.1155],
+    'lng': [-73.9249, -118.4068, -87.6862, -89.6537, -72.5395],
+    'population': [18713220, 12750807, 8604203, 154761, 153606]})
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = str(tmp_path / 'uscities.csv')
+    CITIES.to_csv(path, index=False)
+    return path
+
+
+def test_lookup(csv_path):
+    index = GeocodeIndex(csv_path)
+    assert not index.loaded
+    assert index.lookup('Chicago', 'IL') == (41.8373, -87.6862)
+    assert index.lookup('  new   york ', 'ny') == (40.6943, -73.9249)
+    assert index.lookup('Springfield', 'MA') == (42.1155, -72.5395)
+    assert index.lookup('Springfield', 'CA') is None
+    assert index.lookup('Boston', 'MA') is None
+
+
+def test_first_row_wins(tmp_path):
+    path = str(tmp_path / 'uscities.csv')
+    pd.concat([CITIES, CITIES.iloc[[2]].assign(lat=0.0)]).to_csv(path, index=False)
+    assert GeocodeIndex(path).lookup('Chicago', 'IL') == (41.8373, -87.6862)
+
+
+def test_nearest(csv_path):
+    index = GeocodeIndex(csv_path)
+    city, state, distance = index.nearest(40.7128, -74.0060)
+    assert (city, state) == ('New York', 'NY')
+    assert distance == pytest.approx(4.5, abs=0.5)
+    assert index.nearest(39.8, -89.6)[:2] == ('Springfield', 'IL')
+    assert index.nearest(34.1139, -118.4068)[2] == 0
+    assert GeocodeIndex(csv_path).nearest(41.8373, -87.6862)[2] == 0
+
+
+def test_saved_index(csv_path, tmp_path):
+    cache_path = str(tmp_path / 'uscities.npz')
+    parsed = GeocodeIndex(csv_path, cache_path)
+    parsed.load()
+    assert os.path.exists(cache_path)
+    # The saved index is read instead of the csv while it is newer
+    CITIES.iloc[:0].to_csv(csv_path, index=False)
+    os.utime(csv_path, (0, 0))
+    saved = GeocodeIndex(csv_path, cache_path)
+    assert saved.lookup('Chicago', 'IL') == parsed.lookup('Chicago', 'IL')
+    assert saved.nearest(42, -72.5) == parsed.nearest(42, -72.5)
+    # A newer csv is parsed again
+    os.utime(csv_path, (os.path.getmtime(cache_path) + 10,) * 2)
+    assert GeocodeIndex(csv_path, cache_path).lookup('Chicago', 'IL') is None
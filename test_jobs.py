@@ -0,0 +1,91 @@
+'''
+JobQueue: the limit on waiting jobs, the states a job goes through and the
+short error a failed job reports.
+'''
+import threading
+import pytest
+from jobs import JobQueue, QueueFull, short_error
+
+TIMEOUT = 10
+
+
+def blocked(release):
+    def func(job):
+        release.wait(TIMEOUT)
+        return 'result'
+    return func
+
+
+def test_pending_limit():
+    release = threading.Event()
+    queue = JobQueue(max_running=1, max_pending=2)
+    running = queue.submit(blocked(release))
+    # The running job no longer counts as waiting
+    with running.changed:
+        assert running.changed.wait_for(lambda: running.state == 'running', TIMEOUT)
+    waiting = [queue.submit(blocked(release)) for _ in range(2)]
+    with pytest.raises(QueueFull):
+        queue.submit(blocked(release))
+    release.set()
+    for job in [running] + waiting:
+        assert job.wait(0, TIMEOUT)
+        assert job.status()['state'] == 'done'
+    # Finished jobs leave room for more
+    assert queue.submit(blocked(release)).wait(0, TIMEOUT)
+
+
+def test_states_and_sections():
+    release = threading.Event()
+    states = []
+
+    def func(job):
+        states.append(job.state)
+        job.add_section('first', ['line 1'])
+        release.wait(TIMEOUT)
+        job.add_section('second', ['line 2', 'line 3'])
+        return 'result id'
+
+    queue = JobQueue(max_running=1)
+    job = queue.submit(func)
+    assert queue.get(job.id) is job
+    assert job.wait(0, TIMEOUT)
+    status = job.status()
+    assert status['state'] == 'running'
+    assert list(status['sections']) == ['first']
+    release.set()
+    with job.changed:
+        assert job.changed.wait_for(lambda: job.finished, TIMEOUT)
+    assert states == ['running']
+    assert job.status() == {'job_id': job.id, 'state': 'done',
+                            'sections': {'first': ['line 1'],
+                                         'second': ['line 2', 'line 3']},
+                            'result_id': 'result id', 'error': None}
+    assert queue.get('unknown') is None
+
+
+def test_failed_job_reports_short_error(caplog):
+    def func(job):
+        raise ValueError("bad spec\nwith details that stay in the log")
+
+    job = JobQueue().submit(func)
+    with job.changed:
+        assert job.changed.wait_for(lambda: job.finished, TIMEOUT)
+    assert job.status()['state'] == 'failed'
+    assert job.status()['error'] == "ValueError: bad spec"
+    assert "with details that stay in the log" in caplog.text
+
+
+def test_short_error():
+    assert short_error(KeyError('x')) == "KeyError: 'x'"
+    assert short_error(RuntimeError()) == "RuntimeError: "
+
+
+def test_finished_jobs_are_forgotten():
+    queue = JobQueue(max_running=1, max_finished=2)
+    jobs = []
+    for _ in range(4):
+        jobs.append(queue.submit(lambda job: None))
+        with jobs[-1].changed:
+            jobs[-1].changed.wait_for(lambda: jobs[-1].finished, TIMEOUT)
+    queue.submit(lambda job: None)
+    assert [queue.get(job.id) for job in jobs] == [None, None, jobs[2], jobs[3]]
@@ -0,0 +1,81 @@
+'''
+ResultStore: least recently used eviction within the memory budget, results
+spilled to and read back from a shared directory, and its disk budget.
+'''
+import os
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+from analyze import TweetData
+from results import ResultStore, result_size
+from summaries import summary_sections
+from synthetic import CANDIDATES, synthetic_frame
+
+PARAMS = {"search_word": "vote", "candidates": CANDIDATES, "geocode": None,
+          "result_type": "recent"}
+
+
+def result(n_rows):
+    return SimpleNamespace(data=pd.DataFrame({'Score': np.zeros(n_rows)}))
+
+
+def test_result_size():
+    assert result_size(result(100)) == result(100).data.memory_usage(deep=True).sum()
+    assert result_size(SimpleNamespace(data=None)) == 0
+
+
+def test_least_recently_used_are_evicted():
+    size = result_size(result(100))
+    store = ResultStore(max_bytes=3 * size)
+    ids = [store.put(result(100)) for _ in range(3)]
+    assert store.get(ids[0]) is not None
+    ids.append(store.put(result(100)))
+    assert [store.get(result_id) is not None for result_id in ids] == [True, False, True, True]
+    assert store.total_bytes == 3 * size
+
+
+def test_newest_is_kept_over_budget():
+    store = ResultStore(max_bytes=10)
+    first = store.put(result(100))
+    second = store.put(result(100))
+    assert store.get(first) is None
+    assert store.get(second) is not None
+
+
+def test_spilled_results_round_trip(tmp_path):
+    tweets = TweetData(synthetic_frame(300), dict(PARAMS))
+    sections = {name: str(section) for name, section in summary_sections(tweets)}
+    writer = ResultStore(directory=str(tmp_path))
+    result_id = writer.put(tweets)
+    # Another worker process, with nothing in memory
+    reader = ResultStore(directory=str(tmp_path))
+    read = reader.get(result_id)
+    assert read is not tweets
+    assert read.data.equals(tweets.data)
+    assert {name: str(section) for name, section in summary_sections(read)} == sections
+    assert reader.get(result_id) is read
+    assert not [name for name in os.listdir(str(tmp_path)) if name.endswith('.tmp')]
+
+
+def test_unknown_ids(tmp_path):
+    store = ResultStore(directory=str(tmp_path))
+    assert store.get('0123abcd') is None
+    assert store.get('../' + store.put(result(10))) is None
+    assert ResultStore().get('0123abcd') is None
+
+
+def test_prune_disk(tmp_path):
+    directory = str(tmp_path)
+    writer = ResultStore(directory=directory)
+    ids = [writer.put(result(1000)) for _ in range(4)]
+    for age, result_id in enumerate(reversed(ids)):
+        path = writer.path(result_id)
+        os.utime(path, (1000 - age, 1000 - age))
+    size = os.path.getsize(writer.path(ids[0]))
+    writer.max_disk_bytes = 2 * size
+    writer.prune_disk()
+    assert sorted(os.listdir(directory)) == sorted(result_id + '.pickle'
+                                                   for result_id in ids[2:])
+    reader = ResultStore(directory=directory)
+    assert reader.get(ids[0]) is None
+    assert reader.get(ids[3]).data.equals(result(1000).data)
@@ -0,0 +1,86 @@
+'''
+GroupedStats, describe_counts and RunningStats against pandas describe()
+and mean() on the same scores. The means are exact sums correctly rounded,
+so they can differ from pandas' float sums in the last bits.
+'''
+from fractions import Fraction
+import numpy as np
+import pandas as pd
+import pytest
+from candidate_index import pack
+from stats import GroupedStats, RunningStats, describe_counts, exact_sums
+
+TOLERANCE = 1e-12
+
+
+@pytest.fixture(scope='module')
+def tweets():
+    rng = np.random.RandomState(6)
+    scores = np.sort(np.round(rng.uniform(-1, 1, 5000), 4))
+    # Many ties, like VADER scores
+    scores[::7] = 0.0
+    scores = np.sort(scores)
+    texts = np.array(['tweet {}'.format(i) for i in range(len(scores))], dtype=object)
+    groups = {'all': np.ones(len(scores), dtype=bool),
+              'half': rng.uniform(size=len(scores)) < 0.5,
+              'few': rng.uniform(size=len(scores)) < 0.002}
+    return scores, texts, groups
+
+
+def assert_describe(summary, scores):
+    expected = pd.Series(scores).describe()
+    assert list(summary.index) == list(expected.index)
+    assert np.allclose(summary.values, expected.values, rtol=TOLERANCE, atol=TOLERANCE)
+
+
+def test_grouped_stats_match_pandas(tweets):
+    scores, texts, groups = tweets
+    grouped = GroupedStats(scores, texts, {key: pack(mask) for key, mask in groups.items()})
+    for key, mask in groups.items():
+        summary, mean, pos, neg, med = grouped.stats(key)
+        assert_describe(summary, scores[mask])
+        assert mean == pytest.approx(pd.Series(scores[mask]).mean(), rel=TOLERANCE)
+        assert grouped.sizes[key] == mask.sum()
+        assert pos == texts[mask][-3:].tolist()
+        assert neg == texts[mask][:3].tolist()
+        median = scores[mask] == summary['50%']
+        assert med == texts[mask][median][:3].tolist()
+
+
+def test_describe_counts_match_pandas(tweets):
+    scores = tweets[0]
+    values, counts = np.unique(scores, return_counts=True)
+    assert_describe(describe_counts(values, counts, scores.mean()), scores)
+    # Values no tweet has are left out
+    padded = describe_counts(np.r_[-2.0, values, 2.0], np.r_[0, counts, 0], scores.mean())
+    assert padded.equals(describe_counts(values, counts, scores.mean()))
+
+
+def test_exact_sums(tweets):
+    scores, _, groups = tweets
+    values, inverse = np.unique(scores, return_inverse=True)
+    counts = np.stack([np.bincount(inverse[mask], minlength=len(values))
+                       for mask in groups.values()], axis=1)
+    sums = exact_sums(values, counts)
+    for total, mask in zip(sums, groups.values()):
+        assert total == sum(Fraction(float(s)) for s in scores[mask])
+
+
+def test_running_stats_match_grouped(tweets):
+    # A file in no order, read in chunks; sorted stably by score its tied
+    # tweets keep their file order, as in TweetData
+    scores, texts, _ = tweets
+    shuffled = np.random.RandomState(7).permutation(len(scores))
+    scores, texts = scores[shuffled], texts[shuffled]
+    rows = np.argsort(scores, kind='mergesort')
+    grouped = GroupedStats(scores[rows], texts[rows],
+                           {'all': pack(np.ones(len(scores), dtype=bool))})
+    running = RunningStats()
+    for start in range(0, len(scores), 800):
+        chunk = start + np.argsort(scores[start:start + 800], kind='mergesort')
+        running.add(scores[chunk], texts[chunk], chunk)
+    summary, mean, pos, neg, med = running.stats()
+    expected = grouped.stats('all')
+    assert summary.equals(expected[0])
+    assert mean == expected[1]
+    assert (pos, neg, med) == tuple(expected[2:])
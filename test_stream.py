@@ -0,0 +1,106 @@
+'''
+stream_tweets builds the same TweetData, summaries and charts as reading the
+whole csv file at once, and summarize_csv the same summaries in memory that
+does not grow with the file.
+'''
+import tracemalloc
+import pandas as pd
+import pytest
+import charts
+from analyze import TweetData
+from synthetic import CANDIDATES, synthetic_frame
+from stream import stream_tweets, summarize_csv
+from summaries import summary_sections
+
+PARAMS = {"search_word": "vote", "candidates": CANDIDATES, "geocode": None,
+          "result_type": "recent"}
+
+
+@pytest.fixture(scope='module')
+def csv_path(tmp_path_factory):
+    df = synthetic_frame(3000, seed=1)
+    df['Time Searched'] = pd.date_range('2020-03-03', periods=len(df), freq='37s')
+    path = tmp_path_factory.mktemp('tweets') / 'tweets.csv'
+    df.to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture(scope='module')
+def built(csv_path):
+    whole = TweetData(pd.read_csv(csv_path), dict(PARAMS))
+    streamed = stream_tweets(csv_path, dict(PARAMS), chunk_size=700)
+    return whole, streamed
+
+
+def test_same_data(built):
+    whole, streamed = built
+    assert streamed.data.equals(whole.data)
+    assert streamed.fingerprint() == whole.fingerprint()
+    assert streamed.terms.counts == whole.terms.counts
+    assert streamed.memory_report()['Total'] > 0
+
+
+def test_same_summaries(built):
+    whole, streamed = built
+    assert dict(summary_sections(streamed)) == dict(summary_sections(whole))
+
+
+def test_same_trends(built):
+    whole, streamed = built
+    assert streamed.trends().to_json('hour') == whole.trends().to_json('hour')
+
+
+@pytest.mark.parametrize('name', ['visual', 'trend'])
+def test_same_charts(built, name):
+    whole, streamed = built
+    assert charts.RENDERERS[name](streamed) == charts.RENDERERS[name](whole)
+
+
+def test_wordcloud_renders(built):
+    # The layout of the cloud is random, its words are compared above.
+    assert charts.render_wordcloud(built[1]).startswith(b'\x89PNG')
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / 'empty.csv'
+    path.write_text('TweetText\n')
+    assert stream_tweets(path, dict(PARAMS)) is None
+
+
+def test_summarize_csv(csv_path, built):
+    summary = summarize_csv(csv_path, dict(PARAMS), chunk_size=700)
+    assert dict(summary_sections(summary)) == dict(summary_sections(built[0]))
+    assert summary.terms.counts == built[0].terms.counts
+
+
+def peak_memory(func, *args, **kwargs):
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_summarize_csv_memory_is_flat(tmp_path):
+    # The same tweets repeated have the same distinct scores, so once there
+    # are k tweets at every score the aggregates stop growing.
+    df = synthetic_frame(500, seed=2)
+    paths = []
+    for copies in (4, 16):
+        paths.append(tmp_path / 'tweets{}.csv'.format(copies))
+        pd.concat([df] * copies).to_csv(paths[-1], index=False)
+    summarize_csv(paths[1], dict(PARAMS), chunk_size=500)
+    small, large = [peak_memory(summarize_csv, path, dict(PARAMS), chunk_size=500)
+                    for path in paths]
+    assert large < 1.5 * small
+    # Whereas a TweetData keeps every tweet
+    small, large = [peak_memory(stream_tweets, path, dict(PARAMS), chunk_size=500)
+                    for path in paths]
+    assert large > 1.5 * small
+
+
+def test_summarize_empty_file(tmp_path):
+    path = tmp_path / 'empty.csv'
+    path.write_text('TweetText\n')
+    assert summarize_csv(path, dict(PARAMS)) is None
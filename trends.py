@@ -0,0 +1,154 @@
+'''
+Sentiment over time: tweet counts, mean score and Score_bins distribution
+per minute, hour and day, for all tweets and for the tweets mentioning each
+candidate. Each window is aggregated once with bincount over the rows, and
+tweets added later are aggregated on their own and merged in, so reading a
+trend never goes back over the tweets.
+'''
+import numpy as np
+import pandas as pd
+
+TIME_COLUMN = "Time Searched"
+# Length of each window in nanoseconds, finest first
+FREQUENCIES = {'minute': 60 * 10 ** 9, 'hour': 3600 * 10 ** 9, 'day': 86400 * 10 ** 9}
+ALL = 'all'
+# VADER compound scores have 4 decimal places, so sums of scores scaled by
+# this are exact in int64.
+SCORE_SCALE = 10 ** 4
+
+
+def timestamps(times):
+    '''
+    Inputs:
+        times: (pandas.Series) tweet creation times
+    Outputs:
+        (numpy.ndarray of int64) nanoseconds since the epoch, in UTC, with -1
+        for times that are missing or cannot be parsed
+    '''
+    times = pd.to_datetime(times, errors='coerce', utc=True)
+    values = np.asarray(times.dt.tz_localize(None).values.astype('datetime64[ns]')
+                        .astype(np.int64))
+    return np.where(times.isna().values, -1, values)
+
+
+class SentimentTrends():
+    '''
+    Per window aggregates of the tweets of a TweetData. For each frequency,
+    buckets holds the sorted start of every window with tweets (nanoseconds
+    since the epoch) and values the counts at the same position, with shape
+    (windows, groups, 2 + number of labels): tweets, sum of scaled scores,
+    then tweets in each Score_bins label.
+    '''
+
+    def __init__(self, groups, labels):
+        '''
+        Inputs:
+            groups: (list of str) ALL followed by candidate handles
+            labels: (list of str) categories of Score_bins
+        '''
+        self.groups = list(groups)
+        self.labels = list(labels)
+        width = 2 + len(self.labels)
+        self.buckets = {freq: np.zeros(0, dtype=np.int64) for freq in FREQUENCIES}
+        self.values = {freq: np.zeros((0, len(self.groups), width), dtype=np.int64)
+                       for freq in FREQUENCIES}
+
+    def add(self, times, scores, bins, masks):
+        '''
+        Aggregates a batch of tweets and merges it in.
+
+        Inputs:
+            times: (numpy.ndarray of int64) from timestamps()
+            scores: (numpy.ndarray of float) score of each tweet
+            bins: (numpy.ndarray of int) Score_bins code of each tweet
+            masks: (dict) of group (other than ALL) to numpy.ndarray of bool,
+                   the tweets in that group
+        '''
+        known = times >= 0
+        times, scores, bins = times[known], scores[known], bins[known]
+        masks = [np.ones(len(times), dtype=bool)] + \
+            [masks[group][known] for group in self.groups[1:]]
+        scaled = np.round(scores * SCORE_SCALE).astype(np.int64)
+        n_labels = len(self.labels)
+        for freq, step in FREQUENCIES.items():
+            buckets, inverse = np.unique(times // step * step, return_inverse=True)
+            inverse = inverse.ravel()
+            values = np.zeros((len(buckets), len(self.groups), 2 + n_labels),
+                              dtype=np.int64)
+            for g, mask in enumerate(masks):
+                rows = inverse[mask]
+                values[:, g, 0] = np.bincount(rows, minlength=len(buckets))
+                values[:, g, 1] = np.bincount(rows, weights=scaled[mask],
+                                              minlength=len(buckets))
+                values[:, g, 2:] = np.bincount(
+                    rows * n_labels + bins[mask],
+                    minlength=len(buckets) * n_labels).reshape(-1, n_labels)
+            self.merge(freq, buckets, values)
+
+    def merge(self, freq, buckets, values):
+        merged = np.union1d(self.buckets[freq], buckets)
+        merged_values = np.zeros((len(merged),) + values.shape[1:], dtype=np.int64)
+        merged_values[np.searchsorted(merged, self.buckets[freq])] += self.values[freq]
+        merged_values[np.searchsorted(merged, buckets)] += values
+        self.buckets[freq], self.values[freq] = merged, merged_values
+
+    def series(self, freq='hour', group=ALL, window=1):
+        '''
+        Trend of one group, over every window from the first tweet to the
+        last (windows without tweets included).
+
+        Inputs:
+            freq: (str) key of FREQUENCIES
+            group: (str) ALL or a candidate handle
+            window: (int) windows to take rolling sums over
+        Outputs:
+            (pandas.DataFrame) indexed by window start, with the number of
+            tweets, their mean score (NaN without tweets) and the number in
+            each Score_bins label
+        '''
+        step = FREQUENCIES[freq]
+        buckets = self.buckets[freq]
+        columns = ['count', 'score_sum'] + self.labels
+        if len(buckets) == 0:
+            frame = pd.DataFrame(columns=columns, dtype=np.int64)
+        else:
+            # Every window from the first to the last, so rolling sums span
+            # time rather than rows.
+            full = np.arange(buckets[0], buckets[-1] + step, step)
+            values = np.zeros((len(full), len(columns)), dtype=np.int64)
+            values[(buckets - buckets[0]) // step] = \
+                self.values[freq][:, self.groups.index(group)]
+            frame = pd.DataFrame(values, columns=columns,
+                                 index=pd.to_datetime(full, unit='ns', utc=True))
+        if window > 1:
+            frame = frame.rolling(window, min_periods=1).sum().astype(np.int64)
+        counts = frame['count'].where(frame['count'] > 0)
+        frame.insert(1, 'mean_score', frame['score_sum'] / SCORE_SCALE / counts)
+        return frame.drop(columns='score_sum')
+
+    def choose_freq(self, max_windows=240):
+        '''
+        Outputs:
+            (str) finest frequency spanning the tweets in at most max_windows
+            windows, or the coarsest one
+        '''
+        for freq, step in FREQUENCIES.items():
+            buckets = self.buckets[freq]
+            if len(buckets) == 0 or (buckets[-1] - buckets[0]) // step < max_windows:
+                return freq
+        return freq
+
+    def to_json(self, freq='hour', window=1):
+        '''
+        Outputs:
+            (dict) of the trend of every group, ready for flask.jsonify
+        '''
+        groups = {}
+        for group in self.groups:
+            frame = self.series(freq, group, window)
+            groups[group] = [
+                {'time': time.isoformat(), 'count': int(row['count']),
+                 'mean_score': None if pd.isna(row['mean_score']) else float(row['mean_score']),
+                 'bins': {label: int(row[label]) for label in self.labels}}
+                for time, row in frame.iterrows()]
+        return {'freq': freq, 'window': window, 'labels': self.labels, 'groups': groups}